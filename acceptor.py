@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+监听socket的accept循环
+所有端口的监听socket注册到同一个selector（Linux上为epoll），由一个线程等待并批量accept，
+空闲端口不轮询、不占用线程，停止监听立即生效。
+threaded引擎直接使用Acceptor，reactor引擎在此基础上再驱动会话转发
+"""
+
+import errno
+import functools
+import logging
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Acceptor:
+    """单线程accept循环，服务所有SSHProxyServer的监听socket"""
+
+    # 每次监听socket就绪时最多连续accept的连接数，避免单个端口饿死其他事件
+    ACCEPT_BATCH = 64
+    # accept失败（文件描述符耗尽等）后暂停监听该端口的秒数；监听socket仍可读，
+    # 不暂停的话selector会立即再次返回它，accept循环空转占满CPU
+    ACCEPT_BACKOFF = 0.5
+    # 只影响当前这个连接的错误，继续accept下一个
+    TRANSIENT_ERRORS = frozenset((errno.ECONNABORTED, errno.EPROTO))
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.listeners = {}
+        # 暂停accept的监听 server -> 恢复时间(time.monotonic())
+        self._paused = {}
+        self.running = False
+        self._callbacks = deque()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, self._run_callbacks)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def call_soon_threadsafe(self, callback, *args):
+        """从其他线程安排回调在事件循环线程中执行"""
+        self._callbacks.append((callback, args))
+        try:
+            self._wakeup_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            # 唤醒管道已满说明事件循环已被唤醒
+            pass
+
+    def add_listener(self, server):
+        """注册SSHProxyServer的监听socket（server.bind()之后调用）"""
+        self.call_soon_threadsafe(self._register_listener, server)
+
+    def remove_listener(self, server, timeout: float = 1.0):
+        """注销并关闭SSHProxyServer的监听socket；从其他线程调用时等待关闭完成，之后可立即重新绑定该端口"""
+        closed = threading.Event()
+        self.call_soon_threadsafe(self._unregister_listener, server, closed)
+        if self.running and threading.current_thread() is not self._thread:
+            closed.wait(timeout)
+
+    def run(self):
+        """运行事件循环直到stop()"""
+        self.running = True
+        self._thread = threading.current_thread()
+        try:
+            while self.running:
+                for key, mask in self.selector.select(self._select_timeout(None)):
+                    key.data(mask)
+                self._resume_listeners()
+        except Exception:
+            logger.exception("accept事件循环异常退出")
+        finally:
+            self._shutdown()
+
+    def stop(self, timeout: float = 5.0):
+        """停止事件循环并关闭所有监听socket"""
+        if not self.running:
+            return
+        self.call_soon_threadsafe(self._stop)
+        self._stopped.wait(timeout)
+
+    def _stop(self):
+        self.running = False
+
+    def _run_callbacks(self, mask):
+        try:
+            while self._wakeup_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+        while self._callbacks:
+            callback, args = self._callbacks.popleft()
+            try:
+                callback(*args)
+            except Exception:
+                logger.exception("事件循环回调执行失败")
+
+    def _register_listener(self, server):
+        server.sock.setblocking(False)
+        self._watch(server)
+        self.listeners[server.port] = server
+
+    def _watch(self, server):
+        self.selector.register(server.sock, selectors.EVENT_READ,
+                               functools.partial(self._accept, server))
+
+    def _unregister_listener(self, server, closed: Optional[threading.Event] = None):
+        if self.listeners.get(server.port) is server:
+            del self.listeners[server.port]
+        self._paused.pop(server, None)
+        if server.sock:
+            try:
+                self.selector.unregister(server.sock)
+            except (KeyError, ValueError):
+                pass
+            try:
+                server.sock.close()
+            except OSError:
+                pass
+        if closed is not None:
+            closed.set()
+
+    def _accept(self, server, mask):
+        """批量取出监听队列中的连接"""
+        for _ in range(self.ACCEPT_BATCH):
+            try:
+                client, addr = server.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                if e.errno in self.TRANSIENT_ERRORS:
+                    continue
+                if server.running:
+                    # 每个端口每次暂停只记录一次，文件描述符耗尽时不会刷屏
+                    logger.error("接受连接时出错: %s，端口 %s 暂停accept %.1f秒",
+                                 e, server.port, self.ACCEPT_BACKOFF)
+                self._pause_listener(server)
+                return
+            server.accept_connection(client, addr)
+
+    def _pause_listener(self, server):
+        """暂时不关注监听socket，连接留在内核监听队列中，ACCEPT_BACKOFF后恢复"""
+        try:
+            self.selector.unregister(server.sock)
+        except (KeyError, ValueError):
+            return
+        self._paused[server] = time.monotonic() + self.ACCEPT_BACKOFF
+
+    def _resume_listeners(self):
+        """恢复暂停期已过的监听socket"""
+        if not self._paused:
+            return
+        now = time.monotonic()
+        for server, resume_at in list(self._paused.items()):
+            if resume_at > now:
+                continue
+            del self._paused[server]
+            if self.listeners.get(server.port) is server and server.sock.fileno() != -1:
+                self._watch(server)
+
+    def _select_timeout(self, timeout: Optional[float]) -> Optional[float]:
+        """有暂停的监听时，selector最多等到最早的恢复时间"""
+        if not self._paused:
+            return timeout
+        wait = max(0.0, min(self._paused.values()) - time.monotonic())
+        return wait if timeout is None else min(timeout, wait)
+
+    def _shutdown(self):
+        self.running = False
+        for server in list(self.listeners.values()):
+            self._unregister_listener(server)
+        self.selector.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+        self._stopped.set()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+SSH握手准入控制
+限制同时进行的未认证握手数（全局和每个来源IP），超过软上限后像OpenSSH的MaxStartups一样
+按概率提前丢弃新连接，其余连接排队等待空位，超过期限仍未轮到则关闭。
+最近认证成功过的来源IP不参与随机丢弃，并可直接使用软上限到硬上限之间的余量，
+握手风暴期间正常用户仍能快速登录
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+REJECT_REASONS = ('per_ip', 'early_drop', 'full', 'timeout')
+
+
+def parse_max_startups(value) -> tuple:
+    """解析 "start:rate:full" 或单个数字（等价于 start:100:start）"""
+    parts = [int(part) for part in str(value).split(':')]
+    if len(parts) == 1:
+        return parts[0], 100, parts[0]
+    if len(parts) != 3 or not 0 < parts[0] <= parts[2] or not 0 <= parts[1] <= 100:
+        raise ValueError(f"max_startups格式应为 start:rate:full，实际为 {value}")
+    return tuple(parts)
+
+
+class AdmissionController:
+    """进程内所有监听端口共用的握手准入控制"""
+
+    # 认证成功的来源IP在该时长内视为可信（秒）
+    TRUST_TTL = 600.0
+    # 最多记住的可信IP数
+    TRUST_MAX = 4096
+
+    def __init__(self, max_startups='10:30:100', per_ip: int = 0, queue_timeout: float = 10.0):
+        self.start, self.rate, self.full = parse_max_startups(max_startups)
+        self.per_ip = per_ip
+        self.queue_timeout = queue_timeout
+        # 正在握手（已分配槽位）的连接数
+        self.pending = 0
+        self.rejected: Dict[str, int] = {reason: 0 for reason in REJECT_REASONS}
+        self._queue = deque()
+        self._per_ip: Dict[str, int] = {}
+        self._trusted: 'OrderedDict[str, float]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> Optional['AdmissionController']:
+        """由配置文件的admission段创建，未配置时返回None（不限制）"""
+        if not config:
+            return None
+        return cls(
+            max_startups=config.get('max_startups', '10:30:100'),
+            per_ip=int(config.get('per_ip', 0)),
+            queue_timeout=float(config.get('queue_timeout', 10)),
+        )
+
+    def configure(self, config: dict):
+        """热重载时更新限制，已排队和进行中的连接不受影响"""
+        with self._lock:
+            self.start, self.rate, self.full = parse_max_startups(config.get('max_startups', '10:30:100'))
+            self.per_ip = int(config.get('per_ip', 0))
+            self.queue_timeout = float(config.get('queue_timeout', 10))
+
+    def admit(self, client, addr, dispatch: Callable):
+        """新连接到达：有空位时立即dispatch(client, addr)，否则排队或关闭。不会阻塞"""
+        ip = addr[0]
+        now = time.monotonic()
+        with self._lock:
+            trusted = self._is_trusted(ip, now)
+            waiting = self.pending + len(self._queue)
+            reason = None
+            if not trusted and self.per_ip and self._per_ip.get(ip, 0) >= self.per_ip:
+                reason = 'per_ip'
+            elif (self.pending if trusted else waiting) >= self.full:
+                reason = 'full'
+            elif waiting >= self.start and not trusted and self._early_drop(waiting):
+                reason = 'early_drop'
+            if reason:
+                self.rejected[reason] += 1
+            else:
+                self._per_ip[ip] = self._per_ip.get(ip, 0) + 1
+                # 可信IP不受start限制，直接占用start到full之间的余量
+                if self.pending < self.start or trusted:
+                    self.pending += 1
+                    entry = None
+                else:
+                    entry = (client, addr, dispatch, now + self.queue_timeout)
+                    self._queue.append(entry)
+        if reason:
+            logger.debug("拒绝来自 %s 的连接 (%s)", ip, reason)
+            _close(client)
+            return
+        if entry is None:
+            dispatch(client, addr)
+
+    def release(self, addr, authenticated: bool = False):
+        """连接的握手阶段结束（成功或失败），把槽位交给队列中的下一个连接"""
+        ip = addr[0]
+        now = time.monotonic()
+        with self._lock:
+            self._dec_ip(ip)
+            if authenticated:
+                self._trust(ip, now)
+            self.pending -= 1
+            expired, ready = self._take_ready(now)
+        for client in expired:
+            _close(client)
+        if ready:
+            client, addr, dispatch, _ = ready
+            dispatch(client, addr)
+
+    def expire(self):
+        """关闭排队超过期限的连接（由主循环定期调用）"""
+        now = time.monotonic()
+        with self._lock:
+            expired = []
+            kept = deque()
+            for entry in self._queue:
+                if entry[3] <= now:
+                    expired.append(entry[0])
+                    self._dec_ip(entry[1][0])
+                else:
+                    kept.append(entry)
+            self._queue = kept
+            self.rejected['timeout'] += len(expired)
+        for client in expired:
+            _close(client)
+
+    def stats(self) -> dict:
+        """准入计数"""
+        return {
+            'pending': self.pending,
+            'queued': len(self._queue),
+            'rejected': dict(self.rejected),
+        }
+
+    def _early_drop(self, waiting: int) -> bool:
+        # 丢弃概率从start处的rate%线性增加到full处的100%
+        if self.full <= self.start:
+            return True
+        percent = self.rate + (100 - self.rate) * (waiting - self.start) / (self.full - self.start)
+        return random.random() * 100 < percent
+
+    def _take_ready(self, now: float):
+        """在锁内取出下一个未过期的排队连接并分配槽位"""
+        expired = []
+        while self._queue:
+            entry = self._queue.popleft()
+            if entry[3] <= now:
+                expired.append(entry[0])
+                self._dec_ip(entry[1][0])
+                self.rejected['timeout'] += 1
+                continue
+            self.pending += 1
+            return expired, entry
+        return expired, None
+
+    def _dec_ip(self, ip: str):
+        count = self._per_ip.get(ip, 0) - 1
+        if count > 0:
+            self._per_ip[ip] = count
+        else:
+            self._per_ip.pop(ip, None)
+
+    def _is_trusted(self, ip: str, now: float) -> bool:
+        expires = self._trusted.get(ip)
+        if expires is None:
+            return False
+        if expires < now:
+            del self._trusted[ip]
+            return False
+        return True
+
+    def _trust(self, ip: str, now: float):
+        self._trusted[ip] = now + self.TRUST_TTL
+        self._trusted.move_to_end(ip)
+        while len(self._trusted) > self.TRUST_MAX:
+            self._trusted.popitem(last=False)
+
+
+def _close(client):
+    try:
+        client.close()
+    except OSError:
+        pass
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+异步日志
+日志调用只把LogRecord放入有界队列，由后台线程格式化并写入stdout和日志文件，
+磁盘变慢或容器stdout阻塞时不会拖慢accept、握手和转发线程。
+队列满时WARNING以下的日志立即丢弃，WARNING及以上最多等待block_timeout秒，丢弃的条数随后补记一条日志。
+format为json时每条日志输出一行JSON，并带上 extra={'event': {...}} 中的会话ID、端口、来源地址和耗时等字段
+"""
+
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, Optional
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一行JSON，便于日志系统按字段检索"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        fields = getattr(record, 'event', None)
+        if fields:
+            event.update(fields)
+        if record.exc_info:
+            event['exc'] = self.formatException(record.exc_info)
+        return json.dumps(event, ensure_ascii=False, default=str)
+
+
+class LogListener(QueueListener):
+    """后台写日志的线程；停止时等待队列中剩余的日志写完，但不会无限期等待"""
+
+    # 队列已满时等待放入停止标记的时长（秒），超过后丢弃最早的日志腾出位置
+    sentinel_timeout = 5.0
+    # 等待后台线程写完剩余日志的时长（秒）
+    join_timeout = 10.0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 停止时为放入停止标记丢弃的日志数
+        self.dropped_on_stop = 0
+
+    def enqueue_sentinel(self):
+        try:
+            self.queue.put(self._sentinel, timeout=self.sentinel_timeout)
+            return
+        except queue.Full:
+            pass
+        # 日志写入一直跟不上（如磁盘或stdout阻塞），丢弃最早的日志直到停止标记放入队列
+        while True:
+            try:
+                self.queue.put_nowait(self._sentinel)
+                return
+            except queue.Full:
+                pass
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.dropped_on_stop += 1
+            except queue.Empty:
+                pass
+
+    def stop(self):
+        """放入停止标记并等待后台线程结束，超过join_timeout仍未结束时放弃等待；
+        丢弃的日志条数随后记录（后台线程仍阻塞在handler中时直接写到stderr）"""
+        thread = self._thread
+        if thread is None:
+            return
+        self.enqueue_sentinel()
+        thread.join(self.join_timeout)
+        self._thread = None
+        if thread.is_alive():
+            # 队列中剩余的日志（不含停止标记）也不会再写出
+            lost = self.dropped_on_stop + max(self.queue.qsize() - 1, 0)
+            print(f"日志线程未能在 {self.join_timeout:.0f} 秒内停止，丢弃了 {lost} 条日志", file=sys.stderr)
+        elif self.dropped_on_stop:
+            self.handle(logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                          "停止日志线程时队列已满，丢弃了 %d 条日志", (self.dropped_on_stop,), None))
+
+
+class DroppingQueueHandler(QueueHandler):
+    """把日志放入有界队列的handler，队列满时按级别丢弃"""
+
+    def __init__(self, queue_size: int = 10000, block_level: int = logging.WARNING,
+                 block_timeout: float = 0.1):
+        super().__init__(queue.Queue(queue_size))
+        self.queue_size = queue_size
+        self.block_level = block_level
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self.listener: Optional[LogListener] = None
+        self._dropped_lock = threading.Lock()
+
+    def start(self, handlers: List[logging.Handler]):
+        """启动后台线程写入handlers"""
+        self.listener = LogListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 不在调用线程中格式化，msg % args 和异常堆栈都由后台线程处理；
+        # 日志参数应为不会再被修改的值（字符串、数字、地址元组等）
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if record.levelno >= self.block_level:
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+            return
+        if self.dropped:
+            self._report_dropped()
+
+    def _report_dropped(self):
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if not dropped:
+            return
+        record = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                   "日志队列已满，丢弃了 %d 条日志", (dropped,), None)
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += dropped
+
+    def reinit_after_fork(self):
+        """fork出的子进程中没有后台线程，队列也可能处于父进程加锁时的状态，换新队列并重新启动"""
+        self.queue = queue.Queue(self.queue_size)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        if self.listener is not None:
+            self.listener = LogListener(self.queue, *self.listener.handlers, respect_handler_level=True)
+            self.listener.start()
+
+    def close(self):
+        """由logging.shutdown()调用，写完队列中的日志后停止后台线程"""
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.stop()
+        super().close()
+
+
+def start_async_logging(handlers: List[logging.Handler], queue_size: int = 10000,
+                        block_timeout: float = 0.1) -> DroppingQueueHandler:
+    """返回替代handlers加到root logger上的队列handler"""
+    handler = DroppingQueueHandler(queue_size, block_timeout=block_timeout)
+    handler.start(handlers)
+    os.register_at_fork(after_in_child=handler.reinit_after_fork)
+    return handler
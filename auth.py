@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+SSH用户认证
+用户、密码、公钥和可访问端口一次性加载为内存索引：公钥按SHA256指纹索引，
+用户按用户名索引，端口权限为frozenset，认证时的查找都是O(1)。
+authorized_keys文件修改后由ProxyManager重新加载并整体替换索引
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+import logging
+import os
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# authorized_keys中可识别的公钥类型
+KEY_TYPES = frozenset((
+    'ssh-ed25519',
+    'ssh-rsa',
+    'ecdsa-sha2-nistp256',
+    'ecdsa-sha2-nistp384',
+    'ecdsa-sha2-nistp521',
+    'ssh-dss',
+))
+
+
+def fingerprint(blob: bytes) -> str:
+    """OpenSSH格式的SHA256公钥指纹"""
+    digest = base64.b64encode(hashlib.sha256(blob).digest()).decode().rstrip('=')
+    return f"SHA256:{digest}"
+
+
+def parse_authorized_key(line: str) -> Optional[bytes]:
+    """解析一行authorized_keys（允许前置选项），返回公钥数据，无效时返回None"""
+    fields = line.strip().split()
+    for i, field in enumerate(fields[:-1]):
+        if field in KEY_TYPES:
+            try:
+                return base64.b64decode(fields[i + 1], validate=True)
+            except (binascii.Error, ValueError):
+                return None
+    return None
+
+
+class User:
+    """一个SSH用户"""
+
+    __slots__ = ('name', 'password', 'ports', 'devices')
+
+    def __init__(self, name: str, password: Optional[str] = None,
+                 ports: Optional[FrozenSet[int]] = None,
+                 devices: Optional[FrozenSet[str]] = None):
+        self.name = name
+        self.password = str(password) if password is not None else None
+        # 允许访问的SSH端口，None表示全部
+        self.ports = ports
+        # 经路由端口允许访问的设备名或分组（小写），None表示全部
+        self.devices = devices
+
+    def allows(self, port: int) -> bool:
+        return self.ports is None or port in self.ports
+
+    def allows_device(self, device) -> bool:
+        """是否可经路由端口访问该设备（router.Device）"""
+        if self.devices is None or device.key in self.devices:
+            return True
+        return any(group.casefold() in self.devices for group in device.groups)
+
+
+class AuthStore:
+    """用户与公钥索引，创建后只读，重载时整体替换"""
+
+    def __init__(self):
+        self.users: Dict[str, User] = {}
+        # 公钥指纹 -> 可使用该公钥登录的用户名
+        self.keys: Dict[str, FrozenSet[str]] = {}
+        # 已加载的authorized_keys文件及其修改时间，用于检测变化
+        self.files: Dict[str, Optional[int]] = {}
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'AuthStore':
+        """由配置创建：ssh.username/password为全端口用户，auth.users为附加用户"""
+        store = cls()
+        ssh_config = config.get('ssh') or {}
+        if ssh_config.get('username'):
+            store.add_user(User(ssh_config['username'], ssh_config.get('password')))
+        auth_config = config.get('auth') or {}
+        keys: Dict[str, set] = {}
+        for name, spec in (auth_config.get('users') or {}).items():
+            spec = spec or {}
+            ports = spec.get('ports')
+            devices = spec.get('devices')
+            store.add_user(User(
+                str(name),
+                spec.get('password'),
+                frozenset(int(port) for port in ports) if ports is not None else None,
+                frozenset(str(device).casefold() for device in devices) if devices is not None else None
+            ))
+            lines = list(spec.get('keys') or [])
+            keys_file = spec.get('authorized_keys')
+            if keys_file:
+                lines.extend(store._read_keys_file(keys_file))
+            for line in lines:
+                if not line.strip() or line.lstrip().startswith('#'):
+                    continue
+                blob = parse_authorized_key(line)
+                if blob is None:
+                    logger.warning(f"用户 {name} 的公钥格式无效，已忽略: {line[:40]}")
+                    continue
+                keys.setdefault(fingerprint(blob), set()).add(str(name))
+        store.keys = {fp: frozenset(names) for fp, names in keys.items()}
+        return store
+
+    @classmethod
+    def single(cls, username: str, password: str) -> 'AuthStore':
+        """只有一个全端口密码用户的认证库"""
+        store = cls()
+        store.add_user(User(username, password))
+        return store
+
+    def add_user(self, user: User):
+        self.users[user.name] = user
+
+    def _read_keys_file(self, path: str) -> List[str]:
+        try:
+            self.files[path] = os.stat(path).st_mtime_ns
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.readlines()
+        except OSError as e:
+            self.files[path] = None
+            logger.warning(f"读取authorized_keys失败 {path}: {e}")
+            return []
+
+    def files_changed(self) -> bool:
+        """已加载的authorized_keys文件是否被修改、创建或删除"""
+        for path, mtime in self.files.items():
+            try:
+                current = os.stat(path).st_mtime_ns
+            except OSError:
+                current = None
+            if current != mtime:
+                return True
+        return False
+
+    def check_password(self, username: str, password: str, port: int) -> Optional[User]:
+        """密码认证，成功返回用户"""
+        user = self.users.get(username)
+        if user is None or user.password is None:
+            return None
+        if not hmac.compare_digest(user.password.encode(), password.encode()):
+            return None
+        return user if user.allows(port) else None
+
+    def check_key(self, username: str, blob: bytes, port: int) -> Optional[User]:
+        """公钥认证（签名由paramiko校验），公钥属于该用户时返回用户"""
+        names = self.keys.get(fingerprint(blob))
+        if not names or username not in names:
+            return None
+        user = self.users.get(username)
+        return user if user is not None and user.allows(port) else None
+
+    def methods(self, username: str) -> str:
+        """该用户可用的认证方式，供get_allowed_auths返回"""
+        user = self.users.get(username)
+        methods = []
+        if self.keys:
+            methods.append('publickey')
+        if user is None or user.password is not None:
+            methods.append('password')
+        return ','.join(methods) or 'password'
+
+    def summary(self) -> Tuple[int, int]:
+        """(用户数, 公钥数)"""
+        return len(self.users), len(self.keys)
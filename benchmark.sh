@@ -83,18 +83,21 @@ test_connection() {
 echo "启动 $CONCURRENT 个并发连接..."
 START=$(date +%s)
 
+# 每个后台连接把结果写入独立文件，全部结束后再统计
+# （在子shell中赋值的变量对当前shell不可见，不能直接用 result=$(...) &）
+RESULT_DIR=$(mktemp -d)
+trap 'rm -rf "$RESULT_DIR"' EXIT
+
 for i in $(seq 1 $CONCURRENT); do
-    result=$(test_connection) &
-    if [ "$result" == "1" ]; then
-        ((SUCCESS++))
-    else
-        ((FAILED++))
-    fi
+    test_connection > "$RESULT_DIR/$i" &
 done
 
 # 等待所有后台任务完成
 wait
 
+SUCCESS=$(cat "$RESULT_DIR"/* | grep -c '^1$' || true)
+FAILED=$((CONCURRENT - SUCCESS))
+
 END=$(date +%s)
 ELAPSED=$((END - START))
 
@@ -112,13 +115,16 @@ echo "正在运行..."
 TEST_START=$(date +%s)
 TEST_END=$((TEST_START + DURATION))
 CONNECTION_COUNT=0
+FAILED_COUNT=0
 
 while [ $(date +%s) -lt $TEST_END ]; do
     for i in $(seq 1 $CONCURRENT); do
-        (timeout 5 sshpass -p "$PASSWORD" ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -p "$PORT" "$USERNAME@$HOST" "exit" &>/dev/null && echo "OK") &
+        (timeout 5 sshpass -p "$PASSWORD" ssh -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -p "$PORT" "$USERNAME@$HOST" "exit" &>/dev/null && echo "1" || echo "0") > "$RESULT_DIR/load-$i" &
     done
     wait
-    CONNECTION_COUNT=$((CONNECTION_COUNT + CONCURRENT))
+    ROUND_OK=$(cat "$RESULT_DIR"/load-* | grep -c '^1$' || true)
+    CONNECTION_COUNT=$((CONNECTION_COUNT + ROUND_OK))
+    FAILED_COUNT=$((FAILED_COUNT + CONCURRENT - ROUND_OK))
     
     # 显示进度
     CURRENT=$(date +%s)
@@ -131,10 +137,13 @@ done
 echo ""
 echo ""
 echo "持续负载测试结果:"
-echo "  总连接数: $CONNECTION_COUNT"
+echo "  成功连接数: $CONNECTION_COUNT"
+echo "  失败连接数: $FAILED_COUNT"
 echo "  平均QPS: $(echo "scale=2; $CONNECTION_COUNT / $DURATION" | bc)"
 echo ""
 
 echo "========================================"
 echo -e "${GREEN}测试完成！${NC}"
 echo "========================================"
+echo "按键延迟、吞吐和每会话资源占用等更细的指标可使用:"
+echo "  python -m benchmarks.loadgen --sessions 100"
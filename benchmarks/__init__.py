@@ -0,0 +1,4 @@
+"""
+Telnet to SSH Proxy 性能基准测试工具
+仅用于开发和回归对比，不打包进Docker镜像
+"""
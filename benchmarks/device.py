@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+模拟Telnet设备
+单线程selector实现，支持几种典型的设备行为：
+  echo    原样回显收到的数据
+  prompt  按行处理命令，回显命令并输出一行结果和提示符（类似交换机CLI）
+  bulk    收到任意数据后输出bulk_size字节（类似 show running-config）
+  drip    连接期间每隔drip_interval秒输出一个字节（类似日志或串口慢速输出）
+
+用法（单独运行，便于手工测试或配合benchmark.sh）:
+  python -m benchmarks.device --mode prompt --port 2323
+"""
+
+import argparse
+import selectors
+import socket
+import time
+from typing import Dict
+
+MODES = ('echo', 'prompt', 'bulk', 'drip')
+
+PROMPT = b'Router# '
+
+
+class DeviceConnection:
+    """设备侧的一个Telnet连接"""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.out = bytearray()
+        self.line = b''
+        # bulk模式尚未生成的输出字节数，发送时按需补充，避免一次性占用大量内存
+        self.bulk_remaining = 0
+        self.next_drip = 0.0
+
+
+class FakeTelnetDevice:
+    """模拟Telnet设备，在调用serve()的线程中运行"""
+
+    def __init__(self, mode: str = 'echo', bulk_size: int = 1024 * 1024,
+                 drip_interval: float = 0.05, host: str = '127.0.0.1', port: int = 0):
+        if mode not in MODES:
+            raise ValueError(f"未知的设备模式: {mode}")
+        self.mode = mode
+        self.bulk_size = bulk_size
+        self.drip_interval = drip_interval
+        family = socket.AF_INET6 if ':' in host else socket.AF_INET
+        self.sock = socket.create_server((host, port), family=family, backlog=4096)
+        self.sock.setblocking(False)
+        self.port = self.sock.getsockname()[1]
+        self.connections = 0
+        self.running = True
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        self._conns: Dict[int, DeviceConnection] = {}
+        self._bulk_chunk = (b'interface GigabitEthernet0/1\r\n description uplink\r\n' * 1024)
+
+    def serve(self):
+        timeout = self.drip_interval if self.mode == 'drip' else 0.5
+        while self.running:
+            for key, mask in self.selector.select(timeout):
+                if key.fileobj is self.sock:
+                    self._accept()
+                    continue
+                conn = key.data
+                if mask & selectors.EVENT_READ:
+                    self._read(conn)
+                if mask & selectors.EVENT_WRITE and conn.sock.fileno() != -1:
+                    self._flush(conn)
+            if self.mode == 'drip':
+                self._drip()
+        for conn in list(self._conns.values()):
+            conn.sock.close()
+        self.selector.close()
+        self.sock.close()
+
+    def stop(self):
+        self.running = False
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            sock.setblocking(False)
+            conn = DeviceConnection(sock)
+            self._conns[sock.fileno()] = conn
+            self.selector.register(sock, selectors.EVENT_READ, conn)
+            self.connections += 1
+            if self.mode == 'prompt':
+                self._send(conn, b'\r\nUser Access Verification\r\n\r\n' + PROMPT)
+
+    def _read(self, conn: DeviceConnection):
+        try:
+            data = conn.sock.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._close(conn)
+            return
+        if self.mode == 'echo':
+            self._send(conn, data)
+        elif self.mode == 'prompt':
+            conn.line += data
+            while b'\r' in conn.line or b'\n' in conn.line:
+                cut = min(i for i in (conn.line.find(b'\r'), conn.line.find(b'\n')) if i != -1)
+                command, conn.line = conn.line[:cut], conn.line[cut + 1:].lstrip(b'\n')
+                self._send(conn, command + b'\r\n% ' + command + b' ok\r\n' + PROMPT)
+        elif self.mode == 'bulk':
+            conn.bulk_remaining += self.bulk_size
+            self._flush(conn)
+
+    def _drip(self):
+        now = time.monotonic()
+        for conn in list(self._conns.values()):
+            if now >= conn.next_drip:
+                conn.next_drip = now + self.drip_interval
+                self._send(conn, b'.')
+
+    def _send(self, conn: DeviceConnection, data: bytes):
+        conn.out += data
+        self._flush(conn)
+
+    def _flush(self, conn: DeviceConnection):
+        if conn.bulk_remaining and len(conn.out) < len(self._bulk_chunk):
+            chunk = self._bulk_chunk[:conn.bulk_remaining]
+            conn.out += chunk
+            conn.bulk_remaining -= len(chunk)
+        try:
+            sent = conn.sock.send(conn.out)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._close(conn)
+            return
+        del conn.out[:sent]
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if conn.out or conn.bulk_remaining else 0)
+        self.selector.modify(conn.sock, events, conn)
+
+    def _close(self, conn: DeviceConnection):
+        if self._conns.pop(conn.sock.fileno(), None) is None:
+            return
+        self.selector.unregister(conn.sock)
+        conn.sock.close()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='模拟Telnet设备')
+    parser.add_argument('--mode', choices=MODES, default='prompt', help='设备行为')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址')
+    parser.add_argument('--port', type=int, default=2323, help='监听端口')
+    parser.add_argument('--bulk-size', type=int, default=1024 * 1024, help='bulk模式每次输出的字节数')
+    parser.add_argument('--drip-interval', type=float, default=0.05, help='drip模式输出间隔（秒）')
+    args = parser.parse_args()
+
+    device = FakeTelnetDevice(args.mode, args.bulk_size, args.drip_interval, args.host, args.port)
+    print(f"模拟设备({args.mode}) 监听 {args.host}:{device.port}")
+    try:
+        device.serve()
+    except KeyboardInterrupt:
+        device.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+SSH握手基准测试
+对每种主机密钥类型和算法组合连续完成多次SSH握手（密钥交换+主机密钥签名），
+报告每秒握手数和握手耗时，用于选择最快且合规的组合
+
+用法:
+  python -m benchmarks.handshake --count 200
+  python -m benchmarks.handshake --keys ed25519 rsa --sets default curve25519 --json
+"""
+
+import argparse
+import json
+import logging
+import socket
+import statistics
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import paramiko
+
+from auth import AuthStore
+from host_keys import apply_algorithms, generate_host_key, validate_algorithms
+from proxy_server import SSHServerHandler, logger
+
+# 待比较的算法组合；客户端和服务端使用相同偏好，确保协商结果就是该组合
+ALGORITHM_SETS = {
+    'default': {},
+    'curve25519': {
+        'kex': ['curve25519-sha256@libssh.org'],
+        'ciphers': ['aes128-ctr'],
+        'macs': ['hmac-sha2-256-etm@openssh.com'],
+    },
+    'ecdh-p256': {
+        'kex': ['ecdh-sha2-nistp256'],
+        'ciphers': ['aes128-ctr'],
+        'macs': ['hmac-sha2-256'],
+    },
+    'dh-group14': {
+        'kex': ['diffie-hellman-group14-sha256'],
+        'ciphers': ['aes256-ctr'],
+        'macs': ['hmac-sha2-512'],
+    },
+}
+
+# 主机密钥类型 -> 客户端请求的主机密钥算法
+KEY_ALGORITHMS = {
+    'ed25519': ['ssh-ed25519'],
+    'ecdsa': ['ecdsa-sha2-nistp256'],
+    'rsa': ['rsa-sha2-256'],
+}
+
+
+class HandshakeServer:
+    """只完成密钥交换的SSH服务端"""
+
+    def __init__(self, host_key: paramiko.PKey, algorithms: dict):
+        self.host_key = host_key
+        self.algorithms = algorithms
+        self.sock = socket.create_server(('127.0.0.1', 0), backlog=128)
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+
+    def serve(self):
+        while self.running:
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                return
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._handshake, args=(client,), daemon=True).start()
+
+    def _handshake(self, client: socket.socket):
+        transport = paramiko.Transport(client)
+        try:
+            transport.add_server_key(self.host_key)
+            apply_algorithms(transport, self.algorithms)
+            transport.start_server(server=SSHServerHandler(AuthStore.single('bench', 'bench'), self.port))
+            # 等待客户端断开
+            while transport.is_active():
+                time.sleep(0.01)
+        except Exception:
+            pass
+        finally:
+            transport.close()
+
+    def stop(self):
+        self.running = False
+        self.sock.close()
+
+
+def sign_rate(host_key: paramiko.PKey, seconds: float = 0.5) -> float:
+    """单独测量主机密钥每秒签名次数（握手中服务端最主要的非对称运算）"""
+    data = b'x' * 64
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        host_key.sign_ssh_data(data, 'rsa-sha2-256' if host_key.get_name() == 'ssh-rsa' else None)
+        count += 1
+    return count / seconds
+
+
+def run_combination(key_type: str, host_key: paramiko.PKey, set_name: str, count: int) -> Dict:
+    """对一个组合连续握手count次"""
+    algorithms = validate_algorithms(dict(ALGORITHM_SETS[set_name], keys=KEY_ALGORITHMS[key_type]))
+    server = HandshakeServer(host_key, algorithms)
+    threading.Thread(target=server.serve, daemon=True).start()
+
+    durations: List[float] = []
+    negotiated = {}
+    started = time.perf_counter()
+    try:
+        for _ in range(count):
+            sock = socket.create_connection(('127.0.0.1', server.port))
+            # 避免Nagle与延迟ACK叠加的40ms等待掩盖加密运算本身的耗时
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            began = time.perf_counter()
+            transport = paramiko.Transport(sock)
+            apply_algorithms(transport, algorithms)
+            transport.start_client(timeout=10)
+            durations.append((time.perf_counter() - began) * 1000)
+            if not negotiated:
+                negotiated = {
+                    # 双方偏好相同，协商结果即客户端的首选
+                    'kex': transport.get_security_options().kex[0],
+                    'cipher': transport.remote_cipher,
+                    'mac': transport.remote_mac,
+                    'host_key': transport.host_key_type,
+                }
+            transport.close()
+    finally:
+        server.stop()
+    elapsed = time.perf_counter() - started
+
+    durations.sort()
+    return {
+        'key': key_type,
+        'algorithms': set_name,
+        'negotiated': negotiated,
+        'handshakes': count,
+        'handshakes_per_second': round(count / elapsed, 1),
+        'handshake_ms_p50': round(statistics.median(durations), 2),
+        'handshake_ms_p99': round(durations[max(int(len(durations) * 0.99) - 1, 0)], 2),
+        'signs_per_second': round(sign_rate(host_key)),
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='SSH握手基准测试')
+    parser.add_argument('--count', type=int, default=100, help='每个组合的握手次数')
+    parser.add_argument('--keys', nargs='+', choices=sorted(KEY_ALGORITHMS),
+                        default=['ed25519', 'ecdsa', 'rsa'], help='主机密钥类型')
+    parser.add_argument('--sets', nargs='+', choices=sorted(ALGORITHM_SETS),
+                        default=list(ALGORITHM_SETS), help='算法组合')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args()
+
+    # 基准测试期间屏蔽代理和paramiko日志
+    logger.disabled = True
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for key_type in args.keys:
+            host_key = generate_host_key(key_type, f"{tmp}/{key_type}")
+            for set_name in args.sets:
+                results.append(run_combination(key_type, host_key, set_name, args.count))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\nSSH握手基准测试: 每组合 {args.count} 次握手")
+    print("=" * 96)
+    print(f"{'密钥':<10} {'算法组合':<12} {'握手/秒':<10} {'p50(ms)':<10} {'p99(ms)':<10} "
+          f"{'签名/秒':<10} {'协商结果'}")
+    print("-" * 96)
+    for r in results:
+        n = r['negotiated']
+        print(f"{r['key']:<10} {r['algorithms']:<12} {r['handshakes_per_second']:<10} "
+              f"{r['handshake_ms_p50']:<10} {r['handshake_ms_p99']:<10} {r['signs_per_second']:<10} "
+              f"{n.get('kex')} {n.get('cipher')} {n.get('mac')}")
+    print("=" * 96)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+端到端负载测试
+在当前进程内启动代理（ProxyManager + 临时配置），在子进程中运行模拟Telnet设备和
+N个并发paramiko客户端，依次测量：
+  handshake  SSH握手+认证+打开shell的速率与耗时
+  keystroke  N个会话保持连接时的单字节往返延迟，以及每会话内存占用
+  bulk       大量输出（类似 show running-config）的吞吐
+  drip       N个会话持续慢速输出时代理的CPU占用
+代理的CPU和内存只在主进程内统计，不包含客户端和设备的开销。
+结果可保存为JSON，用 --compare 比较两次提交之间的差异
+
+用法:
+  python -m benchmarks.loadgen --sessions 100 --output before.json
+  python -m benchmarks.loadgen --sessions 100 --engine reactor --output after.json
+  python -m benchmarks.loadgen --compare before.json after.json
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import socket
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import paramiko
+import yaml
+
+from benchmarks.device import FakeTelnetDevice
+from proxy_server import ProxyManager, logger
+
+USERNAME = 'bench'
+PASSWORD = 'bench'
+
+# 各阶段连接的设备模式，每种模式对应一个代理端口
+DEVICE_MODES = ('echo', 'bulk', 'drip')
+
+# --compare 时数值越小越好的指标
+LOWER_IS_BETTER = ('ms', 'cpu', 'rss', 'failures', 'seconds')
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(int(len(values) * fraction + 0.5) - 1, 0)]
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _rss_bytes() -> int:
+    """当前常驻内存；没有/proc时退化为峰值常驻内存"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+# ---------------------------------------------------------------------------
+# 子进程：设备与客户端
+# ---------------------------------------------------------------------------
+
+class Probe:
+    """子进程向主进程请求测量代理进程的CPU和内存"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def sample(self) -> dict:
+        self.conn.send(('sample',))
+        return self.conn.recv()
+
+    @staticmethod
+    def usage(before: dict, after: dict) -> dict:
+        wall = max(after['wall'] - before['wall'], 1e-9)
+        return {
+            'seconds': round(wall, 3),
+            'proxy_cpu_percent': round((after['cpu'] - before['cpu']) / wall * 100, 1),
+        }
+
+
+def open_session(port: int, timeout: float = 30.0):
+    """建立一个SSH会话，返回(client, channel)"""
+    sock = socket.create_connection(('127.0.0.1', port), timeout=timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    client.connect('127.0.0.1', port, USERNAME, PASSWORD, sock=sock, timeout=timeout,
+                   banner_timeout=timeout, auth_timeout=timeout,
+                   look_for_keys=False, allow_agent=False)
+    channel = client.invoke_shell(width=80, height=24)
+    channel.settimeout(timeout)
+    return client, channel
+
+
+def open_sessions(port: int, count: int, concurrency: int) -> list:
+    """并发建立count个会话，失败的会话不计入返回值"""
+    def attempt(_):
+        try:
+            return open_session(port)
+        except Exception:
+            return None
+    with ThreadPoolExecutor(concurrency) as pool:
+        return [session for session in pool.map(attempt, range(count)) if session]
+
+
+def close_sessions(sessions: list):
+    for client, _ in sessions:
+        client.close()
+
+
+def phase_handshake(port: int, args, probe: Probe) -> dict:
+    """并发完成args.handshakes次登录（握手+认证+打开shell）后立即断开"""
+    def login(_):
+        began = time.perf_counter()
+        try:
+            client, _ = open_session(port)
+        except Exception:
+            return None
+        elapsed = (time.perf_counter() - began) * 1000
+        client.close()
+        return elapsed
+
+    before = probe.sample()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(login, range(args.handshakes)))
+    after = probe.sample()
+    durations = [r for r in results if r is not None]
+    usage = Probe.usage(before, after)
+    return dict(usage, **{
+        'handshakes': len(durations),
+        'failures': len(results) - len(durations),
+        'handshakes_per_second': round(len(durations) / usage['seconds'], 1),
+        'handshake_ms_p50': round(_percentile(durations, 0.5), 2),
+        'handshake_ms_p99': round(_percentile(durations, 0.99), 2),
+    })
+
+
+def phase_keystroke(port: int, args, probe: Probe) -> dict:
+    """保持args.sessions个会话，轮流发送单字节并等待回显"""
+    baseline = probe.sample()
+    sessions = open_sessions(port, args.sessions, args.concurrency)
+    time.sleep(0.5)
+    loaded = probe.sample()
+    latencies = []
+    failures = 0
+    try:
+        for i in range(args.samples if sessions else 0):
+            _, channel = sessions[i % len(sessions)]
+            started = time.perf_counter()
+            try:
+                channel.sendall(b'x')
+                if not channel.recv(1):
+                    raise EOFError()
+            except Exception:
+                failures += 1
+                continue
+            latencies.append((time.perf_counter() - started) * 1000)
+    finally:
+        after = probe.sample()
+        close_sessions(sessions)
+    opened = len(sessions)
+    return dict(Probe.usage(loaded, after), **{
+        'sessions': opened,
+        'failures': failures + args.sessions - opened,
+        'keystroke_ms_p50': round(_percentile(latencies, 0.5), 3),
+        'keystroke_ms_p99': round(_percentile(latencies, 0.99), 3),
+        'keystroke_ms_mean': round(statistics.fmean(latencies), 3) if latencies else 0.0,
+        'rss_per_session_kb': round((loaded['rss'] - baseline['rss']) / 1024 / opened, 1) if opened else 0.0,
+    })
+
+
+def phase_bulk(port: int, args, probe: Probe) -> dict:
+    """args.bulk_sessions个会话同时请求args.bulk_size字节输出"""
+    sessions = open_sessions(port, args.bulk_sessions, args.concurrency)
+
+    def transfer(session) -> int:
+        _, channel = session
+        received = 0
+        try:
+            channel.sendall(b'\r')
+            while received < args.bulk_size:
+                data = channel.recv(65536)
+                if not data:
+                    break
+                received += len(data)
+        except Exception:
+            pass
+        return received
+
+    before = probe.sample()
+    try:
+        with ThreadPoolExecutor(max(len(sessions), 1)) as pool:
+            received = list(pool.map(transfer, sessions))
+    finally:
+        after = probe.sample()
+        close_sessions(sessions)
+    usage = Probe.usage(before, after)
+    total = sum(received)
+    return dict(usage, **{
+        'sessions': len(sessions),
+        'failures': sum(1 for r in received if r < args.bulk_size) + args.bulk_sessions - len(sessions),
+        'bytes': total,
+        'mb_per_second': round(total / usage['seconds'] / 1e6, 2),
+    })
+
+
+def phase_drip(port: int, args, probe: Probe) -> dict:
+    """args.sessions个会话持续收到慢速输出，测量代理CPU"""
+    sessions = open_sessions(port, args.sessions, args.concurrency)
+    running = True
+    received = [0]
+
+    def reader():
+        # 单线程轮询读取，避免客户端线程数影响测量
+        while running:
+            for _, channel in sessions:
+                while channel.recv_ready():
+                    received[0] += len(channel.recv(65536))
+            time.sleep(0.01)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    time.sleep(0.5)
+    before = probe.sample()
+    time.sleep(args.drip_seconds)
+    after = probe.sample()
+    running = False
+    thread.join()
+    close_sessions(sessions)
+    return dict(Probe.usage(before, after), **{
+        'sessions': len(sessions),
+        'failures': args.sessions - len(sessions),
+        'bytes': received[0],
+    })
+
+
+PHASES = {
+    'handshake': ('echo', phase_handshake),
+    'keystroke': ('echo', phase_keystroke),
+    'bulk': ('bulk', phase_bulk),
+    'drip': ('drip', phase_drip),
+}
+
+
+def run_clients(conn, args):
+    """子进程入口：启动设备，等待代理就绪后依次运行各阶段"""
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+    devices = {
+        'echo': FakeTelnetDevice('echo'),
+        'bulk': FakeTelnetDevice('bulk', bulk_size=args.bulk_size),
+        'drip': FakeTelnetDevice('drip', drip_interval=args.drip_interval),
+    }
+    for device in devices.values():
+        threading.Thread(target=device.serve, daemon=True).start()
+    conn.send({mode: device.port for mode, device in devices.items()})
+    proxy_ports = conn.recv()
+
+    probe = Probe(conn)
+    results = {}
+    for name in args.phases:
+        mode, phase = PHASES[name]
+        results[name] = phase(proxy_ports[mode], args, probe)
+    conn.send(('done', results))
+    for device in devices.values():
+        device.stop()
+
+
+# ---------------------------------------------------------------------------
+# 主进程：代理
+# ---------------------------------------------------------------------------
+
+def write_config(tmp: str, device_ports: Dict[str, int], base_port: int, args) -> Dict[str, int]:
+    """生成临时配置，返回 设备模式 -> 代理端口"""
+    proxy_ports = {mode: base_port + i for i, mode in enumerate(DEVICE_MODES)}
+    config = {
+        'ssh': {
+            'host': '127.0.0.1',
+            'username': USERNAME,
+            'password': PASSWORD,
+            'host_key': os.path.join(tmp, 'ssh_host_key'),
+        },
+        'engine': {'mode': args.engine},
+        'mappings': {
+            proxy_ports[mode]: {
+                'host': '127.0.0.1',
+                'port': device_ports[mode],
+                'enabled': True,
+                'description': f'benchmark {mode}',
+                'protocol': args.protocol,
+            }
+            for mode in DEVICE_MODES
+        },
+        'tuning': args.tuning,
+        'reload': {'enabled': False},
+        'logging': {'level': 'ERROR'},
+    }
+    with open(os.path.join(tmp, 'config.yaml'), 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f)
+    return proxy_ports
+
+
+def run(args) -> dict:
+    """运行完整的负载测试并返回结果"""
+    parent, child = multiprocessing.get_context('fork').Pipe()
+    worker = multiprocessing.get_context('fork').Process(target=run_clients, args=(child, args), daemon=True)
+    worker.start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        proxy_ports = write_config(tmp, parent.recv(), args.base_port, args)
+        manager = ProxyManager(os.path.join(tmp, 'config.yaml'))
+        threading.Thread(target=manager.start, name='proxy', daemon=True).start()
+        _wait_listening(list(proxy_ports.values()))
+        parent.send(proxy_ports)
+
+        try:
+            while True:
+                message = parent.recv()
+                if message[0] == 'sample':
+                    parent.send({'wall': time.monotonic(), 'cpu': _cpu_seconds(), 'rss': _rss_bytes()})
+                else:
+                    results = message[1]
+                    break
+        finally:
+            manager.stop()
+            worker.join(timeout=10)
+
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'paramiko': paramiko.__version__,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'engine': args.engine,
+            'protocol': args.protocol,
+            'tuning': args.tuning,
+            'sessions': args.sessions,
+            'concurrency': args.concurrency,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        },
+        'results': results,
+    }
+
+
+def _wait_listening(ports: List[int], timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    for port in ports:
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise RuntimeError(f"代理端口 {port} 未就绪")
+                time.sleep(0.1)
+
+
+def print_report(report: dict):
+    meta = report['meta']
+    print(f"\n端到端负载测试: {meta['sessions']} 个会话, 引擎 {meta['engine']}, "
+          f"协议 {meta['protocol']}, 提交 {meta['commit'] or '-'}")
+    print("=" * 72)
+    for phase, values in report['results'].items():
+        print(f"[{phase}]")
+        for key, value in values.items():
+            print(f"  {key:<24} {value}")
+    print("=" * 72)
+
+
+def compare(before_file: str, after_file: str):
+    """比较两份JSON结果，输出各指标的变化百分比"""
+    with open(before_file, encoding='utf-8') as f:
+        before = json.load(f)
+    with open(after_file, encoding='utf-8') as f:
+        after = json.load(f)
+    print(f"\n{before['meta'].get('commit') or before_file} -> {after['meta'].get('commit') or after_file}")
+    print("=" * 72)
+    print(f"{'指标':<36} {'之前':>10} {'之后':>10} {'变化':>10}")
+    print("-" * 72)
+    for phase, values in after['results'].items():
+        old_values = before['results'].get(phase, {})
+        for key, value in values.items():
+            old = old_values.get(key)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            change = f"{(value - old) / old * 100:+.1f}%" if old else '-'
+            worse = (value > old) == any(word in key for word in LOWER_IS_BETTER)
+            flag = ' !' if old and value != old and worse and abs(value - old) / old > 0.1 else ''
+            print(f"{phase + '.' + key:<36} {old:>10} {value:>10} {change:>10}{flag}")
+    print("=" * 72)
+    print("! 表示变差超过10%")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='端到端负载测试（内置模拟Telnet设备）')
+    parser.add_argument('--sessions', type=int, default=100, help='keystroke/drip阶段的并发会话数')
+    parser.add_argument('--handshakes', type=int, default=200, help='handshake阶段的登录次数')
+    parser.add_argument('--concurrency', type=int, default=20, help='同时进行的登录数')
+    parser.add_argument('--samples', type=int, default=1000, help='按键延迟采样次数')
+    parser.add_argument('--bulk-sessions', type=int, default=10, help='bulk阶段的会话数')
+    parser.add_argument('--bulk-size', type=int, default=4 * 1024 * 1024, help='bulk阶段每会话输出字节数')
+    parser.add_argument('--drip-interval', type=float, default=0.05, help='drip阶段设备输出间隔（秒）')
+    parser.add_argument('--drip-seconds', type=float, default=5.0, help='drip阶段测量时长（秒）')
+    parser.add_argument('--phases', nargs='+', choices=list(PHASES), default=list(PHASES), help='运行的阶段')
+    parser.add_argument('--engine', choices=['threaded', 'reactor'], default='threaded', help='代理引擎')
+    parser.add_argument('--protocol', choices=['telnet', 'raw'], default='telnet', help='后端协议')
+    parser.add_argument('--tuning', nargs='+', default=[], metavar='KEY=VALUE',
+                        help='转发参数，与配置文件的tuning段相同，如 buffer_size=65536 tcp_nodelay=false')
+    parser.add_argument('--base-port', type=int, default=24001, help='代理监听的起始端口')
+    parser.add_argument('--output', help='把JSON结果写入文件')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='比较两份JSON结果')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if any('=' not in item for item in args.tuning):
+        parser.error('--tuning 参数格式应为 KEY=VALUE')
+    args.tuning = {key: yaml.safe_load(value) for key, value in
+                   (item.split('=', 1) for item in args.tuning)}
+
+    # 基准测试期间屏蔽代理和paramiko日志
+    logger.disabled = True
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+
+    report = run(args)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
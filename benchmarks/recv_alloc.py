@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Telnet接收路径分配基准测试
+对比每次recv()分配新bytes与recv_into复用会话缓冲区两种接收方式，
+经代理会话转发大量输出时每MB的接收缓冲区分配次数、分配字节数和转发线程CPU时间
+
+用法:
+  python -m benchmarks.recv_alloc --megabytes 200
+  python -m benchmarks.recv_alloc --buffer-size 65536 --json
+"""
+
+import argparse
+import json
+import multiprocessing
+import socket
+import threading
+import time
+from typing import Dict
+
+from benchmarks.device import FakeTelnetDevice
+from benchmarks.relay_latency import SocketChannel
+from proxy_server import ProxySession, RelayTuning, logger
+
+
+class BytesRecvSession(ProxySession):
+    """旧的接收方式：每次读取分配一个新的bytes对象"""
+
+    def _forward_telnet_to_ssh(self):
+        data = self.telnet_client.recv(self.tuning.buffer_size)
+        if data is None:
+            return
+        if len(data) == 0:
+            self.running = False
+            return
+        self.bytes_out += len(data)
+        protocol = self.telnet_client.protocol
+        if protocol is not None:
+            data, replies = protocol.feed(data)
+            if replies:
+                self._to_telnet += replies
+                self._flush_telnet()
+            if not data:
+                return
+        for viewer in self.viewers:
+            viewer.pending = data
+        self.flush_ssh()
+
+
+SESSION_CLASSES = {
+    'bytes': BytesRecvSession,
+    'buffer': ProxySession,
+}
+
+
+class CountingSocket:
+    """统计接收路径新分配的对象数和字节数"""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.allocations = 0
+        self.allocated_bytes = 0
+
+    def recv(self, size: int) -> bytes:
+        data = self.sock.recv(size)
+        self.allocations += 1
+        self.allocated_bytes += len(data)
+        return data
+
+    def recv_into(self, buffer) -> int:
+        return self.sock.recv_into(buffer)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+
+def _serve_device(port_conn, total: int):
+    device = FakeTelnetDevice('bulk', bulk_size=total)
+    port_conn.send(device.port)
+    device.serve()
+
+
+def run_mode(mode: str, total: int, buffer_size: int) -> Dict:
+    """经一个会话转发total字节，设备在子进程中运行，避免与转发线程争用GIL"""
+    parent, child = multiprocessing.get_context('fork').Pipe()
+    device = multiprocessing.get_context('fork').Process(target=_serve_device, args=(child, total), daemon=True)
+    device.start()
+    port = parent.recv()
+
+    proxy_side, client_side = socket.socketpair()
+    session = SESSION_CLASSES[mode](SocketChannel(proxy_side), '127.0.0.1', port, telnet_mode='raw',
+                                    tuning=RelayTuning(buffer_size=buffer_size))
+    if not session.open():
+        raise RuntimeError("连接模拟设备失败")
+    counter = CountingSocket(session.telnet_client.sock)
+    session.telnet_client.sock = counter
+    cpu = {}
+
+    def relay():
+        started = time.thread_time()
+        session.run()
+        cpu['seconds'] = time.thread_time() - started
+
+    thread = threading.Thread(target=relay, daemon=True)
+    thread.start()
+
+    started = time.perf_counter()
+    client_side.sendall(b'\r')
+    received = 0
+    buffer = bytearray(1024 * 1024)
+    while received < total:
+        n = client_side.recv_into(buffer)
+        if not n:
+            break
+        received += n
+    elapsed = time.perf_counter() - started
+    client_side.close()
+    thread.join(timeout=5)
+    device.terminate()
+
+    megabytes = received / 1e6
+    return {
+        'mode': mode,
+        'buffer_size': buffer_size,
+        'megabytes': round(megabytes, 1),
+        'allocations_per_mb': round(counter.allocations / megabytes, 1),
+        'allocated_bytes_per_mb': round(counter.allocated_bytes / megabytes),
+        'relay_cpu_ms_per_mb': round(cpu.get('seconds', 0.0) * 1000 / megabytes, 3),
+        'mb_per_second': round(megabytes / elapsed, 1),
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='Telnet接收路径分配基准测试')
+    parser.add_argument('--megabytes', type=int, default=200, help='转发的数据量（MB）')
+    parser.add_argument('--buffer-size', type=int, default=RelayTuning.DEFAULTS['buffer_size'],
+                        help='每次读取的最大字节数')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args()
+
+    # 基准测试期间屏蔽代理日志
+    logger.disabled = True
+
+    total = args.megabytes * 1000 * 1000
+    results = [run_mode(mode, total, args.buffer_size) for mode in SESSION_CLASSES]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n接收路径分配基准测试: {args.megabytes} MB, 读缓冲 {args.buffer_size} 字节")
+    print("=" * 80)
+    print(f"{'方式':<8} {'分配次数/MB':<14} {'分配字节/MB':<14} {'CPU(ms)/MB':<12} {'MB/s':<10}")
+    print("-" * 80)
+    for r in results:
+        print(f"{r['mode']:<8} {r['allocations_per_mb']:<14} {r['allocated_bytes_per_mb']:<14} "
+              f"{r['relay_cpu_ms_per_mb']:<12} {r['mb_per_second']:<10}")
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+转发层基准测试
+对比旧的轮询转发循环与事件驱动转发的按键延迟、空闲CPU和线程数
+
+用法:
+  python -m benchmarks.relay_latency --sessions 500
+  python -m benchmarks.relay_latency --sessions 500 --json
+"""
+
+import argparse
+import json
+import resource
+import select
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List
+
+from benchmarks.device import FakeTelnetDevice
+from proxy_server import ProxySession, logger
+
+
+def _wait_readable(sock: socket.socket, timeout: float) -> bool:
+    """等待socket可读；使用poll以支持编号超过1024的文件描述符"""
+    poller = select.poll()
+    poller.register(sock, select.POLLIN)
+    return bool(poller.poll(timeout * 1000))
+
+
+class SocketChannel:
+    """用socketpair模拟paramiko Channel的最小接口"""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.closed = False
+        self.eof_received = False
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def recv_ready(self) -> bool:
+        if self.closed:
+            return False
+        return _wait_readable(self.sock, 0)
+
+    def recv_stderr_ready(self) -> bool:
+        return False
+
+    def get_transport(self):
+        return None
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def recv(self, size: int) -> bytes:
+        data = self.sock.recv(size)
+        if not data:
+            self.eof_received = True
+        return data
+
+    def send(self, data: bytes) -> int:
+        try:
+            return self.sock.send(data)
+        except BlockingIOError:
+            # 与paramiko一致：窗口已满时抛出socket.timeout
+            raise socket.timeout()
+
+    def sendall(self, data: bytes):
+        self.sock.sendall(data)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.sock.close()
+
+
+class LegacyPollingSession(ProxySession):
+    """
+    旧版转发实现：每会话两个线程，SSH侧10ms睡眠轮询，Telnet侧100ms select超时
+    原实现使用select.select，文件描述符超过1024时直接报错，这里换成等价的poll
+    """
+
+    def _relay(self):
+        ssh_to_telnet = threading.Thread(target=self._poll_ssh_to_telnet, daemon=True)
+        telnet_to_ssh = threading.Thread(target=self._poll_telnet_to_ssh, daemon=True)
+        ssh_to_telnet.start()
+        telnet_to_ssh.start()
+        ssh_to_telnet.join()
+        telnet_to_ssh.join()
+
+    def _poll_ssh_to_telnet(self):
+        try:
+            while self.running:
+                if self.ssh_channel.recv_ready():
+                    data = self.ssh_channel.recv(4096)
+                    if len(data) == 0:
+                        break
+                    if not self.telnet_client.send(data):
+                        break
+                else:
+                    time.sleep(0.01)
+        except Exception:
+            pass
+        finally:
+            self.running = False
+
+    def _poll_telnet_to_ssh(self):
+        try:
+            while self.running:
+                if self.telnet_client.sock:
+                    if _wait_readable(self.telnet_client.sock, 0.1):
+                        data = self.telnet_client.recv(4096)
+                        if len(data) == 0:
+                            break
+                        self.ssh_channel.send(data)
+        except Exception:
+            pass
+        finally:
+            self.running = False
+
+
+SESSION_CLASSES = {
+    'legacy': LegacyPollingSession,
+    'selector': ProxySession,
+}
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_mode(mode: str, sessions: int, samples: int, idle_seconds: float) -> Dict:
+    """在当前进程内运行单一转发实现并返回测量结果"""
+    device = FakeTelnetDevice('echo')
+    threading.Thread(target=device.serve, daemon=True).start()
+
+    session_cls = SESSION_CLASSES[mode]
+    clients: List[socket.socket] = []
+    workers: List[threading.Thread] = []
+    for _ in range(sessions):
+        proxy_side, client_side = socket.socketpair()
+        session = session_cls(SocketChannel(proxy_side), '127.0.0.1', device.port)
+        worker = threading.Thread(target=session.start, daemon=True)
+        worker.start()
+        clients.append(client_side)
+        workers.append(worker)
+
+    deadline = time.monotonic() + 30
+    while device.connections < sessions and time.monotonic() < deadline:
+        time.sleep(0.05)
+    time.sleep(0.5)
+
+    # 空闲CPU：所有会话已建立但没有流量
+    cpu_before = _cpu_seconds()
+    wall_before = time.monotonic()
+    time.sleep(idle_seconds)
+    idle_cpu = (_cpu_seconds() - cpu_before) / (time.monotonic() - wall_before) * 100
+    thread_count = threading.active_count()
+
+    # 按键往返延迟：单字节经代理到回显设备再返回
+    latencies = []
+    for i in range(samples):
+        client = clients[i % sessions]
+        started = time.perf_counter()
+        client.sendall(b'x')
+        client.recv(1)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    for client in clients:
+        client.close()
+    for worker in workers:
+        worker.join(timeout=2)
+    device.stop()
+
+    latencies.sort()
+    return {
+        'mode': mode,
+        'sessions': sessions,
+        'connected': device.connections,
+        'threads': thread_count,
+        'idle_cpu_percent': round(idle_cpu, 2),
+        'keystroke_ms_p50': round(statistics.median(latencies), 3),
+        'keystroke_ms_p99': round(latencies[int(len(latencies) * 0.99) - 1], 3),
+        'keystroke_ms_mean': round(statistics.fmean(latencies), 3),
+    }
+
+
+def run_isolated(mode: str, args) -> Dict:
+    """在独立子进程中运行，避免两种实现互相干扰CPU统计"""
+    cmd = [
+        sys.executable, '-m', 'benchmarks.relay_latency',
+        '--mode', mode,
+        '--sessions', str(args.sessions),
+        '--samples', str(args.samples),
+        '--idle-seconds', str(args.idle_seconds),
+        '--json',
+    ]
+    output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(output)[0]
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='转发层延迟与空闲CPU基准测试')
+    parser.add_argument('--sessions', type=int, default=500, help='并发会话数')
+    parser.add_argument('--samples', type=int, default=1000, help='按键延迟采样次数')
+    parser.add_argument('--idle-seconds', type=float, default=5.0, help='空闲CPU测量时长（秒）')
+    parser.add_argument('--mode', choices=sorted(SESSION_CLASSES), help='仅运行指定实现（默认两者对比）')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args()
+
+    # 基准测试期间屏蔽代理日志
+    logger.disabled = True
+
+    if args.mode:
+        results = [run_mode(args.mode, args.sessions, args.samples, args.idle_seconds)]
+    else:
+        results = [run_isolated(mode, args) for mode in ('legacy', 'selector')]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n转发层基准测试: {args.sessions} 个会话, {args.samples} 次按键采样")
+    print("=" * 80)
+    print(f"{'实现':<10} {'线程数':<8} {'空闲CPU%':<10} {'p50(ms)':<10} {'p99(ms)':<10} {'平均(ms)':<10}")
+    print("-" * 80)
+    for r in results:
+        print(f"{r['mode']:<10} {r['threads']:<8} {r['idle_cpu_percent']:<10} "
+              f"{r['keystroke_ms_p50']:<10} {r['keystroke_ms_p99']:<10} {r['keystroke_ms_mean']:<10}")
+    print("=" * 80)
+
+
+if __name__ == '__main__':
+    main()
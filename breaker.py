@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+后端熔断器
+每个映射一个熔断器，由会话连接后端的结果驱动：连续失败达到阈值后打开，
+之后的会话在认证后立即收到提示并断开，不再等待连接超时。
+打开期间不主动连接后端（串口服务器等只允许一个会话的设备会被探测连接占用或踢掉用户），
+退避间隔过后放行下一个真实会话作为试探，它连接成功即关闭熔断器，失败则加倍间隔后再放行
+"""
+
+import logging
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+# 一个会话正在作为试探连接后端，其他新会话仍被拒绝
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """单个映射的后端熔断器"""
+
+    DEFAULTS = {
+        'enabled': True,
+        # 连续连接失败多少次后打开
+        'failure_threshold': 3,
+        # 打开后放行第一个试探会话前的等待时间（秒），之后每次试探失败翻倍
+        'reset_timeout': 10.0,
+        'max_reset_timeout': 300.0,
+    }
+
+    def __init__(self, name: str, failure_threshold: int = 3,
+                 reset_timeout: float = 10.0, max_reset_timeout: float = 300.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.rejected = 0
+        self.last_error: Optional[str] = None
+        # 下一次放行试探会话的时间（time.time()，便于写入状态文件）
+        self.retry_at: Optional[float] = None
+        # 当前的退避间隔（秒）
+        self._delay = reset_timeout
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, name: str, defaults: Optional[dict],
+                    mapping: Optional[dict] = None) -> Optional['CircuitBreaker']:
+        """全局breaker配置段，再由映射的breaker覆盖；关闭时返回None"""
+        values = dict(cls.DEFAULTS)
+        values.update(defaults or {})
+        values.update((mapping or {}).get('breaker') or {})
+        if not values['enabled']:
+            return None
+        return cls(
+            name,
+            failure_threshold=max(int(values['failure_threshold']), 1),
+            reset_timeout=float(values['reset_timeout']),
+            max_reset_timeout=float(values['max_reset_timeout']),
+        )
+
+    def allow(self) -> bool:
+        """是否允许新会话连接后端；退避间隔过后放行一个会话作为试探，之后必须调用record_success或record_failure"""
+        if self.state == CLOSED:
+            return True
+        with self._lock:
+            if self.state == OPEN and time.time() >= (self.retry_at or 0):
+                self.state = HALF_OPEN
+                return True
+            self.rejected += 1
+        return False
+
+    def record_success(self):
+        """会话成功连接后端；试探会话或打开前已在连接中的会话成功时关闭熔断器"""
+        if not self.failures and self.state == CLOSED:
+            return
+        with self._lock:
+            recovered = self.state != CLOSED
+            self.state = CLOSED
+            self.failures = 0
+            self.last_error = None
+            self.retry_at = None
+            self._delay = self.reset_timeout
+        if recovered:
+            logger.info(f"后端 {self.name} 已恢复，熔断器关闭")
+
+    def record_failure(self, error: Optional[str] = None):
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+            if self.state == HALF_OPEN:
+                # 试探会话也失败了，加倍间隔后再放行下一个
+                self._delay = min(self._delay * 2, self.max_reset_timeout)
+                level = logging.INFO
+                message = f"后端 {self.name} 试探连接失败，{self._delay:.0f} 秒后再试: {error}"
+            elif self.state == CLOSED and self.failures >= self.failure_threshold:
+                self._delay = self.reset_timeout
+                self.trips += 1
+                level = logging.WARNING
+                message = (f"后端 {self.name} 连续 {self.failures} 次连接失败，熔断器打开，"
+                           f"{self._delay:.0f} 秒后放行一个会话试探")
+            else:
+                return
+            self.state = OPEN
+            self.retry_at = time.time() + self._delay
+        logger.log(level, message)
+
+    def message(self) -> str:
+        """拒绝会话时发给SSH客户端的提示"""
+        wait = max((self.retry_at or 0) - time.time(), 0)
+        return (f"错误: 设备 {self.name} 暂时不可达（连续 {self.failures} 次连接失败），"
+                f"约 {wait:.0f} 秒后可再次尝试，请稍后再连接\r\n")
+
+    def stats(self) -> dict:
+        return {
+            'breaker': self.state,
+            'breaker_open': self.state != CLOSED,
+            'breaker_trips': self.trips,
+            'breaker_rejected': self.rejected,
+            'backend_error': self.last_error,
+        }
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+监听socket的接管
+重启或升级时新进程直接使用已经在监听的socket，内核中排队的连接不会丢失：
+- systemd socket激活：按LISTEN_PID/LISTEN_FDS继承systemd打开的监听socket，按绑定的端口对应到映射
+- 进程间交接：旧进程在Unix socket上等待，新进程启动时连接并以SCM_RIGHTS取得所有监听socket，
+  旧进程随后停止accept、让出指标端口和状态端点，并排空（drain）已建立的会话
+协议: 新进程发送 "takeover"，旧进程回复一行JSON（监听socket数）并分批传递fd，
+新进程回复 "ok" 后旧进程释放监听，完成后回复 "released"
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# systemd传入的第一个fd（sd_listen_fds）
+SD_LISTEN_FDS_START = 3
+# 每条消息传递的fd数，低于内核的SCM_MAX_FD(253)
+FDS_PER_MESSAGE = 200
+
+
+def adopt(fds: Iterable[int]) -> Dict[int, socket.socket]:
+    """把继承的fd包装为socket并按监听端口索引，不是TCP监听socket的fd直接关闭"""
+    listeners = {}
+    for fd in fds:
+        try:
+            sock = socket.socket(fileno=fd)
+        except OSError as e:
+            logger.warning(f"忽略无效的监听fd {fd}: {e}")
+            continue
+        if (sock.family not in (socket.AF_INET, socket.AF_INET6) or sock.type != socket.SOCK_STREAM
+                or not sock.getsockopt(socket.SOL_SOCKET, socket.SO_ACCEPTCONN)):
+            logger.warning(f"忽略不是TCP监听socket的fd {fd}")
+            sock.close()
+            continue
+        sock.set_inheritable(False)
+        listeners[sock.getsockname()[1]] = sock
+    return listeners
+
+
+def systemd_listeners() -> Dict[int, socket.socket]:
+    """systemd socket激活传入的监听socket，不是由systemd激活启动时为空"""
+    try:
+        if int(os.environ.get('LISTEN_PID', '0')) != os.getpid():
+            return {}
+        count = int(os.environ.get('LISTEN_FDS', '0'))
+    except ValueError:
+        return {}
+    # 只认领一次，fork出的worker和再启动的子进程不会误用
+    for name in ('LISTEN_PID', 'LISTEN_FDS', 'LISTEN_FDNAMES'):
+        os.environ.pop(name, None)
+    listeners = adopt(range(SD_LISTEN_FDS_START, SD_LISTEN_FDS_START + count))
+    if listeners:
+        logger.info(f"使用systemd传入的 {len(listeners)} 个监听socket: {sorted(listeners)}")
+    return listeners
+
+
+def request_listeners(path: str, timeout: float = 10.0) -> Dict[int, socket.socket]:
+    """向正在运行的旧进程请求接管监听socket；没有旧进程或接管失败时返回空，由调用方自行绑定"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(path)
+    except OSError:
+        # 上次未正常退出留下的socket文件
+        return {}
+    fds = []
+    try:
+        with sock:
+            sock.sendall(b'takeover\n')
+            data = b''
+            header = None
+            while header is None or len(fds) < header.get('count', 0):
+                chunk, received, _, _ = socket.recv_fds(sock, 4096, FDS_PER_MESSAGE + 1)
+                fds.extend(received)
+                if not chunk:
+                    raise ConnectionError("旧进程提前关闭了连接")
+                data += chunk
+                if header is None and b'\n' in data:
+                    header = json.loads(data.split(b'\n', 1)[0])
+                    if header.get('error'):
+                        raise ConnectionError(header['error'])
+            listeners = adopt(fds)
+            fds = []
+            sock.sendall(b'ok\n')
+            # 等待旧进程停止accept并让出指标端口，之后新进程的监听才会全部成功
+            reply = b''
+            while not reply.endswith(b'\n'):
+                chunk = sock.recv(64)
+                if not chunk:
+                    break
+                reply += chunk
+    except (OSError, ValueError) as e:
+        for fd in fds:
+            os.close(fd)
+        logger.warning(f"从旧进程接管监听socket失败，重新绑定端口: {e}")
+        return {}
+    logger.info(f"已从旧进程 (pid {header.get('pid')}) 接管 {len(listeners)} 个监听socket")
+    return listeners
+
+
+class HandoffServer(socketserver.ThreadingUnixStreamServer):
+    """在Unix socket上等待新进程接管监听socket"""
+
+    daemon_threads = True
+
+    def __init__(self, path: str, listeners: Callable[[], Dict[int, socket.socket]],
+                 release: Callable[[], None]):
+        self.path = path
+        # 返回当前所有监听socket（端口 -> socket）
+        self.listeners = listeners
+        # 新进程确认收到后调用：停止accept并开始排空
+        self.release = release
+        self.handed_off = False
+        self._lock = threading.Lock()
+        super().__init__(path, HandoffHandler)
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class HandoffHandler(socketserver.StreamRequestHandler):
+    timeout = 10
+
+    def handle(self):
+        server = self.server
+        try:
+            command = self.rfile.readline(64).strip()
+        except OSError:
+            return
+        if command != b'takeover':
+            self._reply({'error': f"未知命令: {command.decode('ascii', 'replace')}"})
+            return
+        with server._lock:
+            if server.handed_off:
+                self._reply({'error': "监听socket已交给其他进程"})
+                return
+            fds = [sock.fileno() for sock in server.listeners().values()]
+            try:
+                self._reply({'pid': os.getpid(), 'count': len(fds)})
+                for i in range(0, len(fds), FDS_PER_MESSAGE):
+                    socket.send_fds(self.request, [b'F'], fds[i:i + FDS_PER_MESSAGE])
+                if self.rfile.readline(64).strip() != b'ok':
+                    return
+            except OSError as e:
+                logger.warning(f"交出监听socket失败: {e}")
+                return
+            server.handed_off = True
+        logger.info(f"{len(fds)} 个监听socket已交给新进程，停止接受新连接")
+        server.release()
+        try:
+            self.request.sendall(b'released\n')
+        except OSError:
+            pass
+
+    def _reply(self, body: dict):
+        try:
+            self.request.sendall(json.dumps(body).encode('utf-8') + b'\n')
+        except OSError:
+            pass
+
+
+def start_handoff_server(path: str, listeners: Callable[[], Dict[int, socket.socket]],
+                         release: Callable[[], None]) -> Optional[HandoffServer]:
+    """在后台线程等待接管请求，path已存在时（上次未正常退出留下的socket文件）先删除"""
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if os.path.exists(path):
+            os.unlink(path)
+        server = HandoffServer(path, listeners, release)
+    except OSError as e:
+        logger.error(f"启动监听交接端点失败 {path}: {e}")
+        return None
+    thread = threading.Thread(target=server.serve_forever, name='handoff', daemon=True)
+    thread.start()
+    logger.info(f"监听交接端点: {path}")
+    return server
@@ -1,15 +1,21 @@
 #!/usr/bin/env python3
 """
 健康检查脚本
-检查代理服务是否正常运行
+检查代理服务是否正常运行。配置了status.socket时向代理的状态端点发送一次请求，
+从内存中取得所有端口的监听、会话和熔断状态，耗时与端口数量无关；
+否则（或使用--probe时）逐个连接端口
 """
 
+import argparse
+import json
 import socket
 import sys
 import yaml
 import time
 import os
 
+from status import query_status
+
 
 def check_port(port: int, timeout: int = 5) -> bool:
     """检查端口是否可连接，并发送最小SSH banner避免服务端错误日志"""
@@ -47,14 +53,96 @@ def check_port(port: int, timeout: int = 5) -> bool:
         return False
 
 
+def load_status(config: dict) -> dict:
+    """读取代理进程写出的状态文件（多worker时为supervisor汇总结果）"""
+    status_file = (config.get('status') or {}).get('file')
+    if not status_file:
+        return {}
+    try:
+        with open(status_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def backend_note(port_stats: dict) -> str:
+    """后端熔断/探测状态说明；设备不可达不影响代理本身的健康结论"""
+    if not port_stats:
+        return ''
+    if port_stats.get('breaker_open'):
+        error = port_stats.get('backend_error')
+        return f"，后端不可达（熔断{port_stats.get('breaker')}{': ' + error if error else ''}）"
+    if port_stats.get('backend_up') is False:
+        return "，后端不可达（后台探测）"
+    return ''
+
+
+def print_status_summary(status: dict):
+    """打印进程级状态：worker存活情况和活跃会话数"""
+    if not status:
+        return
+    age = time.time() - status.get('timestamp', 0)
+    print(f"\n活跃会话: {status.get('active_sessions', 0)}，"
+          f"累计会话: {status.get('total_sessions', 0)}（状态更新于 {age:.0f} 秒前）")
+    workers = status.get('workers')
+    if workers:
+        alive = sum(1 for w in workers if w.get('alive'))
+        restarts = sum(w.get('restarts', 0) for w in workers)
+        print(f"worker进程: {alive}/{len(workers)} 运行中，累计重启 {restarts} 次")
+
+
+def check_listening(enabled_ports: list, health: dict):
+    """按状态端点返回的端口状态判断：端口须在代理中处于监听状态"""
+    port_status = health.get('ports') or {}
+    unhealthy_ports = []
+    broken_backends = []
+    for port in enabled_ports:
+        stats = port_status.get(str(port))
+        if stats and stats.get('listening'):
+            note = backend_note(stats)
+            if note:
+                broken_backends.append(port)
+            print(f"✓ 端口 {port} 健康{note}")
+        else:
+            print(f"✗ 端口 {port} 不可用")
+            unhealthy_ports.append(port)
+    return unhealthy_ports, broken_backends
+
+
+def probe_ports(enabled_ports: list, timeout: int, status: dict):
+    """逐个连接端口（未配置状态端点时）"""
+    port_status = status.get('ports') or {}
+    unhealthy_ports = []
+    broken_backends = []
+    for port in enabled_ports:
+        if check_port(port, timeout=timeout):
+            note = backend_note(port_status.get(str(port)))
+            if note:
+                broken_backends.append(port)
+            print(f"✓ 端口 {port} 健康{note}")
+        else:
+            print(f"✗ 端口 {port} 不可用")
+            unhealthy_ports.append(port)
+    return unhealthy_ports, broken_backends
+
+
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description='代理服务健康检查')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--fast', action='store_true',
+                      help='只查询状态端点（status.socket），不可用时视为不健康')
+    mode.add_argument('--probe', action='store_true', help='逐个连接端口，不使用状态端点')
+    args = parser.parse_args()
+
     # 允许通过环境变量指定配置文件，默认 config.yaml
     config_file = os.environ.get('CONFIG_FILE', 'config.yaml')
 
     try:
+        # 映射很多时配置解析是主要耗时，可用时使用libyaml
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
         with open(config_file, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f) or {}
+            config = yaml.load(f, Loader=loader) or {}
     except Exception as e:
         print(f"错误: 无法加载配置文件: {e}")
         sys.exit(1)
@@ -73,6 +161,11 @@ def main():
         if mapping.get('enabled', False) and mapping.get('host'):
             enabled_ports.append(int(port))
 
+    # 按用户名路由的端口
+    routing = config.get('routing') or {}
+    if routing.get('enabled', False):
+        enabled_ports.append(int(routing.get('port', 4000)))
+
     if not enabled_ports:
         print("警告: 没有启用的端口映射")
         sys.exit(0)
@@ -80,19 +173,30 @@ def main():
     # 读取超时配置（仅影响 socket 检测超时）
     timeout = int(hc_cfg.get('timeout', 5))
 
+    status_socket = (config.get('status') or {}).get('socket')
+    health = None
+    if status_socket and not args.probe:
+        health = query_status(status_socket, timeout=timeout)
+        if health is None and args.fast:
+            print(f"✗ 状态端点无响应: {status_socket}")
+            sys.exit(1)
+    elif args.fast:
+        print("错误: --fast 需要在配置中设置 status.socket")
+        sys.exit(1)
+
     # 检查每个端口
-    all_healthy = True
-    unhealthy_ports = []
+    if health is not None:
+        status = health
+        unhealthy_ports, broken_backends = check_listening(enabled_ports, health)
+    else:
+        status = load_status(config)
+        unhealthy_ports, broken_backends = probe_ports(enabled_ports, timeout, status)
 
-    for port in enabled_ports:
-        if check_port(port, timeout=timeout):
-            print(f"✓ 端口 {port} 健康")
-        else:
-            print(f"✗ 端口 {port} 不可用")
-            all_healthy = False
-            unhealthy_ports.append(port)
+    print_status_summary(status)
+    if broken_backends:
+        print(f"后端不可达的端口: {broken_backends}")
 
-    if all_healthy:
+    if not unhealthy_ports:
         print("\n所有服务健康运行")
         sys.exit(0)
     else:
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+探测历史环形缓冲区
+monitor.py 的每次探测结果以定长记录写入一个固定大小的文件（mmap），写满后覆盖最旧的记录。
+文件大小不随时间增长，监控重启后历史仍在，不需要外部时序数据库即可查询成功率和延迟趋势。
+只支持一个写入进程，读取可以同时进行
+"""
+
+import mmap
+import os
+import struct
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from metrics import Histogram
+
+MAGIC = b'TSPH'
+VERSION = 1
+# magic, version, record_size, capacity, 已写入的记录总数
+HEADER = struct.Struct('<4sHHIQ')
+HEADER_SIZE = 64
+# 时间戳, 延迟(毫秒，失败时为-1), 类型, SSH端口, 目标 "host:port"
+RECORD = struct.Struct('<dfBxH48s')
+
+KIND_SSH = 0
+KIND_BACKEND = 1
+KINDS = {KIND_SSH: 'ssh', KIND_BACKEND: 'backend'}
+
+
+class Sample(NamedTuple):
+    timestamp: float
+    latency_ms: Optional[float]
+    kind: int
+    port: int
+    target: str
+
+    @property
+    def ok(self) -> bool:
+        return self.latency_ms is not None
+
+
+class ProbeHistory:
+    """定长记录的环形缓冲区文件"""
+
+    def __init__(self, path: str, capacity: int = 100000, readonly: bool = False):
+        self.path = path
+        self.readonly = readonly
+        exists = os.path.exists(path) and os.path.getsize(path) >= HEADER_SIZE
+        if readonly and not exists:
+            raise FileNotFoundError(path)
+        if not exists:
+            self._create(path, capacity)
+        self._file = open(path, 'rb' if readonly else 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ if readonly else mmap.ACCESS_WRITE)
+        magic, version, record_size, self.capacity, _ = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            self.close()
+            raise ValueError(f"不是有效的探测历史文件: {path}")
+
+    @staticmethod
+    def _create(path: str, capacity: int):
+        """预先分配整个文件，之后只原地覆盖"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'wb') as f:
+            f.truncate(HEADER_SIZE + capacity * RECORD.size)
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, capacity, 0))
+
+    @property
+    def written(self) -> int:
+        return HEADER.unpack_from(self._map, 0)[4]
+
+    def __len__(self) -> int:
+        return min(self.written, self.capacity)
+
+    def append(self, samples: List[Sample]):
+        """追加一批记录，最后更新记录总数，读取方不会看到写了一半的批次"""
+        written = self.written
+        for sample in samples:
+            offset = HEADER_SIZE + (written % self.capacity) * RECORD.size
+            RECORD.pack_into(
+                self._map, offset, sample.timestamp,
+                -1.0 if sample.latency_ms is None else sample.latency_ms,
+                sample.kind, sample.port, sample.target.encode('utf-8')[:48]
+            )
+            written += 1
+        struct.pack_into('<Q', self._map, HEADER.size - 8, written)
+
+    def __iter__(self) -> Iterator[Sample]:
+        """从旧到新遍历所有记录"""
+        written = self.written
+        count = min(written, self.capacity)
+        for i in range(written - count, written):
+            timestamp, latency, kind, port, target = RECORD.unpack_from(
+                self._map, HEADER_SIZE + (i % self.capacity) * RECORD.size)
+            yield Sample(timestamp, None if latency < 0 else latency, kind, port,
+                         target.rstrip(b'\0').decode('utf-8', 'replace'))
+
+    def since(self, timestamp: float) -> Iterator[Sample]:
+        return (sample for sample in self if sample.timestamp >= timestamp)
+
+    def flush(self):
+        if not self.readonly:
+            self._map.flush()
+
+    def close(self):
+        try:
+            self.flush()
+            self._map.close()
+        finally:
+            self._file.close()
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """已排序列表的分位数（最近秩）"""
+    if not values:
+        return None
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summarize(samples: Iterator[Sample], bucket: Optional[float] = None) -> Dict[tuple, dict]:
+    """
+    按 (类型, 目标) 汇总：探测次数、失败次数、延迟分位数和分桶直方图。
+    指定bucket（秒）时再按时间分段，键为 (类型, 目标, 分段起始时间)，用于查看趋势
+    """
+    groups: Dict[tuple, dict] = {}
+    for sample in samples:
+        key = (KINDS.get(sample.kind, '?'), sample.target)
+        if bucket:
+            key += (sample.timestamp - sample.timestamp % bucket,)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {'probes': 0, 'failures': 0, 'latencies': [], 'last_failure': None,
+                                   'port': sample.port, 'histogram': Histogram()}
+        group['probes'] += 1
+        if sample.ok:
+            group['latencies'].append(sample.latency_ms)
+            group['histogram'].observe(sample.latency_ms / 1000)
+        else:
+            group['failures'] += 1
+            group['last_failure'] = sample.timestamp
+    for group in groups.values():
+        latencies = sorted(group.pop('latencies'))
+        group['p50_ms'] = percentile(latencies, 0.5)
+        group['p90_ms'] = percentile(latencies, 0.9)
+        group['p99_ms'] = percentile(latencies, 0.99)
+        group['histogram'] = group['histogram'].snapshot()
+    return groups
+
+
+def parse_duration(text: str) -> float:
+    """'90s' '15m' '6h' '7d' -> 秒"""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    text = text.strip()
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+SSH主机密钥与算法偏好
+加载或生成Ed25519/ECDSA/RSA主机密钥（可同时提供多种），
+并把配置中的kex/cipher/MAC/主机密钥算法偏好应用到paramiko.Transport
+"""
+
+import logging
+import os
+import socket
+from typing import Dict, List, Optional, Tuple
+
+import paramiko
+
+logger = logging.getLogger(__name__)
+
+KEY_CLASSES = {
+    'ed25519': paramiko.Ed25519Key,
+    'ecdsa': paramiko.ECDSAKey,
+    'rsa': paramiko.RSAKey,
+}
+
+# 配置项 -> paramiko SecurityOptions属性
+ALGORITHM_FIELDS = {
+    'kex': 'kex',
+    'ciphers': 'ciphers',
+    'macs': 'digests',
+    'keys': 'key_types',
+}
+
+
+def generate_host_key(key_type: str, path: str) -> paramiko.PKey:
+    """生成主机密钥并以0600权限保存"""
+    if key_type == 'ed25519':
+        # paramiko不能生成Ed25519密钥，借助cryptography生成OpenSSH格式私钥（只在生成时导入）
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ed25519
+        pem = ed25519.Ed25519PrivateKey.generate().private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.OpenSSH,
+            serialization.NoEncryption()
+        )
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pem)
+        return paramiko.Ed25519Key.from_private_key_file(path)
+    if key_type == 'ecdsa':
+        key = paramiko.ECDSAKey.generate(bits=256)
+    elif key_type == 'rsa':
+        key = paramiko.RSAKey.generate(2048)
+    else:
+        raise ValueError(f"不支持的主机密钥类型: {key_type}")
+    key.write_private_key_file(path)
+    return key
+
+
+def temporary_host_key() -> paramiko.PKey:
+    """只在内存中的临时主机密钥（ECDSA生成只需不到1毫秒），配置的密钥在后台生成期间使用"""
+    return paramiko.ECDSAKey.generate(bits=256)
+
+
+def load_host_key(key_type: str, path: str, generate: bool = True) -> Optional[paramiko.PKey]:
+    """加载主机密钥，不存在或损坏时生成新密钥；generate为False时返回None"""
+    key_class = KEY_CLASSES.get(key_type)
+    if key_class is None:
+        raise ValueError(f"不支持的主机密钥类型: {key_type}")
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if os.path.exists(path):
+        try:
+            key = key_class.from_private_key_file(path)
+            logger.info(f"加载SSH主机密钥({key_type}): {path}")
+            return key
+        except Exception as e:
+            logger.warning(f"加载主机密钥失败: {e}，将生成新密钥")
+    if not generate:
+        return None
+    logger.info(f"生成新的SSH主机密钥({key_type})...")
+    key = generate_host_key(key_type, path)
+    logger.info(f"SSH主机密钥已保存: {path}")
+    return key
+
+
+def host_key_specs(ssh_config: dict) -> List[Tuple[str, str]]:
+    """配置中的主机密钥列表 [(类型, 文件)]；未配置host_keys时沿用单个RSA密钥host_key"""
+    specs = ssh_config.get('host_keys')
+    if not specs:
+        return [('rsa', ssh_config.get('host_key', 'ssh_host_key'))]
+    return [(spec.get('type', 'rsa'), spec['file']) for spec in specs]
+
+
+def load_host_keys(ssh_config: dict, generate: bool = True) -> List[paramiko.PKey]:
+    """按配置加载全部主机密钥，顺序即偏好顺序；generate为False时只返回已存在的密钥（可能为空）"""
+    keys = []
+    for key_type, path in host_key_specs(ssh_config):
+        try:
+            key = load_host_key(key_type, path, generate)
+        except Exception as e:
+            logger.error(f"主机密钥 {path} 不可用: {e}")
+            continue
+        if key is not None:
+            keys.append(key)
+    if not keys and generate:
+        raise RuntimeError("没有可用的SSH主机密钥")
+    return keys
+
+
+def validate_algorithms(algorithms: Optional[dict]) -> Dict[str, Tuple[str, ...]]:
+    """检查算法偏好配置，去掉paramiko不支持的算法；返回SecurityOptions属性 -> 算法元组"""
+    if not algorithms:
+        return {}
+    sock, peer = socket.socketpair()
+    try:
+        # 只用于读取支持的算法列表，不会启动协商线程
+        options = paramiko.Transport(sock).get_security_options()
+        result = {}
+        for key, field in ALGORITHM_FIELDS.items():
+            wanted = algorithms.get(key)
+            if not wanted:
+                continue
+            supported = set(getattr(options, field))
+            unknown = [name for name in wanted if name not in supported]
+            if unknown:
+                logger.warning(f"忽略不支持的{key}算法: {', '.join(unknown)}")
+            names = tuple(name for name in wanted if name in supported)
+            if names:
+                result[field] = names
+            else:
+                logger.warning(f"{key}没有可用的算法，使用默认顺序")
+        return result
+    finally:
+        sock.close()
+        peer.close()
+
+
+def apply_algorithms(transport: paramiko.Transport, algorithms: Dict[str, Tuple[str, ...]]):
+    """在协商开始前设置Transport的算法偏好"""
+    if not algorithms:
+        return
+    options = transport.get_security_options()
+    for field, names in algorithms.items():
+        setattr(options, field, names)
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+会话保活与空闲回收
+SSH客户端休眠、VPN断开或设备在NAT后重启时，TCP连接可能处于半开状态，会话的线程/socket永远不会结束。
+这里集中处理：SSH keepalive、两侧socket的TCP keepalive（TCP_KEEPIDLE/TCP_KEEPINTVL/TCP_KEEPCNT）、
+可选的Telnet NOP保活，以及由一个清扫线程按间隔检查所有会话，断开空闲超时的会话
+"""
+
+import logging
+import socket
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class KeepaliveSettings:
+    """单个映射的保活和空闲超时参数"""
+
+    __slots__ = ('idle_timeout', 'ssh_interval', 'tcp_keepalive', 'tcp_idle', 'tcp_interval', 'tcp_count',
+                 'telnet_nop')
+
+    DEFAULTS = {
+        # 双向都没有数据超过该时长（秒）后断开会话，0为不限制
+        'idle_timeout': 0.0,
+        # 向SSH客户端发送keepalive请求的间隔（秒），0关闭
+        'ssh_interval': 30,
+        'tcp_keepalive': True,
+        # 连接空闲多久后开始TCP keepalive探测、探测间隔和判定断开前的探测次数
+        'tcp_idle': 60,
+        'tcp_interval': 15,
+        'tcp_count': 4,
+        # 会话空闲超过该时长（秒）时向后端发送Telnet NOP，0关闭
+        'telnet_nop': 0.0,
+    }
+
+    def __init__(self, **values):
+        for name, default in self.DEFAULTS.items():
+            value = values.get(name)
+            setattr(self, name, type(default)(value) if value is not None else default)
+        if min(self.tcp_idle, self.tcp_interval, self.tcp_count) <= 0:
+            raise ValueError("tcp_idle、tcp_interval和tcp_count必须大于0")
+
+    @classmethod
+    def from_config(cls, defaults: Optional[dict], mapping: Optional[dict] = None) -> 'KeepaliveSettings':
+        """全局keepalive配置段，再由映射的keepalive覆盖"""
+        values = dict(defaults or {})
+        values.update((mapping or {}).get('keepalive') or {})
+        unknown = set(values) - set(cls.DEFAULTS) - {'sweep_interval'}
+        if unknown:
+            logger.warning(f"忽略未知的keepalive参数: {', '.join(sorted(unknown))}")
+        return cls(**{name: values.get(name) for name in cls.DEFAULTS})
+
+    @property
+    def swept(self) -> bool:
+        """会话是否需要清扫线程定期检查"""
+        return bool(self.idle_timeout or self.telnet_nop)
+
+    def apply(self, sock: socket.socket):
+        """开启TCP keepalive；发送的数据长时间未被确认时同样断开（TCP_USER_TIMEOUT）"""
+        if not self.tcp_keepalive:
+            return
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            if hasattr(socket, 'TCP_KEEPIDLE'):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.tcp_idle)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, self.tcp_interval)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, self.tcp_count)
+            if hasattr(socket, 'TCP_USER_TIMEOUT'):
+                timeout_ms = (self.tcp_idle + self.tcp_interval * self.tcp_count) * 1000
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, timeout_ms)
+        except OSError as e:
+            logger.debug("设置TCP keepalive失败: %s", e)
+
+
+class SessionSweeper:
+    """定期检查所有需要清扫的会话：断开空闲超时的会话，到期时安排Telnet NOP"""
+
+    def __init__(self, interval: float = 5.0):
+        self.interval = interval
+        self.idle_closed = 0
+        self.nops_sent = 0
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> 'SessionSweeper':
+        return cls(interval=max(float((config or {}).get('sweep_interval', 5)), 0.1))
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._sweep_loop, name='sweeper', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        self._wakeup.set()
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def add(self, session):
+        with self._lock:
+            self._sessions.add(session)
+
+    def discard(self, session):
+        with self._lock:
+            self._sessions.discard(session)
+
+    def sweep(self):
+        """检查一遍所有会话（在清扫线程中调用）"""
+        now = time.monotonic()
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            try:
+                action = session.sweep(now)
+            except Exception as e:
+                logger.debug("检查会话失败: %s", e)
+                continue
+            if action == 'idle':
+                self.idle_closed += 1
+                self.discard(session)
+            elif action == 'nop':
+                self.nops_sent += 1
+
+    def stats(self) -> dict:
+        return {
+            'tracked': len(self._sessions),
+            'idle_closed': self.idle_closed,
+            'nops_sent': self.nops_sent,
+        }
+
+    def _sweep_loop(self):
+        me = threading.current_thread()
+        while self._thread is me:
+            self._wakeup.wait(self.interval)
+            if self._thread is not me:
+                return
+            self.sweep()
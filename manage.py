@@ -1,14 +1,23 @@
 #!/usr/bin/env python3
 """
 Telnet to SSH Proxy 管理工具
-用于管理端口映射配置
+用于管理端口映射配置、生成主机密钥、回放和导出会话录像
 """
 
 import yaml
+import re
 import sys
+import time
+import json
 import argparse
+import os
 from typing import Dict, Optional
 
+from recorder import read_recording
+
+# 导出纯文本时去除的终端控制序列（CSI、OSC及单字符转义）
+ANSI_ESCAPE = re.compile(r'\x1b(?:\[[0-?]*[ -/]*[@-~]|\][^\x07\x1b]*(?:\x07|\x1b\\)|[@-Z\\-_])')
+
 
 class ConfigManager:
     """配置管理器"""
@@ -150,6 +159,62 @@ class ConfigManager:
         return True
 
 
+def replay_recording(path: str, speed: float = 1.0, max_idle: Optional[float] = 2.0):
+    """按原始节奏把录像输出回放到当前终端"""
+    header, events = read_recording(path)
+    print(f"回放 {path} ({header.get('width')}x{header.get('height')}，Ctrl+C 退出)")
+    last = 0.0
+    try:
+        for at, kind, data in events:
+            if kind != 'o':
+                continue
+            delay = at - last
+            if max_idle is not None:
+                delay = min(delay, max_idle)
+            if delay > 0:
+                time.sleep(delay / speed)
+            last = at
+            sys.stdout.write(data)
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    print()
+
+
+def generate_host_keys(ssh_config: dict, force: bool = False):
+    """安装时生成配置的SSH主机密钥，代理首次启动时不必再生成；已存在的密钥保留，除非指定force"""
+    # paramiko导入较慢，只在需要时导入
+    from auth import fingerprint
+    from host_keys import generate_host_key, host_key_specs, load_host_key
+    
+    for key_type, path in host_key_specs(ssh_config):
+        key = None if force else load_host_key(key_type, path, generate=False)
+        action = '已存在'
+        if key is None:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            key = generate_host_key(key_type, path)
+            action = '已生成'
+        print(f"{action} {key_type:<8} {path}  {fingerprint(key.asbytes())}")
+
+
+def export_recording(path: str, output: Optional[str], fmt: str = 'text'):
+    """导出录像：text为去除控制序列的纯文本，cast为未压缩的asciicast"""
+    header, events = read_recording(path)
+    out = open(output, 'w', encoding='utf-8') if output else sys.stdout
+    try:
+        if fmt == 'cast':
+            out.write(json.dumps(header, ensure_ascii=False) + '\n')
+            for event in events:
+                out.write(json.dumps(event, ensure_ascii=False) + '\n')
+        else:
+            text = ''.join(data for _, kind, data in events if kind == 'o')
+            out.write(ANSI_ESCAPE.sub('', text).replace('\r\n', '\n'))
+    finally:
+        if output:
+            out.close()
+            print(f"录像已导出到 {output}")
+
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(
@@ -174,6 +239,15 @@ def main():
 
   # 查看映射详情
   python manage.py show 4001
+
+  # 回放会话录像（2倍速）
+  python manage.py replay /app/data/recordings/4001/xxx.cast.gz --speed 2
+
+  # 导出录像为纯文本
+  python manage.py export /app/data/recordings/4001/xxx.cast.gz -o session.txt
+
+  # 安装时预先生成SSH主机密钥
+  python manage.py keygen
         """
     )
     
@@ -212,12 +286,41 @@ def main():
     show_parser = subparsers.add_parser('show', help='显示端口映射详情')
     show_parser.add_argument('ssh_port', type=int, help='SSH端口')
     
+    # replay命令
+    replay_parser = subparsers.add_parser('replay', help='回放会话录像')
+    replay_parser.add_argument('file', help='录像文件 (.cast/.cast.gz/.cast.zst)')
+    replay_parser.add_argument('--speed', type=float, default=1.0, help='回放速度倍数')
+    replay_parser.add_argument('--max-idle', type=float, default=2.0, help='最长空闲等待秒数')
+    
+    # export命令
+    export_parser = subparsers.add_parser('export', help='导出会话录像')
+    export_parser.add_argument('file', help='录像文件 (.cast/.cast.gz/.cast.zst)')
+    export_parser.add_argument('-o', '--output', help='输出文件（默认标准输出）')
+    export_parser.add_argument('--format', choices=['text', 'cast'], default='text',
+                               help='text: 纯文本; cast: 未压缩的asciicast')
+    
+    # keygen命令
+    keygen_parser = subparsers.add_parser('keygen', help='生成配置的SSH主机密钥（已存在的保留）')
+    keygen_parser.add_argument('--force', action='store_true', help='重新生成已存在的密钥（客户端会看到主机密钥变化）')
+    
     args = parser.parse_args()
     
     if not args.command:
         parser.print_help()
         sys.exit(1)
     
+    # 录像命令不需要读取配置文件
+    try:
+        if args.command == 'replay':
+            replay_recording(args.file, args.speed, args.max_idle)
+            return
+        if args.command == 'export':
+            export_recording(args.file, args.output, args.format)
+            return
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"错误: 无法读取录像文件: {e}")
+        sys.exit(1)
+    
     manager = ConfigManager(args.config)
     manager.load()
     
@@ -244,6 +347,9 @@ def main():
     
     elif args.command == 'show':
         manager.show_mapping(args.ssh_port)
+    
+    elif args.command == 'keygen':
+        generate_host_keys(manager.config.get('ssh') or {}, args.force)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Prometheus指标
+把ProxyManager.snapshot()（或supervisor汇总后的状态）渲染为Prometheus文本格式，
+并通过内置HTTP服务提供 /metrics。转发路径上的字节计数由各会话单线程累加，
+只在抓取时汇总，不在转发路径上加锁
+"""
+
+import logging
+import threading
+from typing import TYPE_CHECKING, Callable, Iterable, Optional
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'telnet_ssh_proxy'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 握手和后端连接耗时的直方图分桶（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """累计分桶直方图，快照为可JSON序列化、可被merge_counters合并的字典"""
+
+    def __init__(self, buckets: Iterable[float] = DURATION_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """记录一次观测值"""
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            buckets = {}
+            total = 0
+            for bound, count in zip(self.buckets, self.counts):
+                total += count
+                buckets[_format_value(bound)] = total
+            buckets['+Inf'] = self.count
+            return {'buckets': buckets, 'sum': self.sum, 'count': self.count}
+
+
+def _format_value(value) -> str:
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ''
+    items = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    return '{' + items + '}'
+
+
+class _Writer:
+    def __init__(self):
+        self.lines = []
+        self._declared = set()
+
+    def declare(self, name: str, kind: str, help_text: str):
+        if name not in self._declared:
+            self._declared.add(name)
+            self.lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            self.lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+    def sample(self, name: str, value, **labels):
+        self.lines.append(f"{PREFIX}_{name}{_labels(**labels)} {_format_value(value)}")
+
+    def histogram(self, name: str, data: Optional[dict], **labels):
+        if not data:
+            return
+        for bound, count in data.get('buckets', {}).items():
+            self.lines.append(f"{PREFIX}_{name}_bucket{_labels(le=bound, **labels)} {count}")
+        self.sample(f"{name}_sum", data.get('sum', 0.0), **labels)
+        self.sample(f"{name}_count", data.get('count', 0), **labels)
+
+
+# (快照字段, 指标名, 类型, 说明)
+PORT_METRICS = (
+    ('listening', 'listening', 'gauge', '端口是否在监听'),
+    ('active_sessions', 'active_sessions', 'gauge', '当前SSH会话数'),
+    ('handshakes', 'handshakes_in_progress', 'gauge', '正在进行的SSH握手/认证数'),
+    ('total_sessions', 'sessions_total', 'counter', '累计SSH会话数'),
+    ('auth_failures', 'auth_failures_total', 'counter', '认证失败次数'),
+    ('backend_failures', 'backend_connect_failures_total', 'counter', '连接Telnet后端失败次数'),
+    ('breaker_open', 'backend_breaker_open', 'gauge', '后端熔断器是否打开'),
+    ('breaker_trips', 'backend_breaker_trips_total', 'counter', '后端熔断器打开次数'),
+    ('breaker_rejected', 'backend_breaker_rejected_total', 'counter', '熔断期间被立即拒绝的会话数'),
+    ('unreachable_rejected', 'backend_unreachable_rejected_total', 'counter', '后台探测确认后端不可达而被立即拒绝的会话数'),
+)
+
+PORT_HISTOGRAMS = (
+    ('handshake_seconds', 'handshake_duration_seconds', 'SSH握手（密钥交换）耗时'),
+    ('backend_connect_seconds', 'backend_connect_duration_seconds', '连接Telnet后端耗时'),
+)
+
+
+def render(status: dict) -> str:
+    """把状态快照渲染为Prometheus文本格式"""
+    out = _Writer()
+    out.declare('up', 'gauge', '代理进程是否在运行')
+    out.sample('up', 1)
+    out.declare('threads', 'gauge', '代理进程线程数（多worker时为总和）')
+    out.sample('threads', status.get('threads', 0))
+    out.declare('draining', 'gauge', '是否正在排空（停止接受新连接，等待会话结束）')
+    out.sample('draining', bool(status.get('draining')))
+
+    workers = status.get('workers')
+    if workers is not None:
+        out.declare('workers_alive', 'gauge', '存活的worker进程数')
+        out.sample('workers_alive', sum(1 for w in workers if w.get('alive')))
+        out.declare('worker_restarts_total', 'counter', 'worker进程重启次数')
+        for w in workers:
+            out.sample('worker_restarts_total', w.get('restarts', 0), worker=w.get('worker'))
+
+    ports = status.get('ports') or {}
+    for key, name, kind, help_text in PORT_METRICS:
+        out.declare(name, kind, help_text)
+        for port, stats in ports.items():
+            out.sample(name, stats.get(key, 0), port=port)
+
+    out.declare('bytes_total', 'counter', '转发字节数')
+    for port, stats in ports.items():
+        out.sample('bytes_total', stats.get('bytes_in', 0), port=port, direction='ssh_to_telnet')
+        out.sample('bytes_total', stats.get('bytes_out', 0), port=port, direction='telnet_to_ssh')
+
+    out.declare('sessions_closed_total', 'counter', '按结束原因统计的会话数（client/backend/error/idle/shutdown）')
+    for port, stats in ports.items():
+        for reason, count in (stats.get('sessions_closed') or {}).items():
+            out.sample('sessions_closed_total', count, port=port, reason=reason)
+
+    for key, name, help_text in PORT_HISTOGRAMS:
+        out.declare(name, 'histogram', help_text)
+        for port, stats in ports.items():
+            out.histogram(name, stats.get(key), port=port)
+
+    admission = status.get('admission')
+    if admission:
+        out.declare('admission_pending', 'gauge', '占用准入槽位正在握手的连接数')
+        out.sample('admission_pending', admission.get('pending', 0))
+        out.declare('admission_queued', 'gauge', '排队等待握手的连接数')
+        out.sample('admission_queued', admission.get('queued', 0))
+        out.declare('admission_rejected_total', 'counter', '被准入控制拒绝的连接数')
+        for reason, count in (admission.get('rejected') or {}).items():
+            out.sample('admission_rejected_total', count, reason=reason)
+
+    prober = status.get('prober')
+    if prober:
+        backends = prober.get('backends') or {}
+        out.declare('backend_up', 'gauge', '后台探测的后端是否可达（尚未探测的后端不输出）')
+        for backend, state in backends.items():
+            if state.get('up') is not None:
+                out.sample('backend_up', state['up'], backend=backend)
+        out.declare('backend_probe_latency_seconds', 'gauge', '最近一次成功探测的后端连接耗时')
+        for backend, state in backends.items():
+            if state.get('latency_ms') is not None:
+                out.sample('backend_probe_latency_seconds', state['latency_ms'] / 1000, backend=backend)
+        out.declare('backend_probes_total', 'counter', '后台探测次数')
+        out.sample('backend_probes_total', prober.get('probes', 0))
+        out.declare('backend_probe_failures_total', 'counter', '后台探测失败次数')
+        out.sample('backend_probe_failures_total', prober.get('probe_failures', 0))
+
+    sweeper = status.get('sweeper')
+    if sweeper:
+        out.declare('idle_sessions_closed_total', 'counter', '空闲超时被断开的会话数')
+        out.sample('idle_sessions_closed_total', sweeper.get('idle_closed', 0))
+        out.declare('telnet_nops_sent_total', 'counter', '发送的Telnet NOP保活次数')
+        out.sample('telnet_nops_sent_total', sweeper.get('nops_sent', 0))
+
+    recording = status.get('recording')
+    if recording:
+        out.declare('recording_active', 'gauge', '正在录像的会话数')
+        out.sample('recording_active', recording.get('active', 0))
+        out.declare('recording_dropped_bytes_total', 'counter', '录像缓冲区满时丢弃的字节数')
+        out.sample('recording_dropped_bytes_total', recording.get('dropped_bytes', 0))
+
+    return '\n'.join(out.lines) + '\n'
+
+
+def start_metrics_server(host: str, port: int, collect: Callable[[], dict]) -> Optional['ThreadingHTTPServer']:
+    """在后台线程提供 /metrics，collect在每次抓取时返回最新状态"""
+    # 未启用指标时不导入http.server，缩短启动时间
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            try:
+                body = render(collect()).encode('utf-8')
+            except Exception as e:
+                logger.error(f"生成指标失败: {e}")
+                self.send_error(500)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(f"metrics {self.address_string()} {format % args}")
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        logger.error(f"启动指标服务失败 {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    logger.info(f"Prometheus指标: http://{host}:{port}/metrics")
+    return server
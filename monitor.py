@@ -1,15 +1,24 @@
 #!/usr/bin/env python3
 """
 监控脚本 - 持续监控代理服务状态
+SSH监听端口和Telnet后端并发探测，一轮耗时约为一次连接超时而不是端口数乘以超时；
+代理启用了后台探测（prober.py）时后端状态直接取自代理，不再重复连接设备；
+探测结果写入固定大小的环形缓冲区文件（history.py），监控重启后可查询成功率和延迟趋势
 """
 
+import json
 import socket
 import yaml
 import time
 import sys
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
+
+from history import KIND_BACKEND, KIND_SSH, ProbeHistory, Sample, parse_duration, summarize
+from resolver import parse_backends
+from status import query_status
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,6 +34,10 @@ class ProxyMonitor:
         self.config_file = config_file
         self.config = None
         self.stats: Dict[int, Dict] = {}
+        # 最近一轮的连接延迟（毫秒，失败为None）：SSH端口 -> 延迟，后端 "host:port" -> 延迟
+        self.latency: Dict[int, Optional[float]] = {}
+        self.backend_latency: Dict[str, Optional[float]] = {}
+        self.history: Optional[ProbeHistory] = None
         
     def load_config(self):
         """加载配置"""
@@ -35,16 +48,66 @@ class ProxyMonitor:
             logger.error(f"加载配置文件失败: {e}")
             sys.exit(1)
     
+    def settings(self) -> dict:
+        """monitor配置段"""
+        return self.config.get('monitor') or {}
+    
+    def open_history(self):
+        """按配置打开探测历史文件（只打开一次）"""
+        path = self.settings().get('history')
+        if not path or self.history is not None:
+            return
+        try:
+            self.history = ProbeHistory(path, int(self.settings().get('history_size', 100000)))
+        except (OSError, ValueError) as e:
+            logger.error(f"打开探测历史失败 {path}: {e}")
+    
+    @staticmethod
+    def probe(host: str, port: int, timeout: float = 5) -> Optional[float]:
+        """建立一次TCP连接，返回连接耗时（毫秒），失败返回None"""
+        started = time.perf_counter()
+        try:
+            sock = socket.create_connection((host, port), timeout=timeout)
+        except OSError:
+            return None
+        latency = (time.perf_counter() - started) * 1000
+        sock.close()
+        return latency
+    
     def check_port(self, port: int, timeout: int = 5) -> bool:
         """检查端口是否可连接"""
+        return self.probe('127.0.0.1', port, timeout) is not None
+    
+    def load_proxy_status(self) -> Dict:
+        """从状态端点读取代理的当前状态，未配置或无响应时读取状态文件（多worker时均为汇总结果）"""
+        status_config = self.config.get('status') or {}
+        if status_config.get('socket'):
+            status = query_status(status_config['socket'], 'status')
+            if status is not None:
+                return status
+        status_file = status_config.get('file')
+        if not status_file:
+            return {}
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(timeout)
-            result = sock.connect_ex(('127.0.0.1', port))
-            sock.close()
-            return result == 0
-        except:
-            return False
+            with open(status_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def mapping(self, port: int) -> dict:
+        mappings = self.config.get('mappings') or {}
+        return mappings.get(port) or mappings.get(str(port)) or {}
+    
+    def get_backends(self) -> Dict[str, Tuple[int, str, int]]:
+        """已启用映射的后端（含备用后端）: "host:port" -> (SSH端口, host, port)"""
+        backends = {}
+        for port in self.get_enabled_ports():
+            mapping = self.mapping(port)
+            if not mapping:
+                continue
+            for host, backend_port in parse_backends(mapping):
+                backends.setdefault(f"{host}:{backend_port}", (port, host, backend_port))
+        return backends
     
     def get_enabled_ports(self) -> List[int]:
         """获取所有启用的端口"""
@@ -53,15 +116,54 @@ class ProxyMonitor:
         for port, mapping in mappings.items():
             if mapping.get('enabled', False) and mapping.get('host'):
                 ports.append(int(port))
+        if self.routing_port() is not None:
+            ports.append(self.routing_port())
         return sorted(ports)
     
+    def routing_port(self) -> Optional[int]:
+        """按用户名路由的端口，未启用时为None"""
+        routing = self.config.get('routing') or {}
+        if not routing.get('enabled', False):
+            return None
+        return int(routing.get('port', 4000))
+    
     def check_all_ports(self) -> Dict[int, bool]:
-        """检查所有端口状态"""
-        results = {}
+        """并发探测所有SSH端口（及后端），返回各SSH端口是否可连接"""
+        settings = self.settings()
+        timeout = float(settings.get('timeout', 5))
         ports = self.get_enabled_ports()
+        backends = self.get_backends() if settings.get('backends', True) else {}
+        # 代理启用了后台探测（prober）时直接采用其结果，不再自行连接设备
+        probed = (self.load_proxy_status().get('prober') or {}).get('backends') or {}
+        jobs = [(KIND_SSH, port, '127.0.0.1', port) for port in ports]
+        jobs.extend((KIND_BACKEND, port, host, backend_port) for target, (port, host, backend_port) in backends.items()
+                    if (probed.get(target) or {}).get('up') is None)
         
+        workers = max(min(int(settings.get('workers', 64)), len(jobs)), 1)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='probe') as pool:
+            latencies = list(pool.map(lambda job: self.probe(job[2], job[3], timeout), jobs))
+        
+        now = time.time()
+        samples = []
+        self.backend_latency = {}
+        for target, (port, host, backend_port) in backends.items():
+            state = probed.get(target) or {}
+            if state.get('up') is not None:
+                latency = state.get('latency_ms') if state['up'] else None
+                samples.append(Sample(state.get('checked') or now, latency, KIND_BACKEND, port, target))
+                self.backend_latency[target] = latency
+        for (kind, port, host, target_port), latency in zip(jobs, latencies):
+            samples.append(Sample(now, latency, kind, port, f"{host}:{target_port}"))
+            if kind == KIND_SSH:
+                self.latency[port] = latency
+            else:
+                self.backend_latency[f"{host}:{target_port}"] = latency
+        if self.history is not None:
+            self.history.append(samples)
+        
+        results = {}
         for port in ports:
-            results[port] = self.check_port(port)
+            results[port] = self.latency[port] is not None
             
             # 更新统计信息
             if port not in self.stats:
@@ -89,36 +191,58 @@ class ProxyMonitor:
     
     def print_status(self, results: Dict[int, bool]):
         """打印状态报告"""
-        mappings = self.config.get('mappings', {})
-        
-        print("\n" + "="*80)
+        print("\n" + "="*100)
         print(f"监控报告 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print("="*80)
+        print("="*100)
         
         # 显示当前状态
         healthy_count = sum(1 for v in results.values() if v)
         total_count = len(results)
         
         print(f"\n总体状态: {healthy_count}/{total_count} 服务健康")
-        print(f"\n{'端口':<8} {'状态':<10} {'目标地址':<30} {'描述':<20}")
-        print("-"*80)
+        
+        proxy_status = self.load_proxy_status()
+        port_status = proxy_status.get('ports', {})
+        if proxy_status:
+            line = f"活跃会话: {proxy_status.get('active_sessions', 0)}"
+            workers = proxy_status.get('workers')
+            if workers:
+                alive = sum(1 for w in workers if w.get('alive'))
+                line += f"  worker进程: {alive}/{len(workers)}"
+            print(line)
+        
+        print(f"\n{'端口':<8} {'状态':<10} {'延迟':<8} {'会话':<6} {'后端':<10} {'后端探测':<10} "
+              f"{'目标地址':<24} {'描述':<20}")
+        print("-"*100)
         
         for port in sorted(results.keys()):
             status = "✓ 健康" if results[port] else "✗ 异常"
-            mapping = mappings.get(str(port), {})
+            mapping = self.mapping(port)
             target = f"{mapping.get('host', '')}:{mapping.get('port', 23)}"
             desc = mapping.get('description', '')
+            latency = format_latency(self.latency.get(port))
+            probed = format_latency(self.backend_latency.get(target)) if target in self.backend_latency else '-'
+            if port == self.routing_port():
+                # 按用户名路由的端口
+                target = "按用户名路由"
+                desc = f"{port_status.get(str(port), {}).get('devices', '-')} 台设备"
             
             # 连续失败警告
             if self.stats[port]['consecutive_fails'] >= 3:
                 status += f" (连续失败{self.stats[port]['consecutive_fails']}次)"
             
-            print(f"{port:<8} {status:<10} {target:<30} {desc:<20}")
+            stats = port_status.get(str(port), {})
+            sessions = stats.get('active_sessions', '-')
+            # 后端熔断器状态: closed | open | half-open
+            backend = stats.get('breaker', '-')
+            
+            print(f"{port:<8} {status:<10} {latency:<8} {sessions:<6} {backend:<10} {probed:<10} "
+                  f"{target:<24} {desc:<20}")
         
         # 显示统计信息
         if self.stats:
             print("\n统计信息:")
-            print("-"*80)
+            print("-"*100)
             for port in sorted(self.stats.keys()):
                 stat = self.stats[port]
                 success_rate = (stat['success_count'] / stat['total_checks'] * 100) if stat['total_checks'] > 0 else 0
@@ -127,11 +251,12 @@ class ProxyMonitor:
                       f"({stat['success_count']}/{stat['total_checks']}) "
                       f"失败 {stat['fail_count']}次")
         
-        print("="*80)
+        print("="*100)
     
     def run_once(self):
         """执行一次检查"""
         self.load_config()
+        self.open_history()
         results = self.check_all_ports()
         self.print_status(results)
         
@@ -146,6 +271,7 @@ class ProxyMonitor:
         try:
             while True:
                 self.load_config()
+                self.open_history()
                 results = self.check_all_ports()
                 self.print_status(results)
                 
@@ -153,12 +279,22 @@ class ProxyMonitor:
                 for port, stat in self.stats.items():
                     if stat['consecutive_fails'] >= 3:
                         logger.warning(f"告警: 端口 {port} 连续失败 {stat['consecutive_fails']} 次!")
+                for target, latency in self.backend_latency.items():
+                    if latency is None:
+                        logger.warning(f"告警: 后端 {target} 无法连接")
+                for port, stats in (self.load_proxy_status().get('ports') or {}).items():
+                    if stats.get('breaker_open'):
+                        logger.warning(f"告警: 端口 {port} 的后端 {stats.get('target')} 不可达，熔断器已打开: "
+                                       f"{stats.get('backend_error') or ''}")
                 
                 time.sleep(interval)
                 
         except KeyboardInterrupt:
             logger.info("\n监控已停止")
             self.print_summary()
+        finally:
+            if self.history is not None:
+                self.history.close()
     
     def print_summary(self):
         """打印汇总统计"""
@@ -183,6 +319,45 @@ class ProxyMonitor:
         
         print("="*80)
 
+    def print_history(self, since: str = '24h', bucket: Optional[str] = None, target: Optional[str] = None):
+        """从探测历史文件汇总各目标的可用率和连接延迟，指定bucket时按时间分段显示趋势"""
+        path = self.settings().get('history')
+        if not path:
+            print("未配置探测历史文件 (monitor.history)")
+            return
+        try:
+            history = ProbeHistory(path, readonly=True)
+        except (OSError, ValueError) as e:
+            print(f"无法读取探测历史: {e}")
+            return
+        try:
+            start = time.time() - parse_duration(since)
+            samples = (sample for sample in history.since(start) if target is None or target in sample.target)
+            groups = summarize(samples, parse_duration(bucket) if bucket else None)
+            print(f"\n探测历史 - 最近 {since}（文件共 {len(history)}/{history.capacity} 条记录）")
+        finally:
+            history.close()
+        
+        print("=" * 100)
+        print(f"{'类型':<8} {'目标':<24} {'时间段':<17} {'探测':<6} {'失败':<6} {'可用率':<8} "
+              f"{'p50':<8} {'p90':<8} {'p99':<8}")
+        print("-" * 100)
+        for key in sorted(groups):
+            group = groups[key]
+            period = datetime.fromtimestamp(key[2]).strftime('%m-%d %H:%M') if len(key) > 2 else '全部'
+            availability = (group['probes'] - group['failures']) / group['probes'] * 100
+            print(f"{key[0]:<8} {key[1]:<24} {period:<17} {group['probes']:<6} {group['failures']:<6} "
+                  f"{availability:<8.1f} {format_latency(group['p50_ms']):<8} "
+                  f"{format_latency(group['p90_ms']):<8} {format_latency(group['p99_ms']):<8}")
+        print("=" * 100)
+
+
+def format_latency(latency: Optional[float]) -> str:
+    """毫秒延迟的显示，失败或无数据时为 -"""
+    if latency is None:
+        return '-'
+    return f"{latency:.1f}ms"
+
 
 def main():
     """主函数"""
@@ -205,12 +380,23 @@ def main():
         default=30,
         help='持续监控的检查间隔（秒）'
     )
+    parser.add_argument(
+        '--history',
+        action='store_true',
+        help='查询探测历史（monitor.history）中各目标的可用率和延迟'
+    )
+    parser.add_argument('--since', default='24h', help='查询的时间范围，如 90m、24h、7d')
+    parser.add_argument('--bucket', help='按时间分段显示趋势，如 1h')
+    parser.add_argument('--target', help='只显示目标地址包含该字符串的记录')
     
     args = parser.parse_args()
     
     monitor = ProxyMonitor(args.config)
     
-    if args.continuous:
+    if args.history:
+        monitor.load_config()
+        monitor.print_history(args.since, args.bucket, args.target)
+    elif args.continuous:
         monitor.run_continuous(args.interval)
     else:
         all_healthy = monitor.run_once()
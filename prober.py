@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+后端可达性探测
+代理进程在后台按带随机抖动的间隔探测所有已启用映射的后端，有界线程池限制同时进行的探测数，
+结果缓存为 up/down/延迟 表：新会话认证后先查表，已知不可达的设备立即提示，不再等待连接超时；
+同一张表写入状态快照和Prometheus指标，外部监控不必再自行连接设备。
+有会话正连接着的后端视为可达且不探测：只接受一个连接的设备不会被探测占用，也不会因为正在使用而被标记为不可达。
+默认关闭，需在配置中启用
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from resolver import BackendResolver, connect_first, interleave
+
+if TYPE_CHECKING:
+    from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+Backend = Tuple[str, int]
+
+
+class BackendState:
+    """一个后端的最近探测结果"""
+
+    __slots__ = ('up', 'latency_ms', 'checked', 'changed', 'failures', 'error', 'due', 'probing')
+
+    def __init__(self, due: float):
+        # None表示尚未探测
+        self.up: Optional[bool] = None
+        self.latency_ms: Optional[float] = None
+        # 最近一次探测和状态变化的时间（time.time()，便于写入状态文件）
+        self.checked: Optional[float] = None
+        self.changed: Optional[float] = None
+        # 连续探测失败次数
+        self.failures = 0
+        self.error: Optional[str] = None
+        # 下一次探测的时间（time.monotonic()）
+        self.due = due
+        self.probing = False
+
+    def snapshot(self) -> dict:
+        return {
+            'up': self.up,
+            'latency_ms': self.latency_ms,
+            'checked': self.checked,
+            'changed': self.changed,
+            'failures': self.failures,
+            'error': self.error,
+        }
+
+
+class BackendProber:
+    """后台探测所有后端并缓存结果"""
+
+    DEFAULTS = {
+        'enabled': False,
+        # 正常后端的探测间隔（秒）
+        'interval': 30.0,
+        # 不可达后端的探测间隔（秒），恢复后尽快放行会话
+        'down_interval': 10.0,
+        # 每次间隔在 ±jitter 比例内随机，避免所有后端同时被探测
+        'jitter': 0.2,
+        # 单次探测的连接超时（秒）
+        'timeout': 3.0,
+        # 同时进行的探测数
+        'workers': 16,
+        # 连续失败多少次后视为不可达
+        'failure_threshold': 2,
+    }
+
+    def __init__(self, resolver: BackendResolver, interval: float = 30.0, down_interval: float = 10.0,
+                 jitter: float = 0.2, timeout: float = 3.0, workers: int = 16, failure_threshold: int = 2):
+        # 探测使用与会话相同的地址缓存
+        self.resolver = resolver
+        self.interval = interval
+        self.down_interval = down_interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self.workers = workers
+        self.failure_threshold = failure_threshold
+        self.probes = 0
+        self.probe_failures = 0
+        self._states: Dict[Backend, BackendState] = {}
+        # 后端 -> 正连接着该后端的会话数，与是否探测该后端无关，热重载时保留
+        self._sessions: Dict[Backend, int] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pool: Optional['ThreadPoolExecutor'] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[dict], resolver: BackendResolver) -> Optional['BackendProber']:
+        """未配置prober段或enabled不为true时返回None"""
+        if config is None:
+            return None
+        values = dict(cls.DEFAULTS)
+        values.update(config)
+        if not values['enabled']:
+            return None
+        return cls(
+            resolver,
+            interval=max(float(values['interval']), 1.0),
+            down_interval=max(float(values['down_interval']), 1.0),
+            jitter=min(max(float(values['jitter']), 0.0), 1.0),
+            timeout=float(values['timeout']),
+            workers=max(int(values['workers']), 1),
+            failure_threshold=max(int(values['failure_threshold']), 1),
+        )
+
+    def configure(self, other: 'BackendProber'):
+        """热重载时采用新的参数（workers需要重启才生效），已有的探测结果保留"""
+        self.interval = other.interval
+        self.down_interval = other.down_interval
+        self.jitter = other.jitter
+        self.timeout = other.timeout
+        self.failure_threshold = other.failure_threshold
+
+    def start(self):
+        """启动调度线程"""
+        if self._thread is None:
+            # 探测默认关闭，只在启用时导入线程池
+            from concurrent.futures import ThreadPoolExecutor
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='prober')
+            self._thread = threading.Thread(target=self._schedule_loop, name='prober', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        self._wakeup.set()
+        if thread is not None:
+            thread.join(timeout=5)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def track(self, backends: Iterable[Backend]):
+        """设置需要探测的后端（配置加载或重载时调用）；新后端在一个抖动窗口内陆续完成首次探测"""
+        backends = set(backends)
+        now = time.monotonic()
+        with self._lock:
+            for backend in list(self._states):
+                if backend not in backends:
+                    del self._states[backend]
+            for backend in backends:
+                if backend not in self._states:
+                    self._states[backend] = BackendState(now + random.uniform(0, self.interval * self.jitter))
+        self._wakeup.set()
+
+    def available(self, backends: List[Backend]) -> Optional[bool]:
+        """任一后端可达（或有会话正连接着）为True，全部已知不可达为False，尚无探测结果为None"""
+        if any(self._sessions.get(backend) for backend in backends):
+            return True
+        states = [self._states.get(backend) for backend in backends]
+        if any(state is not None and state.up for state in states):
+            return True
+        if states and all(state is not None and state.up is False for state in states):
+            return False
+        return None
+
+    def message(self, name: str, backends: List[Backend]) -> Optional[str]:
+        """所有后端都已知不可达时返回发给SSH客户端的提示，否则为None"""
+        if self.available(backends) is not False:
+            return None
+        state = self._states.get(backends[0])
+        ago = time.time() - (state.checked or time.time()) if state is not None else 0
+        error = f": {state.error}" if state is not None and state.error else ''
+        return (f"错误: 设备 {name} 当前不可达（{ago:.0f} 秒前探测失败{error}），"
+                f"恢复后即可连接，请稍后再试\r\n")
+
+    def record(self, backend: Backend, latency_ms: float):
+        """会话成功连接后端时更新结果，不必等下一次探测即可恢复为可达"""
+        state = self._states.get(backend)
+        if state is None:
+            return
+        with self._lock:
+            recovered = state.up is False
+            self._set_up(state, latency_ms)
+        if recovered:
+            logger.info(f"后端 {backend[0]}:{backend[1]} 已恢复（会话连接成功）")
+
+    def session_opened(self, backend: Backend):
+        """会话连接到后端后调用，会话期间不探测该后端"""
+        with self._lock:
+            self._sessions[backend] = self._sessions.get(backend, 0) + 1
+
+    def session_closed(self, backend: Backend):
+        with self._lock:
+            count = self._sessions.get(backend, 0) - 1
+            if count > 0:
+                self._sessions[backend] = count
+            else:
+                self._sessions.pop(backend, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            backends = {f"{host}:{port}": state.snapshot() for (host, port), state in self._states.items()}
+        return {
+            'backends': backends,
+            'down': sum(1 for state in backends.values() if state['up'] is False),
+            'probes': self.probes,
+            'probe_failures': self.probe_failures,
+        }
+
+    def _delay(self, down: bool) -> float:
+        base = self.down_interval if down else self.interval
+        return base * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    @staticmethod
+    def _set_up(state: BackendState, latency_ms: float):
+        if state.up is not True:
+            state.changed = time.time()
+        state.up = True
+        state.latency_ms = latency_ms
+        state.failures = 0
+        state.error = None
+        state.checked = time.time()
+
+    def _schedule_loop(self):
+        me = threading.current_thread()
+        while self._thread is me:
+            now = time.monotonic()
+            due = []
+            wait = 1.0
+            with self._lock:
+                for backend, state in self._states.items():
+                    if state.probing:
+                        continue
+                    if state.due <= now and self._sessions.get(backend):
+                        # 会话本身说明后端可达，探测反而可能占用设备唯一的连接
+                        state.due = now + self._delay(False)
+                    elif state.due <= now:
+                        state.probing = True
+                        due.append(backend)
+                    else:
+                        wait = min(wait, state.due - now)
+            for backend in due:
+                try:
+                    self._pool.submit(self._probe, backend)
+                except RuntimeError:
+                    # 线程池已关闭
+                    return
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+
+    def _probe(self, backend: Backend):
+        """连接后端后立即断开，记录连接耗时"""
+        host, port = backend
+        started = time.perf_counter()
+        error = None
+        try:
+            sock = connect_first(interleave(self.resolver.resolve(host, port)),
+                                 self.timeout, self.resolver.connect_delay)
+            sock.close()
+        except OSError as e:
+            error = str(e) or e.__class__.__name__
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        transition = None
+        with self._lock:
+            self.probes += 1
+            state = self._states.get(backend)
+            if state is None:
+                # 探测期间后端已从配置中移除
+                return
+            state.probing = False
+            if error is not None and self._sessions.get(backend):
+                # 探测期间有会话连接上了该后端：失败可能只是连接被会话占用，不计入结果
+                state.due = time.monotonic() + self._delay(False)
+                return
+            if error is None:
+                if state.up is False:
+                    transition = 'up'
+                self._set_up(state, latency_ms)
+            else:
+                self.probe_failures += 1
+                state.failures += 1
+                state.error = error
+                state.checked = time.time()
+                if state.up is not False and state.failures >= self.failure_threshold:
+                    state.up = False
+                    state.latency_ms = None
+                    state.changed = time.time()
+                    transition = 'down'
+            state.due = time.monotonic() + self._delay(state.up is False)
+        if transition == 'down':
+            logger.warning(f"后端 {host}:{port} 连续 {self.failure_threshold} 次探测失败，标记为不可达: {error}")
+        elif transition == 'up':
+            logger.info(f"后端 {host}:{port} 已恢复，探测延迟 {latency_ms:.1f}ms")
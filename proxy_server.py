@@ -4,40 +4,144 @@ Telnet to SSH Proxy Server
 将SSH连接代理到Telnet后端
 """
 
+# 最先导入startup，它在导入时记下计时起点，--profile-startup报告中的时间都相对于此
+from startup import STARTED, StartupProfile
+import argparse
 import socket
+import functools
 import paramiko
 import threading
 import logging
-import select
+import selectors
+import signal
 import sys
 import time
-from typing import Dict, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 import yaml
 import os
 
+from acceptor import Acceptor
+from async_logging import JsonFormatter, start_async_logging
+from handoff import request_listeners, start_handoff_server, systemd_listeners
+from keepalive import KeepaliveSettings, SessionSweeper
+from recorder import Recorder
+from breaker import CircuitBreaker
+from prober import BackendProber
+from resolver import FAILOVER_MODES, BackendResolver, parse_backends
+from router import DeviceIndex, choose_device, device_mappings, split_username
+from metrics import Histogram, start_metrics_server
+from admission import AdmissionController
+from auth import AuthStore
+from host_keys import apply_algorithms, host_key_specs, load_host_keys, temporary_host_key, validate_algorithms
+from telnet_protocol import IAC_NOP, TelnetProtocol
+from status import start_status_server
+from supervisor import WorkerSupervisor, merge_counters, worker_status_file, write_status
+
+if TYPE_CHECKING:
+    from reactor import Reactor
+
 logger = logging.getLogger(__name__)
 
 
+class RelayTuning:
+    """转发缓冲区与socket/SSH窗口参数
+    
+    默认值偏向交互延迟（关闭Nagle、中等读缓冲、系统默认socket缓冲区）；
+    大量输出的映射可以加大读缓冲、socket缓冲区和SSH窗口以提高吞吐
+    """
+    
+    __slots__ = ('buffer_size', 'tcp_nodelay', 'rcvbuf', 'sndbuf', 'window_size', 'max_packet_size')
+    
+    DEFAULTS = {
+        # 每次从SSH channel或Telnet socket读取的最大字节数
+        'buffer_size': 16384,
+        'tcp_nodelay': True,
+        # 后端socket的SO_RCVBUF/SO_SNDBUF，0表示使用系统默认
+        'rcvbuf': 0,
+        'sndbuf': 0,
+        # SSH channel窗口和最大包长，与paramiko默认值相同
+        'window_size': paramiko.common.DEFAULT_WINDOW_SIZE,
+        'max_packet_size': paramiko.common.DEFAULT_MAX_PACKET_SIZE,
+    }
+    
+    def __init__(self, **values):
+        for name, default in self.DEFAULTS.items():
+            value = values.get(name)
+            setattr(self, name, type(default)(value) if value is not None else default)
+        if self.buffer_size <= 0:
+            raise ValueError(f"buffer_size必须大于0，实际为 {self.buffer_size}")
+    
+    @classmethod
+    def from_config(cls, defaults: Optional[dict], mapping: Optional[dict] = None) -> 'RelayTuning':
+        """全局tuning配置段，再由映射的tuning覆盖"""
+        values = dict(defaults or {})
+        values.update((mapping or {}).get('tuning') or {})
+        unknown = set(values) - set(cls.DEFAULTS)
+        if unknown:
+            logger.warning(f"忽略未知的tuning参数: {', '.join(sorted(unknown))}")
+        return cls(**{name: values.get(name) for name in cls.DEFAULTS})
+    
+    def apply(self, sock: socket.socket, buffers: bool = True):
+        """设置socket选项；缓冲区大小须在connect之前设置才能影响TCP窗口扩大因子"""
+        if self.tcp_nodelay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if buffers and self.rcvbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        if buffers and self.sndbuf:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+
+
 class TelnetClient:
     """Telnet客户端，用于连接到Telnet后端"""
     
-    def __init__(self, host: str, port: int, timeout: int = 10):
+    def __init__(self, host: str, port: int, timeout: int = 10,
+                 protocol: Optional[TelnetProtocol] = None,
+                 tuning: Optional[RelayTuning] = None,
+                 resolver: Optional[BackendResolver] = None,
+                 alternates: Optional[List[Tuple[str, int]]] = None,
+                 failover: str = 'parallel', log_fields: Optional[dict] = None):
         self.host = host
         self.port = port
         self.timeout = timeout
+        # Telnet选项协商；为None时按原始TCP透传
+        self.protocol = protocol
+        self.tuning = tuning
+        # 地址缓存；为None时每次连接临时解析
+        self.resolver = resolver
+        # 主后端失败时尝试的备用后端
+        self.alternates = alternates or []
+        self.failover = failover
+        # 日志事件字段（所属会话的ID、端口、来源地址）
+        self.log_fields = log_fields or {}
+        # 最近一次连接失败的原因
+        self.error: Optional[str] = None
         self.sock = None
         
     def connect(self) -> bool:
-        """连接到Telnet服务器"""
+        """连接到Telnet服务器（或备用后端），成功后host/port为实际连接的后端"""
+        resolver = self.resolver or BackendResolver(connect_timeout=self.timeout)
+        backends = [(self.host, self.port)] + self.alternates
+        started = time.perf_counter()
         try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock, (host, port) = resolver.connect(
+                backends, self.failover,
+                prepare=self.tuning.apply if self.tuning is not None else None
+            )
             self.sock.settimeout(self.timeout)
-            self.sock.connect((self.host, self.port))
-            logger.info(f"成功连接到Telnet服务器 {self.host}:{self.port}")
-            return True
         except Exception as e:
-            logger.error(f"连接Telnet服务器失败 {self.host}:{self.port}: {e}")
+            self.error = str(e)
+            logger.error("连接Telnet服务器失败 %s:%s: %s", self.host, self.port, e,
+                         extra={'event': dict(self.log_fields, event='backend_failed',
+                                              target=f"{self.host}:{self.port}", error=self.error,
+                                              duration_ms=round((time.perf_counter() - started) * 1000, 1))})
             return False
+        if (host, port) != (self.host, self.port):
+            logger.warning("主后端 %s:%s 不可用，已连接备用后端 %s:%s", self.host, self.port, host, port)
+            self.host, self.port = host, port
+        logger.info("成功连接到Telnet服务器 %s:%s", self.host, self.port,
+                    extra={'event': dict(self.log_fields, event='backend_connected', target=f"{host}:{port}",
+                                         duration_ms=round((time.perf_counter() - started) * 1000, 1))})
+        return True
     
     def send(self, data: bytes) -> bool:
         """发送数据到Telnet服务器"""
@@ -46,16 +150,41 @@ class TelnetClient:
                 self.sock.sendall(data)
                 return True
         except Exception as e:
-            logger.error(f"发送数据到Telnet服务器失败: {e}")
+            logger.error("发送数据到Telnet服务器失败: %s", e, extra={'event': self.log_fields})
         return False
     
-    def recv(self, size: int = 4096) -> bytes:
-        """从Telnet服务器接收数据"""
+    def send_nowait(self, data: bytes) -> int:
+        """非阻塞发送，返回已写入的字节数，连接异常时返回-1"""
+        try:
+            if self.sock:
+                return self.sock.send(data)
+        except (BlockingIOError, InterruptedError):
+            return 0
+        except Exception as e:
+            logger.error("发送数据到Telnet服务器失败: %s", e, extra={'event': self.log_fields})
+        return -1
+    
+    def recv_into(self, buffer) -> Optional[int]:
+        """接收数据到预分配的缓冲区，返回字节数；非阻塞模式下暂无数据时返回None，连接关闭或出错时返回0"""
+        try:
+            if self.sock:
+                return self.sock.recv_into(buffer)
+        except (BlockingIOError, InterruptedError):
+            return None
+        except Exception as e:
+            self.error = str(e)
+            logger.debug("从Telnet服务器接收数据失败: %s", e)
+        return 0
+    
+    def recv(self, size: int = 4096) -> Optional[bytes]:
+        """从Telnet服务器接收数据，非阻塞模式下暂无数据时返回None"""
         try:
             if self.sock:
                 return self.sock.recv(size)
+        except (BlockingIOError, InterruptedError):
+            return None
         except Exception as e:
-            logger.debug(f"从Telnet服务器接收数据失败: {e}")
+            logger.debug("从Telnet服务器接收数据失败: %s", e)
         return b''
     
     def close(self):
@@ -71,17 +200,84 @@ class TelnetClient:
 class SSHServerHandler(paramiko.ServerInterface):
     """SSH服务器处理器"""
     
-    def __init__(self, username: str, password: str):
-        self.username = username
-        self.password = password
+    def __init__(self, auth: AuthStore, port: int, on_auth_failure=None):
+        self.auth = auth
+        # 客户端连接的SSH端口，用于按用户限制可访问的映射
+        self.port = port
+        self.on_auth_failure = on_auth_failure
+        # 日志事件字段（会话ID、端口、来源地址），由SSHProxyServer在握手前设置
+        self.log_fields: dict = {'port': port}
+        # 认证成功的用户
+        self.user = None
         self.event = threading.Event()
+        # 客户端PTY参数，转发给Telnet后端（TTYPE/NAWS）
+        self.term = 'vt100'
+        self.width = 80
+        self.height = 24
+        # 客户端窗口大小变化时回调 (width, height)
+        self.on_window_change = None
+    
+    def get_allowed_auths(self, username: str) -> str:
+        """返回该用户可用的认证方式"""
+        return self.auth.methods(username)
     
     def check_auth_password(self, username: str, password: str) -> int:
         """验证用户名和密码"""
-        if username == self.username and password == self.password:
-            logger.info(f"用户 {username} 认证成功")
+        user = self.auth.check_password(username, password, self.port)
+        if user is not None:
+            self.user = user
+            logger.info("用户 %s 认证成功", username,
+                        extra={'event': dict(self.log_fields, event='auth', user=username, method='password')})
             return paramiko.AUTH_SUCCESSFUL
-        logger.warning(f"用户 {username} 认证失败")
+        return self._auth_failed(username, "密码")
+    
+    def check_auth_publickey(self, username: str, key) -> int:
+        """公钥是否属于该用户
+        
+        客户端询问公钥是否可用时和paramiko校验签名之前都会调用，这里不能认为认证已成功：
+        用户、认证日志和准入信任在transport认证完成后由authenticated()设置；
+        客户端依次尝试的不匹配公钥不计为失败，只有签名校验失败时才计数
+        """
+        if self.auth.check_key(username, key.asbytes(), self.port) is None:
+            return paramiko.AUTH_FAILED
+        self._watch_signature(key, username)
+        return paramiko.AUTH_SUCCESSFUL
+    
+    def _watch_signature(self, key, username: str):
+        """paramiko只对附带签名的请求调用key.verify_ssh_sig，借此记录签名校验失败"""
+        verify = key.verify_ssh_sig
+        
+        def verify_ssh_sig(data, msg):
+            valid = verify(data, msg)
+            if not valid:
+                self._auth_failed(username, "公钥签名")
+            return valid
+        key.verify_ssh_sig = verify_ssh_sig
+    
+    def authenticated(self, transport) -> bool:
+        """transport认证完成后设置用户并记录认证日志；公钥认证只在此时确认"""
+        if not transport.is_authenticated():
+            return False
+        if self.user is None:
+            username = self._login(transport.get_username())
+            user = self.auth.users.get(username)
+            if user is None or not user.allows(self.port):
+                # 认证与此刻之间认证配置被重载
+                return False
+            self.user = user
+            logger.info("用户 %s 公钥认证成功", username,
+                        extra={'event': dict(self.log_fields, event='auth', user=username, method='publickey')})
+        return True
+    
+    def _login(self, username: str) -> str:
+        """认证时使用的用户名"""
+        return username
+    
+    def _auth_failed(self, username: str, method: str) -> int:
+        logger.warning("用户 %s %s认证失败", username, method,
+                       extra={'event': dict(self.log_fields, event='auth_failed', user=username)})
+        if self.on_auth_failure:
+            self.on_auth_failure()
         return paramiko.AUTH_FAILED
     
     def check_channel_request(self, kind: str, chanid: int) -> int:
@@ -92,6 +288,19 @@ class SSHServerHandler(paramiko.ServerInterface):
     
     def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
         """处理PTY请求"""
+        if isinstance(term, bytes):
+            term = term.decode('ascii', 'replace')
+        self.term = term or self.term
+        self.width = width or self.width
+        self.height = height or self.height
+        return True
+    
+    def check_channel_window_change_request(self, channel, width, height, pixelwidth, pixelheight):
+        """处理窗口大小变化"""
+        self.width = width
+        self.height = height
+        if self.on_window_change:
+            self.on_window_change(width, height)
         return True
     
     def check_channel_shell_request(self, channel):
@@ -105,170 +314,713 @@ class SSHServerHandler(paramiko.ServerInterface):
         return True
 
 
+class RoutedServerHandler(SSHServerHandler):
+    """路由端口的SSH处理器：认证前从用户名中分离出目标设备"""
+    
+    def __init__(self, auth: AuthStore, port: int, separators: str = '+@', on_auth_failure=None):
+        super().__init__(auth, port, on_auth_failure=on_auth_failure)
+        self.separators = separators
+        # 用户名中指定的设备名或分组，None表示显示菜单
+        self.target: Optional[str] = None
+    
+    def _login(self, username: str) -> str:
+        """本身就是已配置用户名（如包含@的用户名）时不拆分"""
+        if username in self.auth.users:
+            self.target = None
+            return username
+        login, self.target = split_username(username, self.separators)
+        return login
+    
+    def get_allowed_auths(self, username: str) -> str:
+        return super().get_allowed_auths(self._login(username))
+    
+    def check_auth_password(self, username: str, password: str) -> int:
+        return super().check_auth_password(self._login(username), password)
+    
+    def check_auth_publickey(self, username: str, key) -> int:
+        return super().check_auth_publickey(self._login(username), key)
+
+
+class SessionViewer:
+    """接入代理会话的一个SSH客户端"""
+    
+    def __init__(self, channel, read_only: bool = False):
+        self.channel = channel
+        self.read_only = read_only
+        self.fd = None
+        self.mask = 0
+        # 尚未写入该客户端的数据；共享会话中所有查看者引用同一个数据块，不逐个复制
+        self.pending = b''
+        self.blocked_since = None
+
+
 class ProxySession:
     """代理会话，处理SSH和Telnet之间的数据转发"""
     
-    def __init__(self, ssh_channel, telnet_host: str, telnet_port: int):
+    # SSH窗口已满时重试写入的间隔（秒）
+    BACKPRESSURE_RETRY = 0.01
+    # 共享会话中查看者持续阻塞超过该时长（秒）则断开，避免拖慢其他查看者
+    SLOW_VIEWER_TIMEOUT = 10.0
+    
+    def __init__(self, ssh_channel, telnet_host: str, telnet_port: int, shared: bool = False,
+                 telnet_mode: str = 'telnet', term: str = 'vt100', window: Tuple[int, int] = (80, 24),
+                 tuning: Optional[RelayTuning] = None, resolver: Optional[BackendResolver] = None,
+                 alternates: Optional[List[Tuple[str, int]]] = None, failover: str = 'parallel',
+                 log_fields: Optional[dict] = None, keepalive: Optional[KeepaliveSettings] = None):
         self.ssh_channel = ssh_channel
         self.telnet_host = telnet_host
         self.telnet_port = telnet_port
+        # 共享模式下其他SSH客户端可以随时attach到本会话
+        self.shared = shared
+        # telnet: 处理IAC选项协商；raw: 原始TCP透传
+        self.telnet_mode = telnet_mode
+        self.term = term
+        self.window = window
+        self.tuning = tuning or RelayTuning()
+        self.resolver = resolver
+        self.alternates = alternates or []
+        self.failover = failover
+        # 日志事件字段（会话ID、SSH端口、来源地址）
+        self.log_fields = log_fields or {}
+        # TCP keepalive、空闲超时和Telnet NOP参数
+        self.keepalive = keepalive or KeepaliveSettings()
         self.telnet_client = None
+        # 会话录像（recorder.SessionRecording），未开启录像时为None
+        self.recording = None
         self.running = False
+        # 每个SSH客户端离开会话时调用一次（包括后端连接失败）
+        self.on_close = None
+        # 会话结束（cleanup）时调用一次，参数为本会话
+        self.on_finish = None
+        # 转发字节数，只由转发线程累加，读取方无需加锁
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # 连接后端耗时（秒），连接失败时为None
+        self.connect_seconds = None
+        # 连接后端成功的时间，用于会话结束时记录持续时长
+        self.opened_at = None
+        # (后端探测, 后端)：会话连接着后端期间该后端不被探测，会话结束时通知
+        self.probed = None
+        # 最近一次转发数据的时间，由清扫线程判断空闲超时
+        self.last_activity = None
+        # 会话结束原因: client | backend | error | idle，最先出现的为准
+        self.close_reason: Optional[str] = None
+        # 由清扫线程置位，转发线程在下一次update_interest时发送Telnet NOP
+        self._nop_pending = False
+        self._last_nop = 0.0
+        # 由驱动本会话的事件循环设置，其他线程attach查看者后调用以唤醒事件循环
+        self.wakeup = None
+        self.viewers = []
+        self._joining = [SessionViewer(ssh_channel)]
+        self._resize = None
+        self._lock = threading.Lock()
+        self._fd_viewers = {}
+        self._selector = None
+        self._telnet_fd = None
+        self._telnet_mask = 0
+        # 写不进Telnet的数据；有积压时停止读取SSH，形成背压
+        self._to_telnet = b''
+        # Telnet侧的接收缓冲区，在会话内复用；查看者的pending是它的memoryview切片，
+        # 全部写出之前不会再读取Telnet（见handle_event），因此不会被覆盖
+        self._recv_buffer = None
         
     def start(self):
-        """启动代理会话"""
-        # 连接到Telnet后端
-        self.telnet_client = TelnetClient(self.telnet_host, self.telnet_port)
-        if not self.telnet_client.connect():
-            try:
-                self.ssh_channel.send(f"错误: 无法连接到Telnet服务器 {self.telnet_host}:{self.telnet_port}\r\n".encode())
-                self.ssh_channel.close()
-            except:
-                pass
+        """启动代理会话（独占当前线程直到会话结束）"""
+        if not self.open():
             return
-        
+        self.run()
+    
+    def open(self) -> bool:
+        """连接到Telnet后端，失败时通知SSH客户端并关闭channel"""
+        protocol = None
+        if self.telnet_mode == 'telnet':
+            protocol = TelnetProtocol(self.term, *self.window)
+        self.telnet_client = TelnetClient(self.telnet_host, self.telnet_port, protocol=protocol,
+                                          tuning=self.tuning, resolver=self.resolver,
+                                          alternates=self.alternates, failover=self.failover,
+                                          log_fields=self.log_fields)
+        started = time.perf_counter()
+        if not self.telnet_client.connect():
+            self.reject(f"错误: 无法连接到Telnet服务器 {self.telnet_host}:{self.telnet_port}\r\n")
+            return False
+        self.connect_seconds = time.perf_counter() - started
+        self.keepalive.apply(self.telnet_client.sock)
+        self.opened_at = self.last_activity = time.monotonic()
+        # 连接到备用后端时以实际后端显示
+        self.telnet_host, self.telnet_port = self.telnet_client.host, self.telnet_client.port
         self.running = True
-        
-        # 启动双向数据转发线程
-        ssh_to_telnet = threading.Thread(target=self._forward_ssh_to_telnet)
-        telnet_to_ssh = threading.Thread(target=self._forward_telnet_to_ssh)
-        
-        ssh_to_telnet.daemon = True
-        telnet_to_ssh.daemon = True
-        
-        ssh_to_telnet.start()
-        telnet_to_ssh.start()
-        
-        # 等待会话结束
-        ssh_to_telnet.join()
-        telnet_to_ssh.join()
-        
+        return True
+    
+    def reject(self, message: str):
+        """不连接后端，向SSH客户端发送提示后结束会话"""
+        try:
+            self.ssh_channel.send(message.encode())
+        except:
+            pass
         self.cleanup()
     
-    def _forward_ssh_to_telnet(self):
-        """转发SSH数据到Telnet"""
+    def run(self):
+        """在当前线程转发已连接的会话直到结束"""
+        try:
+            self._relay()
+        finally:
+            self.cleanup()
+    
+    def attach(self, channel, read_only: bool = False) -> bool:
+        """把新的SSH客户端加入共享会话，会话已结束时返回False"""
+        with self._lock:
+            if not self.running:
+                return False
+            mode = "只读" if read_only else "读写"
+            try:
+                channel.send(f"\r\n[共享会话] 已加入 {self.telnet_host}:{self.telnet_port}（{mode}）\r\n".encode())
+            except Exception:
+                return False
+            self._joining.append(SessionViewer(channel, read_only))
+        self._wake()
+        return True
+    
+    def resize(self, width: int, height: int):
+        """SSH客户端窗口大小变化（由paramiko线程调用），在转发线程中发送NAWS"""
+        with self._lock:
+            self._resize = (width, height)
+        self._wake()
+    
+    def finish(self, reason: str):
+        """结束转发（可从其他线程调用，之后需唤醒事件循环）"""
+        if self.close_reason is None:
+            self.close_reason = reason
+        self.running = False
+    
+    def sweep(self, now: float) -> Optional[str]:
+        """由清扫线程调用：空闲超时则结束会话返回'idle'，需要保活则安排Telnet NOP返回'nop'"""
+        if not self.running or self.last_activity is None:
+            return None
+        keepalive = self.keepalive
+        idle = now - self.last_activity
+        if keepalive.idle_timeout and idle >= keepalive.idle_timeout:
+            logger.info("会话空闲 %.0f秒，断开: Telnet %s:%s", idle, self.telnet_host, self.telnet_port,
+                        extra={'event': dict(self.log_fields, event='idle_timeout')})
+            self.notify(f"\r\n[空闲超过 {keepalive.idle_timeout:.0f} 秒，连接已断开]\r\n")
+            self.close('idle')
+            return 'idle'
+        if (keepalive.telnet_nop and self.telnet_client.protocol is not None
+                and now - max(self.last_activity, self._last_nop) >= keepalive.telnet_nop):
+            self._last_nop = now
+            self._nop_pending = True
+            self._wake()
+            return 'nop'
+        return None
+    
+    def notify(self, message: str):
+        """向会话的所有SSH客户端发送提示（可从其他线程调用），窗口已满的客户端跳过，不阻塞调用方"""
+        data = message.encode()
+        for viewer in list(self.viewers):
+            try:
+                if viewer.channel.send_ready():
+                    viewer.channel.send(data)
+            except Exception:
+                pass
+    
+    def close(self, reason: str):
+        """从其他线程结束会话，由转发线程或事件循环完成清理"""
+        self.finish(reason)
+        self._wake()
+    
+    def _wake(self):
+        if self.wakeup:
+            try:
+                self.wakeup()
+            except OSError:
+                pass
+    
+    def _relay(self):
+        """事件驱动转发：在会话自己的selector中等待SSH channel和Telnet socket就绪"""
+        selector = selectors.DefaultSelector()
+        # 其他线程（查看者加入、窗口大小变化）通过唤醒管道通知转发线程
+        wakeup_r, wakeup_w = socket.socketpair()
         try:
+            wakeup_r.setblocking(False)
+            wakeup_w.setblocking(False)
+            selector.register(wakeup_r, selectors.EVENT_READ, None)
+            self.wakeup = lambda: wakeup_w.send(b'\0')
+            self.register(selector)
             while self.running:
-                if self.ssh_channel.recv_ready():
-                    data = self.ssh_channel.recv(4096)
-                    if len(data) == 0:
-                        break
-                    if not self.telnet_client.send(data):
+                timeout = self.BACKPRESSURE_RETRY if self.backpressured else None
+                for key, mask in selector.select(timeout):
+                    if key.data is None:
+                        self._drain_wakeup(wakeup_r)
+                        continue
+                    self.handle_event(key.fd, mask)
+                    if not self.running:
                         break
-                else:
-                    time.sleep(0.01)
+                if self.running and self.backpressured:
+                    self.flush_ssh()
+                if self.running:
+                    self.update_interest()
         except Exception as e:
-            logger.debug(f"SSH到Telnet转发异常: {e}")
+            logger.debug("会话转发异常: %s", e, extra={'event': self.log_fields})
+            self.finish('error')
         finally:
             self.running = False
+            self.wakeup = None
+            self.unregister()
+            selector.close()
+            wakeup_r.close()
+            wakeup_w.close()
+    
+    @staticmethod
+    def _drain_wakeup(sock):
+        try:
+            while sock.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+    
+    @property
+    def backpressured(self) -> bool:
+        """有SSH客户端窗口已满、数据等待写入"""
+        return any(viewer.pending for viewer in self.viewers)
+    
+    def register(self, selector):
+        """把会话注册到selector，可以是会话独占的，也可以是reactor共享的"""
+        self._selector = selector
+        self._telnet_fd = self.telnet_client.sock.fileno()
+        self.telnet_client.sock.setblocking(False)
+        self.update_interest()
+    
+    def unregister(self):
+        """从selector注销会话的所有文件描述符"""
+        if self._selector is None:
+            return
+        registered = [(viewer.fd, viewer.mask) for viewer in self.viewers]
+        registered.append((self._telnet_fd, self._telnet_mask))
+        for fd, mask in registered:
+            if mask:
+                try:
+                    self._selector.unregister(fd)
+                except (KeyError, ValueError):
+                    pass
+        for viewer in self.viewers:
+            viewer.mask = 0
+        self._telnet_mask = 0
+        self._selector = None
+    
+    def update_interest(self):
+        """根据积压情况调整关注的事件：写不出去的一侧积压时暂停读取另一侧"""
+        if self._nop_pending:
+            self._nop_pending = False
+            self._to_telnet += IAC_NOP
+        if self._joining:
+            with self._lock:
+                joining, self._joining = self._joining, []
+            for viewer in joining:
+                self._add_viewer(viewer)
+        if self._resize is not None:
+            with self._lock:
+                size, self._resize = self._resize, None
+            protocol = self.telnet_client.protocol
+            if size and protocol is not None:
+                self._to_telnet += protocol.resize(*size)
+            if size and self.recording:
+                self.recording.resize(*size)
+        
+        viewer_mask = 0 if self._to_telnet else selectors.EVENT_READ
+        for viewer in self.viewers:
+            viewer.mask = self._apply_interest(viewer.fd, viewer.mask, viewer_mask)
+        
+        telnet_mask = 0 if self.backpressured else selectors.EVENT_READ
+        if self._to_telnet:
+            telnet_mask |= selectors.EVENT_WRITE
+        self._telnet_mask = self._apply_interest(self._telnet_fd, self._telnet_mask, telnet_mask)
+    
+    def _add_viewer(self, viewer: SessionViewer):
+        # channel.fileno() 是paramiko内部的通知管道，有数据或EOF时可读
+        viewer.fd = viewer.channel.fileno()
+        viewer.channel.settimeout(0.0)
+        self.viewers.append(viewer)
+        self._fd_viewers[viewer.fd] = viewer
+    
+    def _apply_interest(self, fd: int, current: int, wanted: int) -> int:
+        if wanted != current:
+            if not current:
+                self._selector.register(fd, wanted, self)
+            elif not wanted:
+                self._selector.unregister(fd)
+            else:
+                self._selector.modify(fd, wanted, self)
+        return wanted
+    
+    def handle_event(self, fd: int, mask: int):
+        """处理selector事件"""
+        if fd != self._telnet_fd:
+            viewer = self._fd_viewers.get(fd)
+            if viewer is not None:
+                self._forward_ssh_to_telnet(viewer)
+            return
+        if mask & selectors.EVENT_WRITE:
+            self._flush_telnet()
+        if mask & selectors.EVENT_READ and self.running and not self.backpressured:
+            self._forward_telnet_to_ssh()
+    
+    def _forward_ssh_to_telnet(self, viewer: SessionViewer):
+        """SSH channel就绪时读取数据并转发到Telnet"""
+        channel = viewer.channel
+        if not channel.recv_ready():
+            # 客户端一般不发送stderr数据，丢弃以免通知管道持续可读
+            if channel.recv_stderr_ready():
+                channel.recv_stderr(4096)
+                return
+            # EOF或关闭时recv会立即返回空数据
+            if not (channel.eof_received or channel.closed):
+                return
+        data = channel.recv(self.tuning.buffer_size)
+        if len(data) == 0:
+            self._detach(viewer)
+            return
+        if viewer.read_only:
+            return
+        self.last_activity = time.monotonic()
+        self.bytes_in += len(data)
+        if self.recording:
+            self.recording.input(data)
+        protocol = self.telnet_client.protocol
+        if protocol is not None:
+            data = protocol.encode(data)
+        self._to_telnet += data
+        self._flush_telnet()
     
     def _forward_telnet_to_ssh(self):
-        """转发Telnet数据到SSH"""
+        """Telnet socket就绪时读取一次数据，分发给所有SSH客户端
+        
+        数据读入会话复用的缓冲区，以memoryview切片交给paramiko，
+        只在paramiko组包（以及录像入队）时复制一次
+        """
+        if self._recv_buffer is None:
+            self._recv_buffer = memoryview(bytearray(self.tuning.buffer_size))
+        size = self.telnet_client.recv_into(self._recv_buffer)
+        if size is None:
+            return
+        if size == 0:
+            self.finish('error' if self.telnet_client.error else 'backend')
+            return
+        data = self._recv_buffer[:size]
+        self.last_activity = time.monotonic()
+        self.bytes_out += size
+        protocol = self.telnet_client.protocol
+        if protocol is not None:
+            data, replies = protocol.feed(data)
+            if replies:
+                self._to_telnet += replies
+                self._flush_telnet()
+            if not data:
+                return
+        if self.recording:
+            self.recording.output(data)
+        for viewer in self.viewers:
+            viewer.pending = data
+        self.flush_ssh()
+    
+    def _flush_telnet(self):
+        sent = self.telnet_client.send_nowait(self._to_telnet)
+        if sent < 0:
+            self.finish('error')
+            return
+        self._to_telnet = self._to_telnet[sent:]
+    
+    def flush_ssh(self):
+        """把积压数据写入各SSH客户端，窗口已满时保留剩余部分等待重试"""
+        for viewer in list(self.viewers):
+            if viewer.pending and not self._flush_viewer(viewer):
+                self._detach(viewer)
+    
+    def _flush_viewer(self, viewer: SessionViewer) -> bool:
+        """写出查看者的积压数据，返回False表示应断开该查看者"""
+        while viewer.pending:
+            try:
+                sent = viewer.channel.send(viewer.pending)
+            except socket.timeout:
+                now = time.monotonic()
+                if viewer.blocked_since is None:
+                    viewer.blocked_since = now
+                elif len(self.viewers) > 1 and now - viewer.blocked_since > self.SLOW_VIEWER_TIMEOUT:
+                    logger.warning(f"共享会话查看者阻塞超过{self.SLOW_VIEWER_TIMEOUT:.0f}秒，已断开")
+                    return False
+                return True
+            except Exception:
+                return False
+            if sent == 0:
+                # channel已关闭
+                return False
+            viewer.pending = viewer.pending[sent:]
+        viewer.blocked_since = None
+        return True
+    
+    def _detach(self, viewer: SessionViewer):
+        """移除一个SSH客户端，最后一个客户端离开时结束会话"""
+        if viewer not in self.viewers:
+            return
+        if viewer.mask and self._selector is not None:
+            try:
+                self._selector.unregister(viewer.fd)
+            except (KeyError, ValueError):
+                pass
+        viewer.mask = 0
+        self.viewers.remove(viewer)
+        self._fd_viewers.pop(viewer.fd, None)
+        self._close_viewer(viewer)
+        if not self.viewers:
+            self.finish('client')
+    
+    def _close_viewer(self, viewer: SessionViewer):
         try:
-            while self.running:
-                # 使用select检查是否有数据可读
-                if self.telnet_client.sock:
-                    ready = select.select([self.telnet_client.sock], [], [], 0.1)
-                    if ready[0]:
-                        data = self.telnet_client.recv(4096)
-                        if len(data) == 0:
-                            break
-                        try:
-                            self.ssh_channel.send(data)
-                        except:
-                            break
-        except Exception as e:
-            logger.debug(f"Telnet到SSH转发异常: {e}")
-        finally:
-            self.running = False
+            viewer.channel.close()
+            transport = viewer.channel.get_transport()
+            if transport:
+                transport.close()
+        except:
+            pass
+        if self.on_close:
+            self.on_close()
     
     def cleanup(self):
         """清理资源"""
-        self.running = False
+        with self._lock:
+            self.running = False
+            viewers = self.viewers + self._joining
+            self.viewers, self._joining = [], []
+            on_finish, self.on_finish = self.on_finish, None
+        self._fd_viewers.clear()
         if self.telnet_client:
             self.telnet_client.close()
-        try:
-            self.ssh_channel.close()
-        except:
-            pass
+        if self.recording:
+            self.recording.close()
+        for viewer in viewers:
+            self._close_viewer(viewer)
+        if on_finish:
+            if self.opened_at is not None:
+                duration = time.monotonic() - self.opened_at
+                logger.info("代理会话结束(%s): Telnet %s:%s，持续 %.1f秒，转发 %d/%d 字节",
+                            self.close_reason or 'shutdown', self.telnet_host, self.telnet_port,
+                            duration, self.bytes_in, self.bytes_out,
+                            extra={'event': dict(self.log_fields, event='session_closed',
+                                                 reason=self.close_reason or 'shutdown',
+                                                 target=f"{self.telnet_host}:{self.telnet_port}",
+                                                 duration_ms=round(duration * 1000, 1),
+                                                 bytes_in=self.bytes_in, bytes_out=self.bytes_out)})
+            on_finish(self)
+
+
+def listen_socket(port: int, reuse_port: bool = False) -> socket.socket:
+    """在所有地址上监听port"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(('0.0.0.0', port))
+        sock.listen(100)
+    except OSError:
+        sock.close()
+        raise
+    return sock
 
 
 class SSHProxyServer:
     """SSH代理服务器"""
     
     def __init__(self, port: int, telnet_host: str, telnet_port: int, 
-                 username: str, password: str, host_key):
+                 auth: AuthStore, host_keys: List[paramiko.PKey], reactor=None,
+                 reuse_port: bool = False, algorithms: Optional[dict] = None):
         self.port = port
         self.telnet_host = telnet_host
         self.telnet_port = telnet_port
-        self.username = username
-        self.password = password
-        self.host_key = host_key
+        # 用户和公钥索引，重载时由ProxyManager整体替换
+        self.auth = auth
+        # 握手准入控制，所有端口共用；None表示不限制
+        self.admission: Optional[AdmissionController] = None
+        # 同时提供的多个主机密钥（Ed25519/ECDSA/RSA），由客户端偏好选择
+        self.host_keys = host_keys
+        # kex/cipher/MAC/主机密钥算法偏好，见host_keys.validate_algorithms
+        self.algorithms = algorithms or {}
+        # reactor模式下握手进入线程池、转发由共享事件循环驱动
+        self.reactor = reactor
+        # 监听socket注册到的accept循环（reactor模式下即reactor），由ProxyManager设置
+        self.acceptor: Optional[Acceptor] = None
+        # 多worker进程时各自以SO_REUSEPORT绑定同一端口，由内核分配连接
+        self.reuse_port = reuse_port
+        # 映射开启record时用于创建会话录像
+        self.recorder: Optional[Recorder] = None
+        # 全局tuning配置段，与映射的tuning合并为本端口的转发参数
+        self.tuning_defaults: dict = {}
+        self.tuning = RelayTuning()
+        # 全局keepalive配置段，与映射的keepalive合并为本端口的保活和空闲超时参数
+        self.keepalive_defaults: dict = {}
+        self.keepalive = KeepaliveSettings()
+        # 检查空闲超时和Telnet NOP的清扫线程，所有端口共用
+        self.sweeper: Optional[SessionSweeper] = None
+        # 后端地址缓存，所有端口共用
+        self.resolver: Optional[BackendResolver] = None
+        # 后台探测的后端可达性表，所有端口共用；未启用时为None
+        self.prober: Optional[BackendProber] = None
+        # 主后端和备用后端，及备用后端的尝试方式（parallel | order）
+        self.backends: List[Tuple[str, int]] = []
+        self.alternates: List[Tuple[str, int]] = []
+        self.failover = 'parallel'
+        # 全局breaker配置段，与映射的breaker合并；后端地址或配置变化时重建熔断器
+        self.breaker_defaults: dict = {}
+        self.breaker: Optional[CircuitBreaker] = None
+        self._breaker_key = None
+        self.mapping: dict = {}
         self.sock = None
         self.running = False
-        
-    def start(self):
-        """启动SSH服务器"""
+        self.active_sessions = 0
+        self.total_sessions = 0
+        self.handshakes = 0
+        self.auth_failures = 0
+        self.backend_failures = 0
+        self.unreachable_rejected = 0
+        # 按结束原因统计的会话数: client | backend | error | idle | shutdown
+        self.sessions_closed: Dict[str, int] = {}
+        self.handshake_seconds = Histogram()
+        self.backend_connect_seconds = Histogram()
+        # 进行中的会话；其字节数在抓取时汇总，结束后并入下面的累计值
+        self.sessions = set()
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._stats_lock = threading.Lock()
+        # 共享模式下当前的后端会话，后续SSH客户端作为查看者加入
+        self.shared_session: Optional[ProxySession] = None
+        self._shared_lock = threading.Lock()
+    
+    def apply_mapping(self, mapping: dict):
+        """应用（新的）映射配置，只影响之后建立的会话"""
+        self.mapping = mapping
+        self.telnet_host = mapping['host']
+        self.telnet_port = mapping.get('port', 23)
+        self.backends = parse_backends(mapping)
+        self.alternates = self.backends[1:]
+        self.failover = mapping.get('failover', 'parallel')
+        if self.failover not in FAILOVER_MODES:
+            logger.warning(f"端口 {self.port} 的failover应为 {' | '.join(FAILOVER_MODES)}，使用parallel")
+            self.failover = 'parallel'
+        try:
+            self.tuning = RelayTuning.from_config(self.tuning_defaults, mapping)
+        except (TypeError, ValueError) as e:
+            logger.error(f"端口 {self.port} 的tuning配置无效，使用默认值: {e}")
+            self.tuning = RelayTuning()
+        try:
+            self.keepalive = KeepaliveSettings.from_config(self.keepalive_defaults, mapping)
+        except (TypeError, ValueError) as e:
+            logger.error(f"端口 {self.port} 的keepalive配置无效，使用默认值: {e}")
+            self.keepalive = KeepaliveSettings()
+        breaker_key = (self.telnet_host, self.telnet_port, tuple(self.alternates),
+                       repr(self.breaker_defaults), repr(mapping.get('breaker')))
+        if breaker_key != self._breaker_key:
+            try:
+                self.breaker = CircuitBreaker.from_config(
+                    f"{self.telnet_host}:{self.telnet_port}", self.breaker_defaults, mapping)
+            except (TypeError, ValueError) as e:
+                logger.error(f"端口 {self.port} 的breaker配置无效，使用默认值: {e}")
+                self.breaker = CircuitBreaker.from_config(f"{self.telnet_host}:{self.telnet_port}", None)
+            self._breaker_key = breaker_key
+    
+    def bind(self, sock: Optional[socket.socket] = None) -> bool:
+        """创建监听socket；sock为已经在监听的socket（systemd/旧进程交出或启动时提前打开）时直接使用"""
         try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.sock.bind(('0.0.0.0', self.port))
-            self.sock.listen(100)
+            self.sock = sock if sock is not None else listen_socket(self.port, self.reuse_port)
             self.running = True
-            
-            logger.info(f"SSH服务器在端口 {self.port} 启动，映射到 {self.telnet_host}:{self.telnet_port}")
-            
-            while self.running:
-                try:
-                    self.sock.settimeout(1.0)
-                    client, addr = self.sock.accept()
-                    logger.info(f"接受来自 {addr} 的SSH连接，端口 {self.port}")
-                    
-                    # 在新线程中处理客户端连接
-                    client_thread = threading.Thread(
-                        target=self._handle_client,
-                        args=(client, addr)
-                    )
-                    client_thread.daemon = True
-                    client_thread.start()
-                except socket.timeout:
-                    continue
-                except Exception as e:
-                    if self.running:
-                        logger.error(f"接受连接时出错: {e}")
-                    
+            logger.info(f"SSH服务器在端口 {self.port} 启动，映射到 {self.describe()}")
+            return True
         except Exception as e:
             logger.error(f"启动SSH服务器失败，端口 {self.port}: {e}")
-        finally:
             self.stop()
+            return False
+    
+    def accept_connection(self, client, addr):
+        """新连接先经过准入控制，再交给握手处理"""
+        # 会话ID贯穿该连接的握手、认证、后端连接和会话结束日志
+        log_fields = {'session': os.urandom(4).hex(), 'port': self.port, 'peer': f"{addr[0]}:{addr[1]}"}
+        logger.info("接受来自 %s 的SSH连接，端口 %s", addr, self.port,
+                    extra={'event': dict(log_fields, event='accept')})
+        client.setblocking(True)
+        admission = self.admission
+        if admission is None:
+            self._dispatch(client, addr, log_fields=log_fields)
+        else:
+            admission.admit(client, addr, functools.partial(self._dispatch, admission=admission,
+                                                            log_fields=log_fields))
     
-    def _handle_client(self, client_socket, addr):
+    def _dispatch(self, client, addr, admission: Optional[AdmissionController] = None,
+                  log_fields: Optional[dict] = None):
+        """开始握手：reactor模式进入有界线程池，否则新建线程"""
+        if self.reactor is not None:
+            self.reactor.submit(self._handle_client, client, addr, admission, log_fields)
+            return
+        
+        # 在新线程中处理客户端连接
+        client_thread = threading.Thread(
+            target=self._handle_client,
+            args=(client, addr, admission, log_fields)
+        )
+        client_thread.daemon = True
+        client_thread.start()
+    
+    def _handle_client(self, client_socket, addr, admission: Optional[AdmissionController] = None,
+                       log_fields: Optional[dict] = None):
         """处理客户端连接"""
         transport = None
+        server = None
+        handshaking = self._handshake_started()
         try:
-            transport = paramiko.Transport(client_socket)
-            transport.add_server_key(self.host_key)
+            tuning = self.tuning
+            tuning.apply(client_socket, buffers=False)
+            keepalive = self.keepalive
+            keepalive.apply(client_socket)
+            transport = paramiko.Transport(
+                client_socket,
+                default_window_size=tuning.window_size,
+                default_max_packet_size=tuning.max_packet_size
+            )
+            # 每次握手只读取一次密钥列表，后台生成密钥后整体替换为新列表
+            host_keys = self.host_keys
+            for host_key in host_keys:
+                transport.add_server_key(host_key)
+            apply_algorithms(transport, self.algorithms)
             
-            server = SSHServerHandler(self.username, self.password)
+            server = self._new_handler()
+            if log_fields is not None:
+                server.log_fields = log_fields
+            started = time.perf_counter()
             transport.start_server(server=server)
+            handshake = time.perf_counter() - started
+            self.handshake_seconds.observe(handshake)
+            if keepalive.ssh_interval:
+                # 客户端空闲时定期发送keepalive请求，客户端已消失时由TCP层报错并关闭transport
+                transport.set_keepalive(keepalive.ssh_interval)
+            logger.debug("SSH握手完成，耗时 %.1fms", handshake * 1000,
+                         extra={'event': dict(server.log_fields, event='handshake',
+                                              duration_ms=round(handshake * 1000, 1))})
             
             # 等待客户端建立channel
             channel = transport.accept(20)
             if channel is None:
-                logger.warning("客户端未能建立channel")
+                logger.warning("客户端未能建立channel", extra={'event': server.log_fields})
+                return
+            if not server.authenticated(transport):
+                channel.close()
                 return
             
             # 等待shell或exec请求
             server.event.wait(10)
             if not server.event.is_set():
-                logger.warning("客户端未请求shell或命令执行")
+                logger.warning("客户端未请求shell或命令执行", extra={'event': server.log_fields})
                 channel.close()
                 return
+            handshaking = self._handshake_finished(addr, admission, authenticated=True)
             
-            # 启动代理会话
-            logger.info(f"启动代理会话: SSH端口{self.port} -> Telnet {self.telnet_host}:{self.telnet_port}")
-            session = ProxySession(channel, self.telnet_host, self.telnet_port)
-            session.start()
+            if self._serve(channel, server, addr):
+                transport = None
             
         except Exception as e:
             # 对健康检查或端口扫描等短连接引发的握手异常降级为调试日志
@@ -290,20 +1042,229 @@ class SSHProxyServer:
                 short_conn = False
 
             if 'Error reading SSH protocol banner' in msg or short_conn:
-                logger.debug(f"短连接或握手中断({e.__class__.__name__}): {msg}")
+                logger.debug("短连接或握手中断(%s): %s", e.__class__.__name__, msg, extra={'event': log_fields})
             else:
                 # 未知异常保留堆栈，便于排查（避免空错误信息）
-                logger.exception("处理客户端连接时出错")
+                logger.exception("处理客户端连接时出错", extra={'event': log_fields})
         finally:
+            if handshaking:
+                # 只有transport确实完成认证的来源IP才被准入控制视为可信
+                self._handshake_finished(addr, admission, authenticated=transport is not None
+                                         and transport.is_authenticated() and server.user is not None)
             try:
                 if transport:
                     transport.close()
             except:
                 pass
     
+    def describe(self) -> str:
+        """日志和状态中显示的转发目标"""
+        return f"{self.telnet_host}:{self.telnet_port}"
+    
+    def _new_handler(self) -> SSHServerHandler:
+        return SSHServerHandler(self.auth, self.port, on_auth_failure=self._auth_failed)
+    
+    def _serve(self, channel, handler: SSHServerHandler, addr) -> bool:
+        """认证完成后为channel建立代理会话，返回True表示transport已交由会话管理"""
+        if self.mapping.get('shared', False):
+            return self._join_shared(channel, handler, addr)
+        
+        # 启动代理会话
+        logger.info("启动代理会话: SSH端口%s -> Telnet %s:%s", self.port, self.telnet_host, self.telnet_port,
+                    extra={'event': dict(handler.log_fields, event='session', target=self.describe())})
+        session = self._new_session(channel, handler, addr)
+        self._session_opened()
+        session.on_close = self._session_closed
+        if not self._open_session(session):
+            return False
+        if self.reactor is None:
+            session.run()
+            return False
+        # 转发交给reactor，transport随会话结束由reactor关闭
+        self.reactor.add_session(session)
+        return True
+    
+    def _new_session(self, channel, handler: SSHServerHandler, addr,
+                     shared: bool = False) -> ProxySession:
+        """按映射配置创建代理会话，并把客户端窗口变化转发给会话"""
+        session = ProxySession(
+            channel, self.telnet_host, self.telnet_port,
+            shared=shared,
+            telnet_mode=self.mapping.get('protocol', 'telnet'),
+            term=handler.term,
+            window=(handler.width, handler.height),
+            tuning=self.tuning,
+            resolver=self.resolver,
+            alternates=self.alternates,
+            failover=self.failover,
+            log_fields=handler.log_fields,
+            keepalive=self.keepalive
+        )
+        if self.mapping.get('record', False) and self.recorder is not None:
+            session.recording = self.recorder.open(
+                self.port, addr[0], handler.term, handler.width, handler.height,
+                title=f"{self.mapping.get('description', '')} {self.telnet_host}:{self.telnet_port}".strip()
+            )
+        handler.on_window_change = session.resize
+        session.on_finish = self._session_finished
+        with self._stats_lock:
+            self.sessions.add(session)
+        return session
+    
+    def _open_session(self, session: ProxySession) -> bool:
+        """连接后端并记录连接耗时或失败次数；熔断器打开或后台探测确认不可达时立即拒绝
+        
+        熔断器打开期间放行的会话就是试探，连接结果决定熔断器是否关闭
+        """
+        prober = self.prober
+        if prober is not None:
+            message = prober.message(self.describe(), self.backends)
+            if message is not None:
+                with self._stats_lock:
+                    self.unreachable_rejected += 1
+                session.reject(message)
+                return False
+        # 放行后紧接着连接并报告结果，否则试探会话会一直占着half-open状态
+        breaker = self.breaker
+        if breaker is not None and not breaker.allow():
+            session.reject(breaker.message())
+            return False
+        if not session.open():
+            with self._stats_lock:
+                self.backend_failures += 1
+            if breaker is not None:
+                breaker.record_failure(session.telnet_client.error)
+            return False
+        if breaker is not None:
+            breaker.record_success()
+        if prober is not None:
+            client = session.telnet_client
+            backend = (client.host, client.port)
+            prober.record(backend, session.connect_seconds * 1000)
+            prober.session_opened(backend)
+            session.probed = (prober, backend)
+        self.backend_connect_seconds.observe(session.connect_seconds)
+        if self.sweeper is not None and session.keepalive.swept:
+            self.sweeper.add(session)
+        return True
+    
+    def _join_shared(self, channel, handler: SSHServerHandler, addr) -> bool:
+        """共享模式：已有后端连接时作为查看者加入，否则建立会话成为第一个用户
+        
+        返回True表示transport已交由会话管理
+        """
+        read_only = self.mapping.get('shared_access', 'read-write') == 'read-only'
+        with self._shared_lock:
+            session = self.shared_session
+            if session is not None and session.attach(channel, read_only):
+                if not read_only:
+                    # 只读查看者的窗口变化不转发给设备，否则会改变其他用户看到的排版
+                    handler.on_window_change = session.resize
+                self._session_opened()
+                logger.info("加入共享会话: SSH端口%s -> Telnet %s:%s (%s)", self.port, self.telnet_host,
+                            self.telnet_port, '只读' if read_only else '读写',
+                            extra={'event': dict(handler.log_fields, event='session_joined', target=self.describe())})
+                return True
+            
+            # 在锁内连接后端，同时到达的其他客户端等待后直接加入
+            logger.info("启动共享代理会话: SSH端口%s -> Telnet %s:%s", self.port, self.telnet_host, self.telnet_port,
+                        extra={'event': dict(handler.log_fields, event='session', target=self.describe())})
+            session = self._new_session(channel, handler, addr, shared=True)
+            self._session_opened()
+            session.on_close = self._session_closed
+            if not self._open_session(session):
+                return True
+            self.shared_session = session
+        
+        if self.reactor is None:
+            session.run()
+        else:
+            self.reactor.add_session(session)
+        return True
+    
+    def _session_opened(self):
+        with self._stats_lock:
+            self.active_sessions += 1
+            self.total_sessions += 1
+    
+    def _session_closed(self):
+        with self._stats_lock:
+            self.active_sessions -= 1
+    
+    def _session_finished(self, session: ProxySession):
+        if self.sweeper is not None:
+            self.sweeper.discard(session)
+        if session.probed is not None:
+            prober, backend = session.probed
+            session.probed = None
+            prober.session_closed(backend)
+        with self._stats_lock:
+            self.sessions.discard(session)
+            self._bytes_in += session.bytes_in
+            self._bytes_out += session.bytes_out
+            if session.opened_at is not None:
+                reason = session.close_reason or 'shutdown'
+                self.sessions_closed[reason] = self.sessions_closed.get(reason, 0) + 1
+    
+    def _handshake_started(self) -> bool:
+        with self._stats_lock:
+            self.handshakes += 1
+        return True
+    
+    def _handshake_finished(self, addr, admission: Optional[AdmissionController],
+                            authenticated: bool) -> bool:
+        """握手阶段结束，归还准入槽位"""
+        with self._stats_lock:
+            self.handshakes -= 1
+        if admission is not None:
+            admission.release(addr, authenticated)
+        return False
+    
+    def _auth_failed(self):
+        with self._stats_lock:
+            self.auth_failures += 1
+    
+    def live_sessions(self) -> List[ProxySession]:
+        """进行中的会话"""
+        with self._stats_lock:
+            return list(self.sessions)
+    
+    def pending(self) -> int:
+        """进行中的会话和握手数，排空时等待其归零"""
+        with self._stats_lock:
+            return self.active_sessions + self.handshakes
+    
+    def stats(self) -> dict:
+        """端口状态快照"""
+        with self._stats_lock:
+            bytes_in = self._bytes_in + sum(session.bytes_in for session in self.sessions)
+            bytes_out = self._bytes_out + sum(session.bytes_out for session in self.sessions)
+            return {
+                'listening': self.running,
+                'target': self.describe(),
+                'active_sessions': self.active_sessions,
+                'total_sessions': self.total_sessions,
+                'handshakes': self.handshakes,
+                'auth_failures': self.auth_failures,
+                'backend_failures': self.backend_failures,
+                'unreachable_rejected': self.unreachable_rejected,
+                'bytes_in': bytes_in,
+                'bytes_out': bytes_out,
+                'handshake_seconds': self.handshake_seconds.snapshot(),
+                'backend_connect_seconds': self.backend_connect_seconds.snapshot(),
+                'sessions_closed': dict(self.sessions_closed),
+                **(self.breaker.stats() if self.breaker is not None else {}),
+                **({'backend_up': self.prober.available(self.backends)}
+                   if self.prober is not None and self.backends else {}),
+            }
+    
     def stop(self):
         """停止SSH服务器"""
         self.running = False
+        if self.acceptor is not None:
+            # 由accept循环线程先注销再关闭，避免selector中残留已关闭的fd
+            self.acceptor.remove_listener(self)
+            return
         if self.sock:
             try:
                 self.sock.close()
@@ -311,102 +1272,872 @@ class SSHProxyServer:
                 pass
 
 
+class RoutedProxyServer(SSHProxyServer):
+    """按用户名路由的SSH端口：一个监听服务设备索引中的所有设备"""
+    
+    # 汇总到路由端口的各设备计数
+    TOTALS = ('active_sessions', 'total_sessions', 'backend_failures', 'unreachable_rejected', 'bytes_in', 'bytes_out')
+    
+    def __init__(self, port: int, index: DeviceIndex, auth: AuthStore,
+                 host_keys: List[paramiko.PKey], reactor=None, reuse_port: bool = False,
+                 algorithms: Optional[dict] = None):
+        super().__init__(port, '', 0, auth, host_keys, reactor=reactor,
+                         reuse_port=reuse_port, algorithms=algorithms)
+        self.index = index
+        self.separators = '+@'
+        # 用户名未指定设备或指定分组时是否显示菜单
+        self.menu = True
+        self.menu_timeout = 30.0
+        self.menu_limit = 50
+        # reactor模式下设备菜单在独立的线程中等待输入，不占用握手线程池；
+        # 同时打开的菜单超过menu_workers时提示在用户名中指定设备
+        self.menu_workers = 16
+        self._menu_slots = threading.BoundedSemaphore(self.menu_workers)
+        # 已有过会话的设备 -> 该设备的SSHProxyServer（不监听），各自维护会话统计、熔断器和共享会话
+        self.targets: Dict[str, SSHProxyServer] = {}
+        self._targets_lock = threading.Lock()
+        # 正在等待菜单输入的连接数
+        self.menus = 0
+    
+    def configure(self, routing: dict):
+        """应用routing配置段，路由端口自身的SSH连接使用全局keepalive配置"""
+        self.separators = str(routing.get('separators', '+@')) or '+@'
+        self.menu = bool(routing.get('menu', True))
+        self.menu_timeout = float(routing.get('menu_timeout', 30))
+        self.menu_limit = int(routing.get('menu_limit', 50))
+        menu_workers = max(int(routing.get('menu_workers', 16)), 1)
+        if menu_workers != self.menu_workers:
+            # 已打开的菜单结束时归还旧的信号量
+            self.menu_workers = menu_workers
+            self._menu_slots = threading.BoundedSemaphore(menu_workers)
+        try:
+            self.keepalive = KeepaliveSettings.from_config(self.keepalive_defaults)
+        except (TypeError, ValueError) as e:
+            logger.error(f"路由端口的keepalive配置无效，使用默认值: {e}")
+            self.keepalive = KeepaliveSettings()
+    
+    def update(self, index: DeviceIndex, defaults_changed: bool = False):
+        """替换设备索引：更新配置变化的设备，停止已移除设备的熔断器，已建立的会话不受影响"""
+        self.index = index
+        with self._targets_lock:
+            for key, target in list(self.targets.items()):
+                device = index.get(key)
+                if device is None:
+                    target.stop()
+                    del self.targets[key]
+                    continue
+                target.tuning_defaults = self.tuning_defaults
+                target.keepalive_defaults = self.keepalive_defaults
+                target.breaker_defaults = self.breaker_defaults
+                target.recorder = self.recorder
+                target.prober = self.prober
+                target.sweeper = self.sweeper
+                if defaults_changed or target.mapping != device.mapping:
+                    target.apply_mapping(device.mapping)
+    
+    def describe(self) -> str:
+        return f"按用户名路由({len(self.index)}台设备)"
+    
+    def _new_handler(self) -> SSHServerHandler:
+        return RoutedServerHandler(self.auth, self.port, self.separators, on_auth_failure=self._auth_failed)
+    
+    def _serve(self, channel, handler: RoutedServerHandler, addr) -> bool:
+        if self.reactor is not None and self._needs_menu(handler):
+            return self._serve_menu(channel, handler, addr)
+        device = self._select_device(channel, handler)
+        if device is None:
+            channel.close()
+            return False
+        return self._serve_device(device, channel, handler, addr)
+    
+    def _needs_menu(self, handler: RoutedServerHandler) -> bool:
+        """用户名中没有指定设备（或指定的是分组）时需要等待用户在菜单中选择"""
+        return self.menu and (not handler.target or self.index.get(handler.target) is None)
+    
+    def _serve_menu(self, channel, handler: RoutedServerHandler, addr) -> bool:
+        """reactor模式：菜单交给独立线程（最多menu_workers个），握手线程立即返回处理其他登录"""
+        slots = self._menu_slots
+        if not slots.acquire(blocking=False):
+            channel.sendall("错误: 同时打开的设备菜单过多，请在用户名中指定设备，如 user+设备名\r\n".encode())
+            channel.close()
+            return False
+        with self._stats_lock:
+            self.menus += 1
+        thread = threading.Thread(target=self._run_menu, args=(channel, handler, addr, slots),
+                                  name='device-menu', daemon=True)
+        thread.start()
+        return True
+    
+    def _run_menu(self, channel, handler: RoutedServerHandler, addr, slots: threading.BoundedSemaphore):
+        """在菜单线程中选择设备并建立会话，会话未交给reactor时关闭transport"""
+        transport = channel.get_transport()
+        handed_over = False
+        try:
+            device = self._select_device(channel, handler)
+            if device is not None:
+                handed_over = self._serve_device(device, channel, handler, addr)
+        except Exception as e:
+            logger.debug("设备菜单异常: %s", e, extra={'event': handler.log_fields})
+        finally:
+            with self._stats_lock:
+                self.menus -= 1
+            slots.release()
+            if not handed_over:
+                channel.close()
+                transport.close()
+    
+    def _serve_device(self, device, channel, handler: RoutedServerHandler, addr) -> bool:
+        logger.info("用户 %s 经路由端口 %s 访问设备 %s", handler.user.name, self.port, device.name,
+                    extra={'event': dict(handler.log_fields, event='route', user=handler.user.name, device=device.name)})
+        return self._target(device)._serve(channel, handler, addr)
+    
+    def _select_device(self, channel, handler: RoutedServerHandler):
+        """按用户名中的设备名（O(1)查找）选择设备，未指定或为分组时显示菜单"""
+        user = handler.user
+        candidates = None
+        if handler.target:
+            device = self.index.get(handler.target)
+            if device is not None:
+                if user.allows_device(device):
+                    return device
+                channel.sendall(f"错误: 无权访问设备 {device.name}\r\n".encode())
+                return None
+            candidates = self.index.group(handler.target)
+            if not candidates:
+                channel.sendall(f"错误: 未知的设备或分组 {handler.target}\r\n".encode())
+                return None
+        if not self.menu:
+            channel.sendall("错误: 请在用户名中指定设备，如 user+设备名\r\n".encode())
+            return None
+        return choose_device(channel, self.index, candidates, user.allows_device,
+                             self.menu_timeout, self.menu_limit)
+    
+    def _target(self, device) -> SSHProxyServer:
+        """设备首次被访问时创建其SSHProxyServer，之后复用"""
+        with self._targets_lock:
+            target = self.targets.get(device.key)
+            if target is None:
+                target = SSHProxyServer(
+                    self.port, device.mapping['host'], device.mapping.get('port', 23),
+                    self.auth, self.host_keys, reactor=self.reactor, algorithms=self.algorithms
+                )
+                target.tuning_defaults = self.tuning_defaults
+                target.keepalive_defaults = self.keepalive_defaults
+                target.breaker_defaults = self.breaker_defaults
+                target.apply_mapping(device.mapping)
+                target.recorder = self.recorder
+                target.resolver = self.resolver
+                target.prober = self.prober
+                target.sweeper = self.sweeper
+                self.targets[device.key] = target
+            return target
+    
+    def stats(self) -> dict:
+        """路由端口自身的握手/认证计数，加上各设备会话计数的汇总"""
+        stats = super().stats()
+        with self._targets_lock:
+            targets = list(self.targets.items())
+        routes = {}
+        breakers_open = 0
+        for key, target in targets:
+            item = target.stats()
+            for name in self.TOTALS:
+                stats[name] += item[name]
+            merge_counters(stats['backend_connect_seconds'], item['backend_connect_seconds'])
+            merge_counters(stats['sessions_closed'], item['sessions_closed'])
+            breakers_open += bool(item.get('breaker_open'))
+            device = self.index.get(key)
+            routes[device.name if device is not None else key] = {
+                name: item.get(name) for name in
+                ('target', 'active_sessions', 'total_sessions', 'backend_failures', 'breaker', 'backend_up')
+            }
+        stats['devices'] = len(self.index)
+        stats['breakers_open'] = breakers_open
+        stats['routes'] = routes
+        return stats
+    
+    def live_sessions(self) -> List[ProxySession]:
+        with self._targets_lock:
+            targets = list(self.targets.values())
+        return super().live_sessions() + [session for target in targets for session in target.live_sessions()]
+    
+    def pending(self) -> int:
+        with self._targets_lock:
+            targets = list(self.targets.values())
+        return super().pending() + self.menus + sum(target.pending() for target in targets)
+    
+    def stop(self):
+        """停止监听和各设备的熔断探测，已建立的会话和打开的菜单继续运行"""
+        with self._targets_lock:
+            for target in self.targets.values():
+                target.stop()
+        super().stop()
+
+
 class ProxyManager:
     """代理管理器，管理所有的SSH代理服务器"""
     
-    def __init__(self, config_file: str = 'config.yaml'):
+    def __init__(self, config_file: str = 'config.yaml', worker_id: Optional[int] = None,
+                 listeners: Optional[Dict[int, socket.socket]] = None,
+                 profile: Optional[StartupProfile] = None):
         self.config_file = config_file
+        # 由WorkerSupervisor启动时为worker编号，监听端口使用SO_REUSEPORT
+        self.worker_id = worker_id
+        # 已经在监听的socket（端口 -> socket）：systemd或旧进程交出的，以及启动时提前打开的，启动对应端口时直接使用
+        self.inherited: Dict[int, socket.socket] = dict(listeners or {})
+        # 启动各阶段的耗时；exit_after_start为True时启动完成后输出报告并退出（--profile-startup）
+        self.profile = profile or StartupProfile()
+        self.exit_after_start = False
+        self._keygen_thread: Optional[threading.Thread] = None
+        # 发布后台生成的主机密钥与注册新端口互斥，新端口不会错过新密钥
+        self._host_keys_lock = threading.Lock()
         self.config = None
         self.servers: Dict[int, SSHProxyServer] = {}
-        self.server_threads: Dict[int, threading.Thread] = {}
-        self.host_key = None
+        self.host_keys: List[paramiko.PKey] = []
+        self.algorithms: dict = {}
+        self.auth: Optional[AuthStore] = None
+        self.admission: Optional[AdmissionController] = None
+        self.reactor: Optional['Reactor'] = None
+        # 所有端口的监听socket共用一个accept循环
+        self.acceptor: Optional[Acceptor] = None
+        self.recorder: Optional[Recorder] = None
+        self.resolver: Optional[BackendResolver] = None
+        self.prober: Optional[BackendProber] = None
+        self.sweeper: Optional[SessionSweeper] = None
+        # 按用户名路由的端口（routing.enabled），与按端口的映射并存
+        self.router: Optional[RoutedProxyServer] = None
+        self.metrics_server = None
+        self.status_server = None
+        self.handoff_server = None
         self.running = False
+        # 正在排空：不再接受新连接，等待已建立的会话结束
+        self.draining = False
+        self._drain_requested = False
+        self._reload_requested = False
+        self._config_mtime = None
+        self._pending_mtime = None
         
     def load_config(self):
-        """加载配置文件"""
+        """加载配置文件（main()已为设置日志读取过时直接使用）"""
         try:
-            with open(self.config_file, 'r', encoding='utf-8') as f:
-                self.config = yaml.safe_load(f)
+            self._config_mtime = self._stat_config()
+            if self.config is None:
+                self.config = read_config(self.config_file)
             logger.info(f"配置文件加载成功: {self.config_file}")
         except Exception as e:
             logger.error(f"加载配置文件失败: {e}")
             raise
+    
+    def _stat_config(self) -> Optional[int]:
+        try:
+            return os.stat(self.config_file).st_mtime_ns
+        except OSError:
+            return None
+    
+    @staticmethod
+    def enabled_mappings(config: dict) -> Dict[int, dict]:
+        """返回配置中已启用且配置了目标地址的映射"""
+        mappings = {}
+        for port, mapping in (config.get('mappings') or {}).items():
+            if mapping and mapping.get('enabled', False) and mapping.get('host'):
+                mappings[int(port)] = mapping
+        return mappings
         
-    def setup_host_key(self):
-        """设置SSH主机密钥"""
-        host_key_file = self.config['ssh'].get('host_key', 'ssh_host_key')
+    @classmethod
+    def backends(cls, config: dict, probed: bool = False) -> set:
+        """
+        已启用映射（启用路由时加上可路由设备）的所有后端 (host, port)，包括备用后端。
+        probed为True时不含设置了 probe: false 的映射
+        """
+        targets = set()
+        mappings = list(cls.enabled_mappings(config).values())
+        if (config.get('routing') or {}).get('enabled', False):
+            mappings.extend(device_mappings(config).values())
+        for mapping in mappings:
+            if probed and not mapping.get('probe', True):
+                continue
+            targets.update(parse_backends(mapping))
+        return targets
         
-        # 确保目录存在
-        os.makedirs(os.path.dirname(host_key_file) or '.', exist_ok=True)
+    def listeners(self) -> List[SSHProxyServer]:
+        """所有监听中的服务器，包括路由端口"""
+        servers = list(self.servers.values())
+        if self.router is not None:
+            servers.append(self.router)
+        return servers
         
-        if os.path.exists(host_key_file):
+    def setup_host_keys(self, background: bool = False):
+        """
+        加载或生成SSH主机密钥，并检查算法偏好配置。
+        background为True且有密钥尚未生成时不等待：先用已有的密钥（都没有时用临时密钥）提供服务，
+        后台生成完成后替换所有端口使用的密钥
+        """
+        ssh_config = self.config['ssh']
+        self.algorithms = validate_algorithms(ssh_config.get('algorithms'))
+        if background and ssh_config.get('temporary_key', True):
+            keys = load_host_keys(ssh_config, generate=False)
+            if len(keys) < len(host_key_specs(ssh_config)):
+                if not keys:
+                    keys = [temporary_host_key()]
+                    logger.warning("SSH主机密钥尚未生成，生成期间使用临时密钥（期间连接的客户端之后会看到主机密钥变化），"
+                                   "建议安装时运行 python manage.py keygen")
+                self.host_keys = keys
+                self._keygen_thread = threading.Thread(target=self._generate_host_keys, name='keygen', daemon=True)
+                self._keygen_thread.start()
+                return
+        self.host_keys = load_host_keys(ssh_config)
+        logger.info(f"SSH主机密钥类型: {', '.join(key.get_name() for key in self.host_keys)}")
+    
+    def _generate_host_keys(self):
+        """后台生成缺少的主机密钥"""
+        try:
+            keys = load_host_keys(self.config['ssh'])
+        except Exception as e:
+            logger.error(f"生成SSH主机密钥失败，继续使用当前密钥: {e}")
+            return
+        # 发布新的列表而不修改旧列表：正在握手的连接继续使用它读到的列表，之后的握手使用新密钥
+        with self._host_keys_lock:
+            self.host_keys = keys
+            for server in self.listeners():
+                server.host_keys = keys
+        self.profile.mark('host_keys_generated')
+        logger.info(f"SSH主机密钥已就绪: {', '.join(key.get_name() for key in keys)}")
+    
+    def apply_admission(self, admission_config: Optional[dict]):
+        """按（新的）配置启用、更新或关闭握手准入控制"""
+        try:
+            if not admission_config:
+                self.admission = None
+            elif self.admission is None:
+                self.admission = AdmissionController.from_config(admission_config)
+            else:
+                self.admission.configure(admission_config)
+        except ValueError as e:
+            logger.error(f"准入控制配置无效，保持原配置: {e}")
+            return
+        for server in self.listeners():
+            server.admission = self.admission
+    
+    def setup_auth(self):
+        """加载用户、公钥和端口权限，替换所有端口使用的认证库"""
+        self.auth = AuthStore.from_config(self.config)
+        for server in self.listeners():
+            server.auth = self.auth
+        users, keys = self.auth.summary()
+        logger.info(f"认证配置已加载: {users} 个用户，{keys} 个公钥")
+    
+    def prepare(self):
+        """加载配置并准备主机密钥"""
+        self.load_config()
+        self.setup_host_keys()
+        self.setup_auth()
+    
+    def open_listeners(self):
+        """在加载主机密钥和认证配置之前先监听所有启用的端口，期间到达的连接在内核队列中等待"""
+        ports = list(self.enabled_mappings(self.config))
+        routing = self.config.get('routing') or {}
+        if routing.get('enabled', False):
+            ports.append(int(routing.get('port', 4000)))
+        for port in ports:
+            if port in self.inherited:
+                continue
             try:
-                self.host_key = paramiko.RSAKey.from_private_key_file(host_key_file)
-                logger.info(f"加载SSH主机密钥: {host_key_file}")
-            except Exception as e:
-                logger.warning(f"加载主机密钥失败: {e}，将生成新密钥")
-                self.host_key = None
-        
-        if not self.host_key:
-            logger.info("生成新的SSH主机密钥...")
-            self.host_key = paramiko.RSAKey.generate(2048)
-            self.host_key.write_private_key_file(host_key_file)
-            logger.info(f"SSH主机密钥已保存: {host_key_file}")
+                self.inherited[port] = listen_socket(port, reuse_port=self.worker_id is not None)
+            except OSError:
+                # 由start_server再次尝试并记录错误
+                continue
+            self.profile.mark('first_listening')
+        self.profile.mark('listening')
     
     def start(self):
-        """启动所有配置的代理服务器"""
+        """启动所有配置的代理服务器：先监听端口，再加载密钥、认证和后台服务，最后开始接受连接"""
         self.load_config()
-        self.setup_host_key()
+        self.profile.mark('config')
+        if self.worker_id is None and not self.exit_after_start:
+            # 在绑定端口和启动指标服务之前接管旧进程的监听socket
+            self.take_over_listeners()
+        self.open_listeners()
+        self.setup_host_keys(background=self.worker_id is None)
+        self.profile.mark('host_keys')
+        self.setup_auth()
+        self.profile.mark('auth')
         
-        username = self.config['ssh']['username']
-        password = self.config['ssh']['password']
+        self.start_engine()
+        self.recorder = Recorder.from_config(self.config.get('recording'))
+        self.resolver = BackendResolver.from_config(self.config.get('resolver'))
+        self.resolver.track(self.backends(self.config))
+        self.resolver.start()
+        self.apply_prober(self.config)
+        self.sweeper = SessionSweeper.from_config(self.config.get('keepalive'))
+        self.sweeper.start()
+        self.apply_admission(self.config.get('admission'))
+        self.profile.mark('services')
         
         # 启动每个已启用的映射
-        for port, mapping in self.config['mappings'].items():
-            port = int(port)
-            if mapping.get('enabled', False) and mapping.get('host'):
-                telnet_host = mapping['host']
-                telnet_port = mapping.get('port', 23)
-                
-                server = SSHProxyServer(
-                    port=port,
-                    telnet_host=telnet_host,
-                    telnet_port=telnet_port,
-                    username=username,
-                    password=password,
-                    host_key=self.host_key
-                )
-                
-                thread = threading.Thread(target=server.start)
-                thread.daemon = True
-                thread.start()
-                
-                self.servers[port] = server
-                self.server_threads[port] = thread
-                
-                logger.info(f"启动代理: SSH端口{port} -> Telnet {telnet_host}:{telnet_port}")
+        for port, mapping in self.enabled_mappings(self.config).items():
+            self.start_server(port, mapping)
+        self.apply_routing()
+        self.close_unused_listeners()
+        self.profile.mark('ready')
         
-        if not self.servers:
+        if not self.servers and self.router is None:
             logger.warning("没有启用的端口映射！请编辑config.yaml启用映射")
+        else:
+            logger.info(f"启动完成: 首个端口 {self.profile.elapsed('first_accepting'):.0f}ms 开始接受连接，"
+                        f"全部 {len(self.listeners())} 个端口 {self.profile.elapsed('ready'):.0f}ms 就绪")
+        if self.exit_after_start:
+            # 只测量启动，不占用正在运行的代理的状态端点和交接端点
+            if self._keygen_thread is not None:
+                self._keygen_thread.join()
+            print(self.profile.report())
+            self.stop()
+            return
+        if self.worker_id is None:
+            self.start_metrics()
+            self.start_status_socket()
+            self.start_handoff()
         
         self.running = True
+        self.install_reload_signal()
         
-        # 保持主线程运行
+        # 保持主线程运行，并定期检查配置文件变化
+        reload_config = self.config.get('reload') or {}
+        watch = reload_config.get('enabled', True)
+        interval = float(reload_config.get('interval', 2))
+        next_check = time.monotonic() + interval
+        status_file = self.status_file()
+        status_interval = float((self.config.get('status') or {}).get('interval', 5))
+        next_status = time.monotonic()
         try:
             while self.running:
-                time.sleep(1)
+                time.sleep(min(1.0, interval))
+                if self._drain_requested:
+                    self.drain()
+                    break
+                if self._reload_requested:
+                    self._reload_requested = False
+                    self.reload()
+                elif watch and time.monotonic() >= next_check:
+                    self._watch_config()
+                    next_check = time.monotonic() + interval
+                if self.admission is not None:
+                    self.admission.expire()
+                if status_file and time.monotonic() >= next_status:
+                    write_status(status_file, self.snapshot())
+                    next_status = time.monotonic() + status_interval
         except KeyboardInterrupt:
             logger.info("收到中断信号，正在停止...")
             self.stop()
     
+    def start_engine(self):
+        """按配置选择运行引擎：threaded(每会话线程) 或 reactor(单事件循环)，两者都由一个线程accept所有端口"""
+        engine_config = self.config.get('engine') or {}
+        mode = engine_config.get('mode', 'threaded')
+        if mode == 'reactor':
+            # 只在reactor引擎下导入（连同concurrent.futures），默认的threaded引擎启动时不需要
+            from reactor import Reactor
+            self.reactor = Reactor(handshake_workers=int(engine_config.get('handshake_workers', 32)))
+            self.acceptor = self.reactor
+            logger.info(f"使用reactor引擎，握手线程池大小 {self.reactor.handshake_workers}")
+        else:
+            if mode != 'threaded':
+                logger.warning(f"未知的引擎模式 {mode}，使用threaded")
+            self.acceptor = Acceptor()
+        thread = threading.Thread(target=self.acceptor.run, name=mode if self.reactor else 'acceptor')
+        thread.daemon = True
+        thread.start()
+    
+    def start_server(self, port: int, mapping: dict):
+        """启动单个端口映射的SSH代理服务器"""
+        telnet_host = mapping['host']
+        telnet_port = mapping.get('port', 23)
+        
+        server = SSHProxyServer(
+            port=port,
+            telnet_host=telnet_host,
+            telnet_port=telnet_port,
+            auth=self.auth,
+            host_keys=self.host_keys,
+            reactor=self.reactor,
+            reuse_port=self.worker_id is not None,
+            algorithms=self.algorithms
+        )
+        server.tuning_defaults = self.config.get('tuning') or {}
+        server.keepalive_defaults = self.config.get('keepalive') or {}
+        server.breaker_defaults = self.config.get('breaker') or {}
+        server.apply_mapping(mapping)
+        server.sweeper = self.sweeper
+        server.recorder = self.recorder
+        server.resolver = self.resolver
+        server.prober = self.prober
+        server.admission = self.admission
+        
+        if not self._listen(server):
+            return
+        with self._host_keys_lock:
+            # 后台生成的主机密钥可能在创建server之后才发布
+            server.host_keys = self.host_keys
+            self.servers[port] = server
+        logger.info(f"启动代理: SSH端口{port} -> Telnet {telnet_host}:{telnet_port}")
+    
+    def _listen(self, server: SSHProxyServer) -> bool:
+        """绑定端口（或使用接管的监听socket）并注册到accept循环"""
+        if not server.bind(self.inherited.pop(server.port, None)):
+            return False
+        server.acceptor = self.acceptor
+        self.acceptor.add_listener(server)
+        self.profile.mark('first_accepting')
+        return True
+    
+    def apply_routing(self, defaults_changed: bool = False):
+        """按routing配置启动、更新或停止按用户名路由的端口"""
+        routing = self.config.get('routing') or {}
+        port = int(routing.get('port', 4000)) if routing.get('enabled', False) else None
+        if self.router is not None and self.router.port != port:
+            logger.info(f"停止路由端口 {self.router.port}")
+            self.router.stop()
+            self.router = None
+        if port is None:
+            return
+        if port in self.servers:
+            logger.error(f"路由端口 {port} 与端口映射冲突，未启用按用户名路由")
+            return
+        
+        index = DeviceIndex.from_config(self.config)
+        if self.router is not None:
+            self.router.tuning_defaults = self.config.get('tuning') or {}
+            self.router.keepalive_defaults = self.config.get('keepalive') or {}
+            self.router.breaker_defaults = self.config.get('breaker') or {}
+            self.router.configure(routing)
+            self.router.update(index, defaults_changed)
+            logger.info(f"路由端口 {port} 设备索引已更新: {len(index)} 台设备，{len(index.groups)} 个分组")
+            return
+        
+        router = RoutedProxyServer(
+            port, index,
+            auth=self.auth,
+            host_keys=self.host_keys,
+            reactor=self.reactor,
+            reuse_port=self.worker_id is not None,
+            algorithms=self.algorithms
+        )
+        router.tuning_defaults = self.config.get('tuning') or {}
+        router.keepalive_defaults = self.config.get('keepalive') or {}
+        router.breaker_defaults = self.config.get('breaker') or {}
+        router.configure(routing)
+        router.sweeper = self.sweeper
+        router.recorder = self.recorder
+        router.resolver = self.resolver
+        router.prober = self.prober
+        router.admission = self.admission
+        if self._listen(router):
+            with self._host_keys_lock:
+                router.host_keys = self.host_keys
+                self.router = router
+            logger.info(f"启动路由端口 {port}: {len(index)} 台设备，{len(index.groups)} 个分组")
+    
+    def apply_prober(self, config: dict):
+        """按（新的）prober配置启动、更新或停止后端探测，并更新需要探测的后端"""
+        try:
+            prober = BackendProber.from_config(config.get('prober'), self.resolver)
+        except (TypeError, ValueError) as e:
+            logger.error(f"prober配置无效，保持当前设置: {e}")
+            return
+        if prober is None:
+            if self.prober is not None:
+                self.prober.stop()
+                self.prober = None
+                logger.info("后端探测已关闭")
+        elif self.prober is None:
+            self.prober = prober
+            prober.start()
+            logger.info(f"后端探测: 每 {prober.interval:.0f} 秒（不可达时每 {prober.down_interval:.0f} 秒），"
+                        f"并发 {prober.workers}")
+        else:
+            self.prober.configure(prober)
+        if self.prober is not None:
+            self.prober.track(self.backends(config, probed=True))
+        for server in self.listeners():
+            server.prober = self.prober
+    
+    def start_metrics(self):
+        """按配置启动Prometheus指标服务（多worker时由supervisor提供汇总后的指标）"""
+        address = metrics_address(self.config)
+        if address:
+            self.metrics_server = start_metrics_server(*address, self.snapshot)
+    
+    def start_status_socket(self):
+        """按配置启动本地状态端点（多worker时由supervisor提供汇总后的状态）"""
+        path = (self.config.get('status') or {}).get('socket')
+        if path:
+            self.status_server = start_status_server(path, self.snapshot)
+    
+    def shutdown_config(self) -> dict:
+        return self.config.get('shutdown') or {}
+    
+    def take_over_listeners(self):
+        """配置了handoff_socket且旧进程仍在运行时，接管其监听socket（systemd已传入时不需要）"""
+        path = self.shutdown_config().get('handoff_socket')
+        if path and not self.inherited:
+            self.inherited = request_listeners(path)
+    
+    def close_unused_listeners(self):
+        """关闭接管来（或提前打开）但没有启动对应映射的监听socket"""
+        for port, sock in self.inherited.items():
+            logger.warning(f"端口 {port} 没有启用的映射，关闭该监听socket")
+            sock.close()
+        self.inherited.clear()
+    
+    def start_handoff(self):
+        """按配置等待新进程接管监听socket（多worker时不支持）"""
+        path = self.shutdown_config().get('handoff_socket')
+        if path:
+            self.handoff_server = start_handoff_server(path, self.listening_sockets, self.release_listeners)
+    
+    def listening_sockets(self) -> Dict[int, socket.socket]:
+        """当前所有监听socket，端口 -> socket"""
+        return {server.port: server.sock for server in self.listeners() if server.running and server.sock}
+    
+    def release_listeners(self):
+        """监听socket已交给新进程：停止accept，让出指标端口和状态端点，主循环随后排空会话"""
+        self.stop_accepting()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
+        if self.status_server is not None:
+            self.status_server.close()
+            self.status_server = None
+        if self.handoff_server is not None:
+            self.handoff_server.close()
+            self.handoff_server = None
+        self._drain_requested = True
+    
+    def stop_accepting(self):
+        """关闭所有监听socket，已建立的会话和进行中的握手继续"""
+        for server in self.listeners():
+            server.stop()
+    
+    def pending_sessions(self) -> int:
+        return sum(server.pending() for server in self.listeners())
+    
+    def drain(self):
+        """停止接受新连接，等待已建立的会话结束（最多shutdown.drain_timeout秒），之后断开剩余会话并停止"""
+        shutdown = self.shutdown_config()
+        timeout = float(shutdown.get('drain_timeout', 0))
+        self.draining = True
+        self.stop_accepting()
+        pending = self.pending_sessions()
+        if pending and timeout > 0:
+            logger.info(f"停止接受新连接，等待 {pending} 个会话结束（最多 {timeout:.0f} 秒）")
+            if shutdown.get('notify', True):
+                for server in self.listeners():
+                    for session in server.live_sessions():
+                        session.notify(f"\r\n[代理正在重启，本会话最多再保持 {timeout:.0f} 秒，请尽快保存并退出]\r\n")
+            deadline = time.monotonic() + timeout
+            while pending and time.monotonic() < deadline:
+                time.sleep(0.5)
+                pending = self.pending_sessions()
+            if pending:
+                logger.warning(f"排空超时，断开剩余的 {pending} 个会话")
+            else:
+                logger.info("所有会话已结束")
+        for server in self.listeners():
+            for session in server.live_sessions():
+                session.close('shutdown')
+        # 给转发线程片刻时间关闭channel，客户端看到的是正常断开
+        deadline = time.monotonic() + 2
+        while self.pending_sessions() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        self.stop()
+    
+    def status_file(self) -> Optional[str]:
+        """状态文件路径；worker进程写各自的文件，由supervisor汇总"""
+        path = (self.config.get('status') or {}).get('file')
+        if path and self.worker_id is not None:
+            return worker_status_file(path, self.worker_id)
+        return path
+    
+    def snapshot(self) -> dict:
+        """当前进程的运行状态快照"""
+        ports = {port: server.stats() for port, server in self.servers.items()}
+        if self.router is not None:
+            ports[self.router.port] = self.router.stats()
+        return {
+            'pid': os.getpid(),
+            'worker': self.worker_id,
+            'timestamp': time.time(),
+            'engine': (self.config.get('engine') or {}).get('mode', 'threaded'),
+            'threads': threading.active_count(),
+            'draining': self.draining,
+            'active_sessions': sum(p['active_sessions'] for p in ports.values()),
+            'total_sessions': sum(p['total_sessions'] for p in ports.values()),
+            'recording': self.recorder.stats() if self.recorder else {},
+            'admission': self.admission.stats() if self.admission else {},
+            'resolver': self.resolver.stats() if self.resolver else {},
+            'prober': self.prober.stats() if self.prober else {},
+            'sweeper': self.sweeper.stats() if self.sweeper else {},
+            'ports': ports,
+        }
+    
+    def stop_server(self, port: int):
+        """停止单个端口的监听，已建立的会话继续运行直到自然结束"""
+        server = self.servers.pop(port, None)
+        if server:
+            logger.info(f"停止端口 {port} 的代理服务器")
+            server.stop()
+    
+    def install_reload_signal(self):
+        """注册SIGHUP触发配置重载，SIGTERM排空后停止（仅主线程可注册信号处理）"""
+        if threading.current_thread() is not threading.main_thread():
+            return
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, lambda signum, frame: self.request_reload())
+        # 正常停止后才会写完异步日志队列中的日志
+        signal.signal(signal.SIGTERM, self._handle_terminate)
+    
+    def _handle_terminate(self, signum, frame):
+        """配置了drain_timeout时先排空会话；未配置或排空期间再次收到SIGTERM时与Ctrl-C一样立即停止"""
+        if self._drain_requested or self.draining or not float(self.shutdown_config().get('drain_timeout', 0)):
+            raise KeyboardInterrupt
+        self._drain_requested = True
+    
+    def request_reload(self):
+        """请求主循环重载配置"""
+        self._reload_requested = True
+    
+    def _watch_config(self):
+        """配置文件修改时间变化并稳定一个检查周期后重载，避免读到写了一半的文件"""
+        mtime = self._stat_config()
+        if mtime is None or mtime == self._config_mtime:
+            self._pending_mtime = None
+            if self.auth is not None and self.auth.files_changed():
+                logger.info("authorized_keys已修改，重新加载认证配置")
+                self.setup_auth()
+            return
+        if mtime != self._pending_mtime:
+            self._pending_mtime = mtime
+            return
+        self._pending_mtime = None
+        self.reload()
+    
+    def reload(self):
+        """重新读取配置，只启动新增、停止移除、更新变更的映射，其余监听和会话不受影响"""
+        started = time.perf_counter()
+        mtime = self._stat_config()
+        try:
+            config = read_config(self.config_file)
+            if not isinstance(config, dict) or 'ssh' not in config:
+                raise ValueError("缺少ssh配置段")
+        except Exception as e:
+            # 同一版本文件不再重复尝试，等待下一次修改
+            self._config_mtime = mtime
+            logger.error(f"重载配置失败，继续使用当前配置: {e}")
+            return
+        self._config_mtime = mtime
+        parsed = time.perf_counter()
+        
+        old_ssh = self.config.get('ssh') or {}
+        old_tuning = self.config.get('tuning') or {}
+        old_keepalive = self.config.get('keepalive') or {}
+        old_breaker = self.config.get('breaker') or {}
+        self.config = config
+        wanted = self.enabled_mappings(config)
+        
+        removed = [port for port in self.servers if port not in wanted]
+        added = [port for port in wanted if port not in self.servers]
+        changed = [port for port, mapping in wanted.items()
+                   if port in self.servers and self.servers[port].mapping != mapping]
+        
+        for port in removed:
+            self.stop_server(port)
+        if self.router is not None and self.router.port in added:
+            # 端口改为普通映射，先释放路由端口
+            self.router.stop()
+            self.router = None
+        for port in added:
+            self.start_server(port, wanted[port])
+        for port in changed:
+            self.servers[port].apply_mapping(wanted[port])
+            logger.info(f"更新代理: SSH端口{port} -> Telnet {wanted[port]['host']}:{wanted[port].get('port', 23)}")
+        
+        tuning = config.get('tuning') or {}
+        keepalive = config.get('keepalive') or {}
+        breaker = config.get('breaker') or {}
+        defaults_changed = tuning != old_tuning or keepalive != old_keepalive or breaker != old_breaker
+        if defaults_changed:
+            # 全局转发参数、保活和熔断配置变化影响所有端口，只作用于之后建立的会话
+            for server in self.servers.values():
+                server.tuning_defaults = tuning
+                server.keepalive_defaults = keepalive
+                server.breaker_defaults = breaker
+                server.apply_mapping(server.mapping)
+            logger.info("转发参数(tuning)/保活(keepalive)/熔断(breaker)配置已更新")
+        if self.resolver is not None:
+            self.resolver.configure(config.get('resolver'))
+            self.resolver.track(self.backends(config))
+            self.apply_prober(config)
+        self.apply_routing(defaults_changed=defaults_changed)
+        
+        ssh_config = config['ssh']
+        self.setup_auth()
+        self.apply_admission(config.get('admission'))
+        if ssh_config.get('algorithms') != old_ssh.get('algorithms'):
+            self.algorithms = validate_algorithms(ssh_config.get('algorithms'))
+            for server in self.listeners():
+                server.algorithms = self.algorithms
+            logger.info("SSH算法偏好已更新")
+        
+        # 解析耗时随映射总数线性增长，应用耗时只取决于变更数量
+        finished = time.perf_counter()
+        logger.info(f"配置重载完成: 新增{len(added)} 移除{len(removed)} 变更{len(changed)} "
+                    f"(共{len(wanted)}个映射)，解析 {(parsed - started) * 1000:.1f}ms，"
+                    f"应用 {(finished - parsed) * 1000:.1f}ms")
+    
     def stop(self):
         """停止所有代理服务器"""
         self.running = False
+        # accept循环退出时一次关闭所有监听socket（reactor模式下同时结束所有会话）
+        if self.acceptor is not None:
+            self.acceptor.stop()
         for port, server in self.servers.items():
             logger.info(f"停止端口 {port} 的代理服务器")
             server.stop()
         self.servers.clear()
-        self.server_threads.clear()
+        if self.router is not None:
+            self.router.stop()
+            self.router = None
+        if self.recorder is not None:
+            self.recorder.stop()
+        if self.prober is not None:
+            self.prober.stop()
+        if self.sweeper is not None:
+            self.sweeper.stop()
+        if self.resolver is not None:
+            self.resolver.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+        if self.status_server is not None:
+            self.status_server.close()
+        if self.handoff_server is not None:
+            self.handoff_server.close()
+            self.handoff_server = None
+
+
+def read_config(config_file: str) -> dict:
+    """读取YAML配置，可用时使用libyaml加速大量映射的解析"""
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(config_file, 'r', encoding='utf-8') as f:
+        return yaml.load(f, Loader=loader)
+
+
+def metrics_address(config: dict) -> Optional[Tuple[str, int]]:
+    """指标服务监听地址，未启用时返回None"""
+    metrics_config = config.get('metrics') or {}
+    if not metrics_config.get('enabled', False):
+        return None
+    return metrics_config.get('host', '0.0.0.0'), int(metrics_config.get('port', 9100))
 
 
 def setup_logging(config: dict):
@@ -419,8 +2150,12 @@ def setup_logging(config: dict):
     if log_file:
         os.makedirs(os.path.dirname(log_file), exist_ok=True)
     
-    # 配置日志格式
+    # 配置日志格式: text | json（每条一行JSON，带会话ID、端口、来源地址和耗时字段）
     log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    if log_config.get('format', 'text') == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(log_format)
     
     handlers = [logging.StreamHandler(sys.stdout)]
     
@@ -432,10 +2167,19 @@ def setup_logging(config: dict):
             backupCount=log_config.get('backup_count', 5)
         )
         handlers.append(file_handler)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    
+    # 异步模式下由后台线程写出，转发和握手线程只把日志放入队列
+    if log_config.get('async', False):
+        handlers = [start_async_logging(
+            handlers,
+            queue_size=int(log_config.get('queue_size', 10000)),
+            block_timeout=float(log_config.get('block_timeout', 0.1))
+        )]
     
     logging.basicConfig(
         level=log_level,
-        format=log_format,
         handlers=handlers
     )
 
@@ -448,12 +2192,17 @@ def setup_logging(config: dict):
 
 def main():
     """主函数"""
+    profile = StartupProfile(STARTED)
+    profile.mark('imports')
+    parser = argparse.ArgumentParser(description='Telnet to SSH Proxy Server')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='以单进程启动，输出到首个端口开始接受连接和全部端口就绪的各阶段耗时后退出')
+    args = parser.parse_args()
     config_file = os.environ.get('CONFIG_FILE', 'config.yaml')
     
     # 先加载配置以设置日志
     try:
-        with open(config_file, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
+        config = read_config(config_file)
         setup_logging(config)
     except Exception as e:
         logging.basicConfig(level=logging.INFO)
@@ -464,7 +2213,32 @@ def main():
     logger.info("Telnet to SSH Proxy Server 启动中...")
     logger.info("="*50)
     
-    manager = ProxyManager(config_file)
+    # systemd socket激活时直接使用传入的监听socket，重启期间的连接在内核队列中等待
+    listeners = systemd_listeners()
+    workers = int((config.get('engine') or {}).get('workers', 1))
+    if workers > 1 and not args.profile_startup:
+        # 在fork之前准备好主机密钥，避免多个worker同时生成
+        ProxyManager(config_file).prepare()
+        status_config = config.get('status') or {}
+        shutdown_config = config.get('shutdown') or {}
+        if shutdown_config.get('handoff_socket'):
+            logger.warning("多worker模式不支持shutdown.handoff_socket，不中断重启请使用systemd socket激活")
+        supervisor = WorkerSupervisor(
+            workers,
+            run_worker=lambda worker_id: ProxyManager(config_file, worker_id, listeners).start(),
+            status_file=status_config.get('file'),
+            status_interval=float(status_config.get('interval', 5)),
+            status_socket=status_config.get('socket'),
+            metrics_address=metrics_address(config),
+            # worker收到SIGTERM后排空会话，超过该时长再强制结束
+            stop_timeout=float(shutdown_config.get('drain_timeout', 0)) + 10
+        )
+        supervisor.run()
+        return
+    
+    manager = ProxyManager(config_file, listeners=listeners, profile=profile)
+    manager.config = config
+    manager.exit_after_start = args.profile_startup
     manager.start()
 
 
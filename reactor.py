@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+单进程Reactor引擎
+所有监听socket和会话转发共用一个selector事件循环，
+只有阻塞的SSH握手、认证和后端连接交给有界线程池
+"""
+
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from acceptor import Acceptor
+
+logger = logging.getLogger(__name__)
+
+
+class Reactor(Acceptor):
+    """单线程事件循环，驱动所有监听socket和ProxySession"""
+
+    # 有会话SSH窗口已满时重试写入的间隔（秒）
+    BACKPRESSURE_RETRY = 0.01
+
+    def __init__(self, handshake_workers: int = 32):
+        super().__init__()
+        self.handshake_workers = handshake_workers
+        self.pool = ThreadPoolExecutor(
+            max_workers=handshake_workers,
+            thread_name_prefix='ssh-handshake'
+        )
+        self.sessions = set()
+        self._backpressured = set()
+
+    def submit(self, fn, *args):
+        """把阻塞任务（SSH握手等）交给有界线程池"""
+        try:
+            return self.pool.submit(fn, *args)
+        except RuntimeError:
+            # 线程池已关闭（正在停止）
+            logger.debug("reactor已停止，丢弃握手任务")
+            return None
+
+    def add_session(self, session):
+        """注册已连接后端的ProxySession，由事件循环负责转发"""
+        self.call_soon_threadsafe(self._register_session, session)
+
+    def run(self):
+        """运行事件循环直到stop()"""
+        self.running = True
+        self._thread = threading.current_thread()
+        try:
+            while self.running:
+                timeout = self._select_timeout(self.BACKPRESSURE_RETRY if self._backpressured else None)
+                touched = set()
+                for key, mask in self.selector.select(timeout):
+                    if callable(key.data):
+                        key.data(mask)
+                        continue
+                    session = key.data
+                    if session.running:
+                        try:
+                            session.handle_event(key.fd, mask)
+                        except Exception as e:
+                            logger.debug("会话转发异常: %s", e, extra={'event': session.log_fields})
+                            session.finish('error')
+                    touched.add(session)
+                for session in self._backpressured:
+                    if session.running:
+                        session.flush_ssh()
+                    touched.add(session)
+                for session in touched:
+                    self._settle(session)
+                self._resume_listeners()
+        except Exception:
+            logger.exception("reactor事件循环异常退出")
+        finally:
+            self._shutdown()
+
+    def _register_session(self, session):
+        if not self.running:
+            self._close_session(session)
+            return
+        self.sessions.add(session)
+        # 共享会话有新查看者加入时，在事件循环中重新计算关注的事件
+        session.wakeup = functools.partial(self.call_soon_threadsafe, self._settle, session)
+        try:
+            session.register(self.selector)
+        except Exception as e:
+            logger.debug("注册会话失败: %s", e)
+            session.running = False
+        self._settle(session)
+
+    def _settle(self, session):
+        """事件处理后更新会话的关注事件，或回收已结束的会话"""
+        if session not in self.sessions:
+            return
+        if not session.running:
+            self._close_session(session)
+            return
+        session.update_interest()
+        if session.backpressured:
+            self._backpressured.add(session)
+        else:
+            self._backpressured.discard(session)
+
+    def _close_session(self, session):
+        self.sessions.discard(session)
+        self._backpressured.discard(session)
+        session.wakeup = None
+        session.unregister()
+        session.cleanup()
+
+    def _shutdown(self):
+        self.running = False
+        for session in list(self.sessions):
+            self._close_session(session)
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        super()._shutdown()
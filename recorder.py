@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+会话录像
+以asciicast v2格式记录后端输出（可选用户输入），支持gzip/zstd压缩。
+转发线程只把事件追加到内存队列，由后台线程批量写盘，磁盘慢不会增加按键延迟；
+队列占用超过上限时丢弃新事件并在录像中留下标记
+"""
+
+import codecs
+import gzip
+import io
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Iterator, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+SUFFIXES = {'none': '.cast', 'gzip': '.cast.gz', 'zstd': '.cast.zst'}
+
+
+def open_recording(path: str, mode: str = 'rt'):
+    """按扩展名打开（压缩的）录像文件，返回文本流"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, encoding='utf-8')
+    if path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError("读取.zst录像需要安装zstandard")
+        if 'w' in mode:
+            stream = zstandard.ZstdCompressor().stream_writer(open(path, 'wb'))
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'))
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def read_recording(path: str) -> Tuple[dict, Iterator[list]]:
+    """读取录像，返回(头部, 事件迭代器)，事件为 [秒, 类型, 数据]"""
+    f = open_recording(path)
+    header = json.loads(f.readline())
+
+    def events():
+        with f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    return header, events()
+
+
+class SessionRecording:
+    """单个代理会话的录像句柄，由转发线程调用"""
+
+    def __init__(self, recorder: 'Recorder', path: str, header: dict):
+        self.recorder = recorder
+        self.path = path
+        self.header = header
+        self.started = time.monotonic()
+        self.closed = False
+        # 因队列已满被丢弃的字节数，恢复写入时在原位置插入标记
+        self.dropped = 0
+        self._dropped_marked = 0
+        self._file = None
+        self._decoders = {}
+
+    def output(self, data: bytes):
+        """记录发给SSH客户端的数据"""
+        self.recorder.enqueue(self, 'o', data)
+
+    def input(self, data: bytes):
+        """记录用户输入（需开启record_input）"""
+        if self.recorder.record_input:
+            self.recorder.enqueue(self, 'i', data)
+
+    def resize(self, width: int, height: int):
+        """记录终端窗口大小变化"""
+        self.recorder.enqueue(self, 'r', f"{width}x{height}".encode())
+
+    def close(self):
+        """结束录像，剩余事件由写盘线程写完后关闭文件"""
+        if not self.closed:
+            self.closed = True
+            self.recorder.enqueue(self, None, b'', force=True)
+
+    def _decode(self, kind: str, data: bytes) -> str:
+        # 多字节UTF-8字符可能被拆在两次读取之间
+        decoder = self._decoders.get(kind)
+        if decoder is None:
+            decoder = self._decoders[kind] = codecs.getincrementaldecoder('utf-8')('replace')
+        return decoder.decode(data)
+
+
+class Recorder:
+    """进程内所有会话录像共用的写盘线程"""
+
+    def __init__(self, directory: str = '/app/data/recordings', compression: str = 'gzip',
+                 record_input: bool = False, max_buffer: int = 8 * 1024 * 1024,
+                 flush_interval: float = 1.0):
+        if compression not in SUFFIXES:
+            logger.warning(f"未知的录像压缩格式 {compression}，使用gzip")
+            compression = 'gzip'
+        if compression == 'zstd' and zstandard is None:
+            logger.warning("未安装zstandard，录像改用gzip压缩")
+            compression = 'gzip'
+        self.directory = directory
+        self.compression = compression
+        self.record_input = record_input
+        self.max_buffer = max_buffer
+        self.flush_interval = flush_interval
+        self.active = 0
+        self.bytes_written = 0
+        self.dropped_bytes = 0
+        self._queue = deque()
+        # 队列中尚未写盘的字节数
+        self._buffered = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._ids = itertools.count(1)
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> 'Recorder':
+        """由配置文件的recording段创建"""
+        config = config or {}
+        return cls(
+            directory=config.get('directory', '/app/data/recordings'),
+            compression=config.get('compression', 'gzip'),
+            record_input=bool(config.get('record_input', False)),
+            max_buffer=int(config.get('max_buffer', 8 * 1024 * 1024)),
+            flush_interval=float(config.get('flush_interval', 1.0)),
+        )
+
+    def open(self, port: int, peer: str, term: str = 'vt100',
+             width: int = 80, height: int = 24, title: str = '') -> SessionRecording:
+        """为新会话创建录像，文件在写盘线程中第一次写入时才创建"""
+        self._ensure_thread()
+        now = time.time()
+        name = (f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{peer}-"
+                f"{os.getpid()}-{next(self._ids)}{SUFFIXES[self.compression]}")
+        path = os.path.join(self.directory, str(port), name.replace(':', '_'))
+        header = {
+            'version': 2,
+            'width': width,
+            'height': height,
+            'timestamp': int(now),
+            'env': {'TERM': term},
+            'title': title,
+        }
+        with self._lock:
+            self.active += 1
+        return SessionRecording(self, path, header)
+
+    def enqueue(self, recording: SessionRecording, kind: Optional[str], data: bytes,
+                force: bool = False):
+        """转发线程调用：只做内存追加，超出上限时丢弃
+
+        data可能是转发缓冲区的memoryview，入队时复制为bytes（已是bytes时不复制）
+        """
+        size = len(data)
+        with self._lock:
+            if not force and self._buffered + size > self.max_buffer:
+                recording.dropped += size
+                self.dropped_bytes += size
+                return
+            self._buffered += size
+        now = time.monotonic()
+        if recording.dropped != recording._dropped_marked:
+            dropped = recording.dropped - recording._dropped_marked
+            recording._dropped_marked = recording.dropped
+            self._queue.append((recording, now, 'm', str(dropped).encode()))
+        self._queue.append((recording, now, kind, bytes(data)))
+
+    def stats(self) -> dict:
+        """录像计数"""
+        return {
+            'active': self.active,
+            'bytes_written': self.bytes_written,
+            'dropped_bytes': self.dropped_bytes,
+        }
+
+    def stop(self, timeout: float = 5.0):
+        """写完队列中的事件后停止写盘线程"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._thread = None
+        self._wakeup.set()
+        thread.join(timeout)
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='recorder', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        thread = threading.current_thread()
+        while self._thread is thread:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        """一次取出队列中的全部事件，按录像分组写盘"""
+        batch = []
+        size = 0
+        while self._queue:
+            item = self._queue.popleft()
+            batch.append(item)
+            if item[2] != 'm':
+                # 丢弃标记不计入缓冲占用
+                size += len(item[3])
+        if not batch:
+            return
+        with self._lock:
+            self._buffered -= size
+
+        lines = {}
+        closing = []
+        for recording, at, kind, data in batch:
+            if kind is None:
+                closing.append(recording)
+                continue
+            if kind == 'm':
+                text = f"录像缓冲区已满，丢弃 {data.decode()} 字节"
+            elif kind == 'r':
+                text = data.decode()
+            else:
+                text = recording._decode(kind, data)
+            if text:
+                elapsed = round(at - recording.started, 6)
+                lines.setdefault(recording, []).append(json.dumps([elapsed, kind, text], ensure_ascii=False))
+
+        for recording, chunks in lines.items():
+            self._write(recording, chunks)
+        for recording in closing:
+            self._close(recording)
+
+    def _write(self, recording: SessionRecording, chunks: list):
+        if not chunks:
+            return
+        try:
+            if recording._file is None:
+                os.makedirs(os.path.dirname(recording.path), exist_ok=True)
+                recording._file = open_recording(recording.path, 'wt')
+                chunks.insert(0, json.dumps(recording.header, ensure_ascii=False))
+            text = '\n'.join(chunks) + '\n'
+            recording._file.write(text)
+            recording._file.flush()
+            self.bytes_written += len(text)
+        except Exception as e:
+            logger.error(f"写入会话录像失败 {recording.path}: {e}")
+
+    def _close(self, recording: SessionRecording):
+        with self._lock:
+            self.active -= 1
+        if recording._file is None:
+            return
+        try:
+            recording._file.close()
+        except Exception as e:
+            logger.debug(f"关闭会话录像失败 {recording.path}: {e}")
+        recording._file = None
+        logger.info(f"会话录像已保存: {recording.path}")
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+后端地址解析与连接
+映射的后端主机名在加载配置时解析并缓存，后台线程在TTL到期后刷新，登录时直接使用缓存，
+DNS变慢或暂时失败不影响会话建立（刷新失败时继续使用旧地址）。
+连接时按Happy Eyeballs (RFC 8305) 交替IPv6/IPv4地址、错开发起并行连接，第一个成功的连接胜出；
+映射可配置备用后端（如冗余的串口服务器），按顺序或并行尝试
+"""
+
+import errno
+import logging
+import os
+import selectors
+import socket
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (address family, sockaddr)
+Address = Tuple[int, tuple]
+Backend = Tuple[str, int]
+
+FAILOVER_MODES = ('parallel', 'order')
+
+
+def parse_backends(mapping: dict) -> List[Backend]:
+    """映射的主后端 host/port 加上 backends 中的备用后端"""
+    backends = [(mapping['host'], int(mapping.get('port', 23)))]
+    for spec in mapping.get('backends') or []:
+        if isinstance(spec, str):
+            host, _, port = spec.rpartition(':') if spec.count(':') == 1 else (spec, '', '')
+            backends.append((host, int(port or 23)))
+        elif spec and spec.get('host'):
+            backends.append((spec['host'], int(spec.get('port', 23))))
+    return backends
+
+
+def interleave(addresses: List[Address]) -> List[Address]:
+    """按RFC 8305交替地址族，保持getaddrinfo返回的首选地址族在前"""
+    if not addresses:
+        return []
+    first = addresses[0][0]
+    preferred = [a for a in addresses if a[0] == first]
+    others = [a for a in addresses if a[0] != first]
+    result = []
+    for i in range(max(len(preferred), len(others))):
+        result.extend(group[i] for group in (preferred, others) if i < len(group))
+    return result
+
+
+def connect_first(addresses: List[Address], timeout: float, delay: float = 0.25,
+                  prepare: Optional[Callable[[socket.socket], None]] = None) -> socket.socket:
+    """
+    错开delay秒依次发起连接，前一个失败时立即发起下一个，返回最先建立的连接。
+    全部失败或超时时抛出OSError。prepare在connect之前设置socket选项
+    """
+    deadline = time.monotonic() + timeout
+    queue = list(addresses)
+    pending: Dict[socket.socket, tuple] = {}
+    errors = []
+    winner = None
+    selector = selectors.DefaultSelector()
+    next_start = time.monotonic()
+    try:
+        while (queue or pending) and winner is None:
+            now = time.monotonic()
+            if now >= deadline:
+                errors.append(f"连接超时({timeout:.0f}秒)")
+                break
+            if queue and (now >= next_start or not pending):
+                family, sockaddr = queue.pop(0)
+                sock = socket.socket(family, socket.SOCK_STREAM)
+                try:
+                    if prepare is not None:
+                        prepare(sock)
+                    sock.setblocking(False)
+                    err = sock.connect_ex(sockaddr)
+                except OSError as e:
+                    err = e.errno or errno.EINVAL
+                if err == 0:
+                    winner = sock
+                    break
+                if err not in (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+                    errors.append(f"{sockaddr[0]}: {os.strerror(err)}")
+                    sock.close()
+                    continue
+                selector.register(sock, selectors.EVENT_WRITE)
+                pending[sock] = sockaddr
+                next_start = now + delay
+                continue
+            wait = deadline - now
+            if queue:
+                wait = min(wait, next_start - now)
+            for key, _ in selector.select(max(wait, 0)):
+                sock = key.fileobj
+                selector.unregister(sock)
+                sockaddr = pending.pop(sock)
+                err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                if err == 0:
+                    winner = sock
+                    break
+                errors.append(f"{sockaddr[0]}: {os.strerror(err)}")
+                sock.close()
+                # 失败时不必等满delay，立即尝试下一个地址
+                next_start = time.monotonic()
+    finally:
+        for sock in pending:
+            sock.close()
+        selector.close()
+    if winner is None:
+        raise OSError('; '.join(errors) or "没有可用的地址")
+    return winner
+
+
+class CacheEntry:
+    """一个 (host, port) 的解析结果"""
+
+    __slots__ = ('addresses', 'expires', 'error')
+
+    def __init__(self, addresses: List[Address], expires: float, error: Optional[str] = None):
+        self.addresses = addresses
+        self.expires = expires
+        self.error = error
+
+
+class BackendResolver:
+    """后端地址缓存，由后台线程按TTL刷新"""
+
+    def __init__(self, ttl: float = 300.0, negative_ttl: float = 30.0,
+                 connect_timeout: float = 10.0, connect_delay: float = 0.25):
+        self.ttl = ttl
+        # 解析失败后重试的间隔
+        self.negative_ttl = negative_ttl
+        self.connect_timeout = connect_timeout
+        # Happy Eyeballs中相邻两次连接尝试的间隔
+        self.connect_delay = connect_delay
+        self.failures = 0
+        self._cache: Dict[Backend, CacheEntry] = {}
+        self._tracked = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[dict]) -> 'BackendResolver':
+        config = config or {}
+        return cls(
+            ttl=float(config.get('ttl', 300)),
+            negative_ttl=float(config.get('negative_ttl', 30)),
+            connect_timeout=float(config.get('connect_timeout', 10)),
+            connect_delay=float(config.get('connect_delay', 0.25)),
+        )
+
+    def configure(self, config: Optional[dict]):
+        """热重载时更新参数，已缓存的地址保留到各自到期"""
+        other = self.from_config(config)
+        self.ttl = other.ttl
+        self.negative_ttl = other.negative_ttl
+        self.connect_timeout = other.connect_timeout
+        self.connect_delay = other.connect_delay
+
+    def start(self):
+        """启动后台刷新线程"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, name='resolver', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        self._wakeup.set()
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def track(self, backends: Iterable[Backend]):
+        """设置需要保持解析的后端（配置加载或重载时调用），在后台预先解析，移除不再使用的缓存"""
+        with self._lock:
+            self._tracked = set(backends)
+            for backend in list(self._cache):
+                if backend not in self._tracked:
+                    del self._cache[backend]
+        self._wakeup.set()
+
+    def resolve(self, host: str, port: int) -> List[Address]:
+        """返回缓存的地址；尚未解析时在调用线程中解析，已过期时先返回旧地址并由后台刷新"""
+        entry = self._cache.get((host, port))
+        if entry is not None and entry.addresses:
+            if entry.expires <= time.monotonic():
+                self._wakeup.set()
+            return entry.addresses
+        if entry is None or entry.expires <= time.monotonic():
+            entry = self._lookup(host, port, entry)
+        if not entry.addresses:
+            raise OSError(f"解析 {host} 失败: {entry.error}")
+        return entry.addresses
+
+    def connect(self, backends: List[Backend], failover: str = 'parallel',
+                prepare: Optional[Callable[[socket.socket], None]] = None) -> Tuple[socket.socket, Backend]:
+        """
+        连接后端，返回 (socket, 实际连接的后端)
+        parallel: 所有后端的地址按顺序错开并行尝试，主后端有connect_delay的先发优势
+        order: 前一个后端的所有地址都失败后才尝试下一个（适合同时连接会抢占串口的设备）
+        """
+        errors = []
+        if failover == 'order':
+            groups = [[backend] for backend in backends]
+        else:
+            groups = [backends]
+        for group in groups:
+            candidates = []
+            owners = {}
+            for host, port in group:
+                try:
+                    addresses = interleave(self.resolve(host, port))
+                except OSError as e:
+                    errors.append(str(e))
+                    continue
+                for address in addresses:
+                    owners.setdefault(address[1], (host, port))
+                candidates.extend(addresses)
+            if not candidates:
+                continue
+            try:
+                sock = connect_first(candidates, self.connect_timeout, self.connect_delay, prepare)
+            except OSError as e:
+                errors.append(str(e))
+                continue
+            return sock, owners.get(sock.getpeername(), group[0])
+        raise OSError('; '.join(errors))
+
+    def stats(self) -> dict:
+        """缓存计数"""
+        return {'entries': len(self._cache), 'failures': self.failures}
+
+    def _lookup(self, host: str, port: int, previous: Optional[CacheEntry]) -> CacheEntry:
+        try:
+            infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            addresses = []
+            for family, _, _, _, sockaddr in infos:
+                if (family, sockaddr) not in addresses:
+                    addresses.append((family, sockaddr))
+            entry = CacheEntry(addresses, time.monotonic() + self.ttl)
+        except OSError as e:
+            self.failures += 1
+            # 刷新失败时继续使用旧地址
+            kept = previous.addresses if previous is not None else []
+            entry = CacheEntry(kept, time.monotonic() + self.negative_ttl, str(e))
+            logger.warning(f"解析后端地址失败 {host}: {e}" + ("，继续使用缓存的地址" if kept else ""))
+        with self._lock:
+            self._cache[(host, port)] = entry
+        return entry
+
+    def _refresh_loop(self):
+        while self._thread is not None:
+            now = time.monotonic()
+            with self._lock:
+                due = [backend for backend in self._tracked if backend not in self._cache]
+                due.extend(backend for backend, entry in self._cache.items() if entry.expires <= now)
+            for host, port in due:
+                if self._thread is None:
+                    return
+                self._lookup(host, port, self._cache.get((host, port)))
+            self._wakeup.wait(1.0)
+            self._wakeup.clear()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+按用户名路由
+一个SSH端口服务任意数量的设备：用户名 "user+设备" 或 "user@设备" 选择目标，
+未指定设备或指定的是分组时在认证后显示菜单。
+设备名和分组在加载配置时建成内存索引（字典），登录时的查找为O(1)，重载时整体替换
+"""
+
+import logging
+import socket
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def device_mappings(config: dict) -> Dict[str, dict]:
+    """
+    可路由的设备：mappings中设置了name的已启用映射，加上devices段（设备名 -> 与映射相同的字段）。
+    devices段中的设备只能经路由端口访问，不占用独立端口
+    """
+    devices = {}
+    for mapping in (config.get('mappings') or {}).values():
+        if mapping and mapping.get('enabled', False) and mapping.get('host') and mapping.get('name'):
+            devices[str(mapping['name'])] = mapping
+    for name, mapping in (config.get('devices') or {}).items():
+        if mapping and mapping.get('enabled', True) and mapping.get('host'):
+            devices[str(name)] = mapping
+    return devices
+
+
+def split_username(username: str, separators: str = '+@') -> Tuple[str, Optional[str]]:
+    """在第一个分隔符处把用户名拆成 (登录用户, 目标设备或分组)，没有分隔符时目标为None"""
+    positions = [username.find(sep) for sep in separators if sep in username]
+    if not positions:
+        return username, None
+    i = min(positions)
+    return username[:i], username[i + 1:] or None
+
+
+class Device:
+    """一个可路由的设备"""
+
+    __slots__ = ('name', 'mapping', 'groups')
+
+    def __init__(self, name: str, mapping: dict):
+        self.name = name
+        self.mapping = mapping
+        groups = mapping.get('group') or []
+        if isinstance(groups, str):
+            groups = [groups]
+        self.groups = tuple(str(group) for group in groups)
+
+    @property
+    def key(self) -> str:
+        return self.name.casefold()
+
+
+class DeviceIndex:
+    """设备名和分组索引，创建后只读，重载时整体替换；名称不区分大小写"""
+
+    def __init__(self):
+        self.devices: Dict[str, Device] = {}
+        self.groups: Dict[str, List[Device]] = {}
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'DeviceIndex':
+        index = cls()
+        for name, mapping in device_mappings(config).items():
+            index.add(Device(name, mapping))
+        return index
+
+    def add(self, device: Device):
+        if device.key in self.devices:
+            logger.warning(f"设备名 {device.name} 重复，使用后出现的配置")
+        self.devices[device.key] = device
+        for group in device.groups:
+            self.groups.setdefault(group.casefold(), []).append(device)
+
+    def get(self, name: str) -> Optional[Device]:
+        return self.devices.get(name.casefold())
+
+    def group(self, name: str) -> List[Device]:
+        return self.groups.get(name.casefold(), [])
+
+    def __len__(self) -> int:
+        return len(self.devices)
+
+    def __iter__(self):
+        return iter(self.devices.values())
+
+
+def read_line(channel, timeout: float) -> Optional[str]:
+    """从SSH channel读取一行输入并回显，timeout秒内未读完一行、断开或Ctrl-C/Ctrl-D时返回None"""
+    deadline = time.monotonic() + timeout
+    line = bytearray()
+    try:
+        while True:
+            # 总时长限制，逐个字符慢慢输入也不能延长
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            channel.settimeout(remaining)
+            data = channel.recv(256)
+            if not data:
+                return None
+            for byte in data:
+                if byte in (13, 10):
+                    channel.sendall(b'\r\n')
+                    return line.decode('utf-8', 'replace').strip()
+                if byte in (3, 4):
+                    return None
+                if byte in (8, 127):
+                    if line:
+                        del line[-1]
+                        channel.sendall(b'\b \b')
+                elif byte >= 32:
+                    line.append(byte)
+                    channel.sendall(bytes((byte,)))
+    except (socket.timeout, OSError, EOFError):
+        return None
+    finally:
+        try:
+            channel.settimeout(None)
+        except Exception:
+            pass
+
+
+def choose_device(channel, index: DeviceIndex, candidates: Optional[Iterable[Device]],
+                  allows: Callable[[Device], bool], timeout: float = 60.0,
+                  limit: int = 50) -> Optional[Device]:
+    """
+    认证后的设备菜单：列出前limit个可访问的设备，按编号或设备名选择。
+    candidates为None时列出全部设备；设备很多时只列出一部分，输入设备名直接按索引查找。
+    timeout为整个菜单（最多三次输入）的总时长
+    """
+    deadline = time.monotonic() + timeout
+    listed = []
+    more = False
+    for device in (index if candidates is None else candidates):
+        if not allows(device):
+            continue
+        if len(listed) >= limit:
+            more = True
+            break
+        listed.append(device)
+    if not listed:
+        channel.sendall("错误: 没有可访问的设备\r\n".encode())
+        return None
+
+    lines = ["", "可用设备:"]
+    for i, device in enumerate(listed, 1):
+        lines.append(f"  {i:>3}) {device.name:<24} {device.mapping.get('description', '')}")
+    if more:
+        lines.append("  ... 更多设备请直接输入设备名")
+    channel.sendall(('\r\n'.join(lines) + '\r\n').encode())
+
+    for _ in range(3):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        channel.sendall("请输入编号或设备名: ".encode())
+        answer = read_line(channel, remaining)
+        if not answer:
+            return None
+        if answer.isdigit() and 1 <= int(answer) <= len(listed):
+            return listed[int(answer) - 1]
+        device = index.get(answer)
+        if device is not None and allows(device):
+            return device
+        channel.sendall(f"未找到设备: {answer}\r\n".encode())
+    return None
@@ -27,15 +27,21 @@ if [ ! -f "config.yaml" ]; then
     exit 1
 fi
 
-echo "正在启动服务..."
-
 # 使用docker compose或docker-compose
 if docker compose version &> /dev/null 2>&1; then
-    docker compose up -d --build
+    COMPOSE="docker compose"
 else
-    docker-compose up -d --build
+    COMPOSE="docker-compose"
 fi
 
+# 预先生成SSH主机密钥（已存在时跳过），服务启动时不必等待生成
+echo "正在准备SSH主机密钥..."
+$COMPOSE build
+$COMPOSE run --rm --no-deps telnet-ssh-proxy python manage.py keygen
+
+echo "正在启动服务..."
+$COMPOSE up -d
+
 echo ""
 echo "========================================"
 echo "服务启动成功！"
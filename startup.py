@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+启动耗时记录
+ProxyManager在启动的各阶段打点，启动完成时记录一行摘要；
+python proxy_server.py --profile-startup 输出各阶段耗时后退出，用于比较改动前后的冷启动时间
+"""
+
+import time
+from typing import List, Optional, Tuple
+
+# 计时起点：proxy_server最先导入本模块，此时其余模块尚未导入
+STARTED = time.perf_counter()
+
+# 阶段 -> 报告中的名称
+PHASES = {
+    'imports': '导入模块',
+    'config': '读取配置',
+    'first_listening': '首个端口开始监听',
+    'listening': '全部端口开始监听',
+    'host_keys': '加载主机密钥',
+    'auth': '加载认证配置',
+    'services': '启动后台服务',
+    'first_accepting': '首个端口开始接受连接',
+    'ready': '全部端口就绪',
+    'host_keys_generated': '后台生成主机密钥完成',
+}
+
+
+class StartupProfile:
+    """记录启动各阶段完成的时间"""
+
+    def __init__(self, origin: Optional[float] = None):
+        # 计时起点（time.perf_counter()），默认为创建时
+        self.origin = time.perf_counter() if origin is None else origin
+        self.marks: List[Tuple[str, float]] = []
+
+    def mark(self, name: str):
+        """记录阶段完成的时间，同一阶段只记录第一次"""
+        if self.elapsed(name) is None:
+            self.marks.append((name, time.perf_counter()))
+
+    def elapsed(self, name: str) -> Optional[float]:
+        """阶段完成时距起点的毫秒数，尚未完成时为None"""
+        for mark, at in self.marks:
+            if mark == name:
+                return (at - self.origin) * 1000
+        return None
+
+    def report(self) -> str:
+        """各阶段完成时间及与上一阶段的间隔"""
+        lines = ["启动耗时（从导入proxy_server开始计时）:"]
+        previous = self.origin
+        for name, at in sorted(self.marks, key=lambda mark: mark[1]):
+            lines.append(f"  {PHASES.get(name, name):<12} {(at - self.origin) * 1000:8.1f}ms"
+                         f"  (+{(at - previous) * 1000:.1f}ms)")
+            previous = at
+        return '\n'.join(lines)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+本地状态端点
+代理进程（多worker时为supervisor）在Unix socket上提供内存中的运行状态，
+health_check.py 一次请求即可得到所有端口的监听、会话和后端熔断状态，
+不再逐个端口建立连接、触发SSH握手。
+协议: 客户端发送一行命令后读取一行JSON；health(默认) 返回精简的端口状态，status 返回完整快照
+"""
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# health命令返回的端口字段
+HEALTH_FIELDS = ('listening', 'target', 'active_sessions', 'breaker', 'breaker_open', 'backend_error', 'breakers_open',
+                 'backend_up')
+
+
+def health_view(status: dict) -> dict:
+    """从状态快照中取出健康检查需要的字段"""
+    view = {key: status.get(key) for key in ('pid', 'timestamp', 'engine', 'draining', 'active_sessions',
+                                             'total_sessions')}
+    view['ports'] = {
+        str(port): {key: stats.get(key) for key in HEALTH_FIELDS if key in stats}
+        for port, stats in (status.get('ports') or {}).items()
+    }
+    if status.get('workers') is not None:
+        view['workers'] = status['workers']
+    return view
+
+
+class StatusServer(socketserver.ThreadingUnixStreamServer):
+    """在Unix socket上应答状态请求，每次请求时调用collect获取最新状态"""
+
+    daemon_threads = True
+
+    def __init__(self, path: str, collect: Callable[[], dict]):
+        self.path = path
+        self.collect = collect
+        super().__init__(path, StatusHandler)
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class StatusHandler(socketserver.StreamRequestHandler):
+    timeout = 2
+
+    def handle(self):
+        try:
+            command = self.rfile.readline(64).decode('ascii', 'replace').strip() or 'health'
+        except (OSError, socket.timeout):
+            return
+        try:
+            status = self.server.collect()
+            if command == 'status':
+                body = status
+            elif command == 'health':
+                body = health_view(status)
+            else:
+                body = {'error': f"未知命令: {command}"}
+        except Exception as e:
+            logger.error(f"生成状态失败: {e}")
+            body = {'error': str(e)}
+        try:
+            self.wfile.write(json.dumps(body).encode('utf-8') + b'\n')
+        except OSError:
+            pass
+
+
+def start_status_server(path: str, collect: Callable[[], dict]) -> Optional[StatusServer]:
+    """在后台线程提供状态端点，path已存在时（上次未正常退出留下的socket文件）先删除"""
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if os.path.exists(path):
+            os.unlink(path)
+        server = StatusServer(path, collect)
+    except OSError as e:
+        logger.error(f"启动状态端点失败 {path}: {e}")
+        return None
+    thread = threading.Thread(target=server.serve_forever, name='status', daemon=True)
+    thread.start()
+    logger.info(f"状态端点: {path}")
+    return server
+
+
+def query_status(path: str, command: str = 'health', timeout: float = 2.0) -> Optional[dict]:
+    """向状态端点发送一次请求，不可用时返回None"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(command.encode('ascii') + b'\n')
+            chunks = []
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    break
+                chunks.append(data)
+                if data.endswith(b'\n'):
+                    break
+        return json.loads(b''.join(chunks))
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+多进程Worker监督者
+fork N个worker进程，各自以SO_REUSEPORT绑定所有映射端口，由内核在进程间分配连接；
+监督者负责重启异常退出的worker，并把各worker的状态汇总成一份状态文件
+"""
+
+import json
+import logging
+import os
+import signal
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metrics import start_metrics_server
+from status import start_status_server
+
+logger = logging.getLogger(__name__)
+
+
+def worker_status_file(status_file: str, worker_id: int) -> str:
+    """worker进程状态文件路径"""
+    return f"{status_file}.worker{worker_id}"
+
+
+def write_status(path: str, status: dict):
+    """原子地写入状态文件，读取方不会看到写了一半的内容"""
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(status, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.debug(f"写入状态文件失败 {path}: {e}")
+
+
+def read_status(path: str) -> Optional[dict]:
+    """读取状态文件，不存在或损坏时返回None"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def merge_counters(total: dict, item: dict) -> dict:
+    """合并两份计数快照：数值相加、布尔取或、字典递归合并，其他取先出现的值"""
+    for key, value in item.items():
+        if key not in total:
+            total[key] = json.loads(json.dumps(value)) if isinstance(value, (dict, list)) else value
+        elif isinstance(value, bool):
+            total[key] = total[key] or value
+        elif isinstance(value, (int, float)) and isinstance(total[key], (int, float)):
+            total[key] = total[key] + value
+        elif isinstance(value, dict) and isinstance(total[key], dict):
+            merge_counters(total[key], value)
+    return total
+
+
+class WorkerSupervisor:
+    """监督多个worker进程"""
+
+    # 连续快速崩溃时的最大重启间隔（秒）
+    RESTART_BACKOFF_MAX = 30.0
+    # 运行超过该时长后退出视为偶发故障，重启间隔复位（秒）
+    STABLE_UPTIME = 60.0
+
+    def __init__(self, workers: int, run_worker: Callable[[int], None],
+                 status_file: Optional[str] = None, status_interval: float = 5.0,
+                 metrics_address: Optional[Tuple[str, int]] = None,
+                 status_socket: Optional[str] = None, stop_timeout: float = 10.0):
+        self.workers = workers
+        self.run_worker = run_worker
+        self.status_file = status_file
+        self.status_interval = status_interval
+        # 指标服务由supervisor提供，内容为各worker状态文件的汇总
+        self.metrics_address = metrics_address
+        self.metrics_server = None
+        # 本地状态端点同样由supervisor提供汇总后的状态
+        self.status_socket = status_socket
+        self.status_server = None
+        # 停止时等待worker退出（排空会话）的最长时间，超时后SIGKILL
+        self.stop_timeout = stop_timeout
+        self.running = False
+        self.children: Dict[int, int] = {}
+        self.restarts: Dict[int, int] = {worker_id: 0 for worker_id in range(workers)}
+        self._started_at: Dict[int, float] = {}
+        self._backoff: Dict[int, float] = {}
+        self._restart_at: Dict[int, float] = {}
+
+    def run(self):
+        """启动所有worker并监督，直到收到SIGTERM/SIGINT"""
+        self.running = True
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._forward_signal)
+
+        logger.info(f"以 {self.workers} 个worker进程运行 (SO_REUSEPORT)")
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+        if self.metrics_address:
+            if self.status_file:
+                self.metrics_server = start_metrics_server(*self.metrics_address, self.aggregate)
+            else:
+                logger.warning("多worker模式下指标依赖状态文件汇总，请配置status.file")
+        if self.status_socket:
+            if self.status_file:
+                self.status_server = start_status_server(self.status_socket, self.aggregate)
+            else:
+                logger.warning("多worker模式下状态端点依赖状态文件汇总，请配置status.file")
+
+        next_status = time.monotonic()
+        while self.running:
+            time.sleep(0.5)
+            self._reap()
+            now = time.monotonic()
+            for worker_id, restart_at in list(self._restart_at.items()):
+                if self.running and now >= restart_at:
+                    del self._restart_at[worker_id]
+                    self._spawn(worker_id)
+            if self.status_file and now >= next_status:
+                write_status(self.status_file, self.aggregate())
+                next_status = now + self.status_interval
+
+        self._terminate_all(self.stop_timeout)
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+        if self.status_server is not None:
+            self.status_server.close()
+
+    def aggregate(self) -> dict:
+        """汇总各worker状态，对外呈现为一个服务"""
+        status = {
+            'pid': os.getpid(),
+            'timestamp': time.time(),
+            'workers': [],
+            'threads': 0,
+            'active_sessions': 0,
+            'total_sessions': 0,
+            'ports': {},
+        }
+        for worker_id in range(self.workers):
+            pid = self.children.get(worker_id)
+            snapshot = read_status(worker_status_file(self.status_file, worker_id)) if pid else None
+            if snapshot and snapshot.get('pid') != pid:
+                # 已退出worker遗留的旧文件
+                snapshot = None
+            status['workers'].append({
+                'worker': worker_id,
+                'pid': pid,
+                'alive': pid is not None,
+                'restarts': self.restarts[worker_id],
+                'updated': snapshot.get('timestamp') if snapshot else None,
+            })
+            if not snapshot:
+                continue
+            status.setdefault('engine', snapshot.get('engine'))
+            # 各worker独立探测同一组后端，探测结果不能相加，取第一个worker的
+            status.setdefault('prober', snapshot.get('prober'))
+            for key, value in snapshot.items():
+                if key in ('pid', 'worker', 'timestamp', 'engine', 'prober'):
+                    continue
+                merge_counters(status, {key: value})
+        return status
+
+    def _spawn(self, worker_id: int):
+        pid = os.fork()
+        if pid == 0:
+            # worker进程：恢复默认信号处理，由ProxyManager自行注册
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGHUP, signal.SIG_DFL)
+            if self.metrics_server is not None:
+                self.metrics_server.socket.close()
+            if self.status_server is not None:
+                self.status_server.socket.close()
+            code = 0
+            try:
+                self.run_worker(worker_id)
+            except BaseException:
+                logger.exception(f"worker {worker_id} 异常退出")
+                code = 1
+            finally:
+                # os._exit不执行atexit，先写完（异步）日志
+                logging.shutdown()
+                os._exit(code)
+        self.children[worker_id] = pid
+        self._started_at[worker_id] = time.monotonic()
+        logger.info(f"启动worker {worker_id} (pid {pid})")
+
+    def _reap(self):
+        """回收退出的worker并安排重启"""
+        while True:
+            try:
+                pid, wait_status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker_id = next((w for w, p in self.children.items() if p == pid), None)
+            if worker_id is None:
+                continue
+            del self.children[worker_id]
+            if not self.running:
+                continue
+
+            uptime = time.monotonic() - self._started_at.get(worker_id, 0)
+            if uptime >= self.STABLE_UPTIME:
+                backoff = 1.0
+            else:
+                backoff = min(self._backoff.get(worker_id, 0.5) * 2, self.RESTART_BACKOFF_MAX)
+            self._backoff[worker_id] = backoff
+            self._restart_at[worker_id] = time.monotonic() + backoff
+            self.restarts[worker_id] += 1
+            logger.warning(f"worker {worker_id} (pid {pid}) 退出({self._describe(wait_status)})，"
+                           f"{backoff:.0f}秒后重启")
+
+    @staticmethod
+    def _describe(wait_status: int) -> str:
+        if os.WIFSIGNALED(wait_status):
+            return f"信号 {os.WTERMSIG(wait_status)}"
+        return f"退出码 {os.WEXITSTATUS(wait_status)}"
+
+    def _handle_stop(self, signum, frame):
+        logger.info("收到停止信号，正在停止所有worker...")
+        self.running = False
+
+    def _forward_signal(self, signum, frame):
+        for pid in list(self.children.values()):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _terminate_all(self, timeout: float = 10.0):
+        """通知所有worker退出（各自排空会话），超时后强制结束"""
+        pids: List[int] = list(self.children.values())
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + timeout
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self.children.values()):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self._reap()
+        logger.info("所有worker已停止")
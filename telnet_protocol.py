@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Telnet协议层
+流式解析后端输出中的IAC命令并完成选项协商（NAWS/TTYPE/SGA/ECHO/BINARY），
+对用户输入中的0xFF做转义。不含IAC的数据块（可以是memoryview）原样返回，不做复制
+"""
+
+import re
+import struct
+from typing import Tuple
+
+# 命令 (RFC 854)
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+NOP = 241
+SE = 240
+
+# 选项
+BINARY = 0      # RFC 856
+ECHO = 1        # RFC 857
+SGA = 3         # RFC 858
+TTYPE = 24      # RFC 1091
+NAWS = 31       # RFC 1073
+
+TTYPE_IS = 0
+TTYPE_SEND = 1
+
+IAC_BYTE = bytes([IAC])
+IAC_SE = bytes([IAC, SE])
+# 保活用的空操作，设备忽略但会让连接上有数据流动
+IAC_NOP = bytes([IAC, NOP])
+# re可以直接搜索memoryview，不需要先复制为bytes
+IAC_SEARCH = re.compile(re.escape(IAC_BYTE)).search
+
+# 本端(客户端)愿意启用的选项：服务器DO时回复WILL
+LOCAL_OPTIONS = frozenset((BINARY, SGA, TTYPE, NAWS))
+# 允许服务器启用的选项：服务器WILL时回复DO
+REMOTE_OPTIONS = frozenset((BINARY, ECHO, SGA))
+
+# 未结束的子协商最多缓存的字节数，防止异常后端耗尽内存
+MAX_PENDING = 4096
+
+
+class TelnetProtocol:
+    """Telnet客户端侧的流式协议处理"""
+
+    def __init__(self, term: str = 'vt100', width: int = 80, height: int = 24):
+        self.term = term
+        self.width = width
+        self.height = height
+        self.local_enabled = set()
+        self.remote_enabled = set()
+        # 跨数据块被截断的命令序列
+        self._pending = b''
+        # 正在丢弃超过MAX_PENDING的子协商，直到遇到IAC SE（可能跨多个数据块）
+        self._discarding = False
+
+    def feed(self, data) -> Tuple[bytes, bytes]:
+        """解析后端数据（bytes或memoryview），返回(给用户的数据, 需要回复给后端的协商数据)"""
+        if not self._pending and not self._discarding and IAC_SEARCH(data) is None:
+            return data, b''
+        data = self._pending + bytes(data)
+        self._pending = b''
+
+        out = []
+        replies = []
+        pos = 0
+        size = len(data)
+        if self._discarding:
+            end = data.find(IAC_SE)
+            if end == -1:
+                self._skip_subnegotiation(data)
+                return b'', b''
+            self._discarding = False
+            pos = end + 2
+        while pos < size:
+            i = data.find(IAC_BYTE, pos)
+            if i == -1:
+                out.append(data[pos:])
+                break
+            if i > pos:
+                out.append(data[pos:i])
+            if i + 1 >= size:
+                self._pending = data[i:]
+                break
+            cmd = data[i + 1]
+            if cmd == IAC:
+                out.append(IAC_BYTE)
+                pos = i + 2
+            elif cmd in (DO, DONT, WILL, WONT):
+                if i + 2 >= size:
+                    self._pending = data[i:]
+                    break
+                replies.append(self._negotiate(cmd, data[i + 2]))
+                pos = i + 3
+            elif cmd == SB:
+                end = data.find(IAC_SE, i + 2)
+                if end == -1:
+                    if size - i <= MAX_PENDING:
+                        self._pending = data[i:]
+                    else:
+                        self._discarding = True
+                        self._skip_subnegotiation(data)
+                    break
+                replies.append(self._subnegotiate(data[i + 2:end]))
+                pos = end + 2
+            else:
+                # NOP、GA、DM等两字节命令对终端用户没有意义，直接丢弃
+                pos = i + 2
+        return b''.join(out), b''.join(replies)
+
+    def _skip_subnegotiation(self, data: bytes):
+        """丢弃子协商内容；末尾的IAC可能是被截断的IAC SE，留到下一个数据块"""
+        self._pending = IAC_BYTE if data.endswith(IAC_BYTE) else b''
+
+    @staticmethod
+    def encode(data: bytes) -> bytes:
+        """转义用户数据中的0xFF"""
+        if data.find(IAC_BYTE) == -1:
+            return data
+        return data.replace(IAC_BYTE, IAC_BYTE + IAC_BYTE)
+
+    def resize(self, width: int, height: int) -> bytes:
+        """更新窗口大小，已协商NAWS时返回需要发送给后端的子协商"""
+        self.width = width
+        self.height = height
+        if NAWS in self.local_enabled:
+            return self._naws()
+        return b''
+
+    def _negotiate(self, cmd: int, option: int) -> bytes:
+        if cmd == DO:
+            if option not in LOCAL_OPTIONS:
+                return bytes([IAC, WONT, option])
+            if option in self.local_enabled:
+                return b''
+            self.local_enabled.add(option)
+            reply = bytes([IAC, WILL, option])
+            if option == NAWS:
+                reply += self._naws()
+            return reply
+        if cmd == DONT:
+            if option in self.local_enabled:
+                self.local_enabled.discard(option)
+                return bytes([IAC, WONT, option])
+            return b''
+        if cmd == WILL:
+            if option not in REMOTE_OPTIONS:
+                return bytes([IAC, DONT, option])
+            if option in self.remote_enabled:
+                return b''
+            self.remote_enabled.add(option)
+            return bytes([IAC, DO, option])
+        # WONT
+        if option in self.remote_enabled:
+            self.remote_enabled.discard(option)
+            return bytes([IAC, DONT, option])
+        return b''
+
+    def _subnegotiate(self, payload: bytes) -> bytes:
+        if len(payload) >= 2 and payload[0] == TTYPE and payload[1] == TTYPE_SEND:
+            term = self.term.upper().encode('ascii', 'replace')
+            return bytes([IAC, SB, TTYPE, TTYPE_IS]) + self.encode(term) + IAC_SE
+        return b''
+
+    def _naws(self) -> bytes:
+        size = struct.pack('>HH', min(self.width, 0xFFFF), min(self.height, 0xFFFF))
+        return bytes([IAC, SB, NAWS]) + self.encode(size) + IAC_SE
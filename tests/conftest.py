@@ -0,0 +1,10 @@
+import os
+import sys
+
+# 测试直接导入仓库根目录下的模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_configure(config):
+    # 已安装的cryptography对paramiko引用TripleDES发出弃用警告，与测试无关
+    config.addinivalue_line('filterwarnings', 'ignore:::paramiko')
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+测试辅助：在后台线程运行ProxyManager，连接模拟Telnet设备，并用paramiko客户端登录
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+
+import yaml
+import paramiko
+
+from benchmarks.device import FakeTelnetDevice
+from proxy_server import ProxyManager
+
+# wait_listening的探测连接会让paramiko记录握手失败，与代理运行时一样屏蔽
+logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_listening(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"端口 {port} 未开始监听")
+
+
+class EchoDevice(FakeTelnetDevice):
+    """在后台线程运行的回显设备"""
+
+    def __init__(self):
+        super().__init__('echo')
+        threading.Thread(target=self.serve, daemon=True).start()
+
+
+class ProxyFixture:
+    """按给定配置在临时目录中启动代理"""
+
+    def __init__(self, tmp: str, config: dict):
+        config.setdefault('ssh', {}).update(
+            {'host': '127.0.0.1', 'username': 'u', 'password': 'p',
+             'host_key': os.path.join(tmp, 'ssh_host_key')}
+        )
+        config.setdefault('reload', {'enabled': False})
+        self.path = os.path.join(tmp, 'config.yaml')
+        with open(self.path, 'w') as f:
+            yaml.safe_dump(config, f)
+        self.manager = ProxyManager(self.path)
+        threading.Thread(target=self.manager.start, daemon=True).start()
+
+    def stop(self):
+        self.manager.stop()
+
+
+def connect(port: int, username: str = 'u', password: str = 'p', timeout: float = 10.0):
+    """登录并打开shell，返回 (client, channel)"""
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    client.connect('127.0.0.1', port, username, password, look_for_keys=False,
+                   allow_agent=False, timeout=timeout, banner_timeout=timeout, auth_timeout=timeout)
+    channel = client.invoke_shell()
+    channel.settimeout(timeout)
+    return client, channel
+
+
+def read_until(channel, marker: bytes, timeout: float = 5.0) -> bytes:
+    """读取到marker出现为止，超时返回已读到的数据"""
+    data = b''
+    deadline = time.monotonic() + timeout
+    while marker not in data and time.monotonic() < deadline:
+        channel.settimeout(max(deadline - time.monotonic(), 0.01))
+        try:
+            chunk = channel.recv(4096)
+        except socket.timeout:
+            break
+        if not chunk:
+            break
+        data += chunk
+    return data
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""accept循环：文件描述符耗尽时暂停监听，不空转也不刷日志，恢复后继续接受连接"""
+
+import errno
+import socket
+import threading
+import time
+import unittest
+
+from acceptor import Acceptor
+from reactor import Reactor
+
+
+class ExhaustedSocket(socket.socket):
+    """accept在failing期间像进程文件描述符耗尽一样失败"""
+
+    failing = True
+    attempts = 0
+
+    def accept(self):
+        type(self).attempts += 1
+        if self.failing:
+            raise OSError(errno.EMFILE, 'Too many open files')
+        return super().accept()
+
+
+class FakeServer:
+
+    def __init__(self):
+        self.running = True
+        self.sock = ExhaustedSocket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(8)
+        self.port = self.sock.getsockname()[1]
+        self.accepted = threading.Event()
+
+    def accept_connection(self, client, addr):
+        client.close()
+        self.accepted.set()
+
+
+class AcceptBackoffTest(unittest.TestCase):
+
+    engine = Acceptor
+
+    def setUp(self):
+        ExhaustedSocket.failing = True
+        ExhaustedSocket.attempts = 0
+        self.acceptor = self.engine()
+        self.acceptor.ACCEPT_BACKOFF = 0.2
+        self.server = FakeServer()
+        self.acceptor.add_listener(self.server)
+        thread = threading.Thread(target=self.acceptor.run, daemon=True)
+        thread.start()
+        self.addCleanup(self.acceptor.stop)
+        self.client = socket.create_connection(('127.0.0.1', self.server.port))
+        self.addCleanup(self.client.close)
+
+    def test_pauses_instead_of_spinning(self):
+        with self.assertLogs('acceptor', 'ERROR') as logs:
+            time.sleep(1.0)
+        # 每0.2秒重试一次，而不是每次select返回都重试
+        self.assertLessEqual(ExhaustedSocket.attempts, 8)
+        self.assertLessEqual(len(logs.records), 8)
+        self.assertFalse(self.server.accepted.is_set())
+
+    def test_resumes_after_backoff(self):
+        time.sleep(0.1)
+        ExhaustedSocket.failing = False
+        self.assertTrue(self.server.accepted.wait(2))
+
+
+class ReactorBackoffTest(AcceptBackoffTest):
+
+    engine = Reactor
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""异步日志：队列已满时停止不会挂起"""
+
+import logging
+import threading
+import time
+import unittest
+
+from async_logging import DroppingQueueHandler
+
+
+class BlockingHandler(logging.Handler):
+    """在unblock之前阻塞写入，模拟阻塞的磁盘或stdout"""
+
+    def __init__(self):
+        super().__init__()
+        self.blocked = threading.Event()
+        self.unblock = threading.Event()
+        self.messages = []
+
+    def emit(self, record):
+        self.blocked.set()
+        self.unblock.wait()
+        self.messages.append(record.getMessage())
+
+
+class StopWithFullQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.target = BlockingHandler()
+        self.handler = DroppingQueueHandler(queue_size=5, block_timeout=0)
+        self.handler.start([self.target])
+        self.listener = self.handler.listener
+        self.listener.sentinel_timeout = 0.2
+        self.listener.join_timeout = 1.0
+        self.addCleanup(self.target.unblock.set)
+        # 后台线程取走第一条后阻塞在handler中，其余日志填满队列
+        self.log('record 0')
+        self.assertTrue(self.target.blocked.wait(5))
+        for i in range(1, 10):
+            self.log(f'record {i}')
+        self.assertTrue(self.handler.queue.full())
+
+    def log(self, message: str):
+        self.handler.emit(logging.makeLogRecord({'msg': message, 'levelno': logging.INFO}))
+
+    def test_stop_drops_oldest_record_for_sentinel(self):
+        threading.Timer(0.5, self.target.unblock.set).start()
+        started = time.monotonic()
+        self.handler.close()
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(self.listener.dropped_on_stop, 1)
+        self.assertIn('record 0', self.target.messages)
+        self.assertNotIn('record 1', self.target.messages)
+        self.assertIn('record 5', self.target.messages)
+        self.assertIn('丢弃了 1 条日志', self.target.messages[-1])
+
+    def test_stop_gives_up_when_handler_stays_blocked(self):
+        started = time.monotonic()
+        self.handler.close()
+        self.assertLess(time.monotonic() - started, 3)
+        self.assertIsNone(self.handler.listener)
+
+
+if __name__ == '__main__':
+    unittest.main()
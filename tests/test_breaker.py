@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""后端熔断：打开期间不主动连接后端，退避间隔过后由下一个真实会话试探"""
+
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from support import ProxyFixture, connect, free_port, read_until, wait_listening
+
+
+class HalfOpenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker('dev', failure_threshold=2, reset_timeout=0.2, max_reset_timeout=1.0)
+        self.breaker.record_failure('refused')
+        self.breaker.record_failure('refused')
+
+    def test_rejects_until_retry(self):
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_one_trial_after_retry(self):
+        time.sleep(0.25)
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        # 试探进行中，其他会话仍被拒绝
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_trial_doubles_delay(self):
+        time.sleep(0.25)
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure('refused')
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertAlmostEqual(self.breaker.retry_at - time.time(), 0.4, delta=0.1)
+        self.assertEqual(self.breaker.trips, 1)
+
+
+class CountingDevice:
+    """单会话设备：记录收到的连接数，连接后回显"""
+
+    def __init__(self, port: int):
+        self.sock = socket.create_server(('127.0.0.1', port))
+        self.connections = 0
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._echo, args=(conn,), daemon=True).start()
+
+    @staticmethod
+    def _echo(conn):
+        with conn:
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    return
+                conn.sendall(data)
+
+
+class NoSyntheticProbeTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp, True)
+        self.device_port = free_port()
+        self.port = free_port()
+        self.proxy = ProxyFixture(tmp, {
+            'mappings': {self.port: {'host': '127.0.0.1', 'port': self.device_port, 'enabled': True}},
+            'breaker': {'failure_threshold': 1, 'reset_timeout': 0.5},
+        })
+        self.addCleanup(self.proxy.stop)
+        wait_listening(self.port)
+
+    def test_device_only_sees_real_sessions(self):
+        client, channel = connect(self.port)
+        self.assertIn('无法连接'.encode(), read_until(channel, b'\n'))
+        client.close()
+        # 提示先于熔断器记录失败发出
+        breaker = self.proxy.manager.servers[self.port].breaker
+        deadline = time.monotonic() + 2
+        while breaker.state != OPEN and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(breaker.state, OPEN)
+
+        device = CountingDevice(self.device_port)
+        self.addCleanup(device.sock.close)
+        time.sleep(1.5)
+        # 熔断打开期间代理没有自己去连接设备
+        self.assertEqual(device.connections, 0)
+
+        client, channel = connect(self.port)
+        self.addCleanup(client.close)
+        channel.send(b'hello')
+        self.assertIn(b'hello', read_until(channel, b'hello'))
+        self.assertEqual(device.connections, 1)
+        self.assertEqual(breaker.state, CLOSED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""后端探测：默认关闭；有会话连接着的后端不被探测结果判为不可达"""
+
+import socket
+import unittest
+
+from prober import BackendProber
+from resolver import BackendResolver
+
+
+def closed_port() -> tuple:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return ('127.0.0.1', sock.getsockname()[1])
+
+
+class ProberTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = closed_port()
+        self.prober = BackendProber(BackendResolver(), timeout=0.5, failure_threshold=1)
+        self.prober.track([self.backend])
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(BackendProber.from_config({}, BackendResolver()))
+        self.assertIsNotNone(BackendProber.from_config({'enabled': True}, BackendResolver()))
+
+    def test_live_session_overrides_down(self):
+        self.prober._probe(self.backend)
+        self.assertIsNotNone(self.prober.message('dev', [self.backend]))
+        self.prober.session_opened(self.backend)
+        self.assertTrue(self.prober.available([self.backend]))
+        self.assertIsNone(self.prober.message('dev', [self.backend]))
+        self.prober.session_closed(self.backend)
+        self.assertFalse(self.prober.available([self.backend]))
+
+    def test_failed_probe_during_session_is_ignored(self):
+        self.prober.session_opened(self.backend)
+        self.prober._probe(self.backend)
+        state = self.prober.stats()['backends']['%s:%d' % self.backend]
+        self.assertIsNone(state['up'])
+        self.assertEqual(state['failures'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
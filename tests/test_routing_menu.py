@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""按用户名路由：设备菜单不占用握手线程，菜单有总时长限制"""
+
+import shutil
+import tempfile
+import time
+import unittest
+
+from router import DeviceIndex, Device, choose_device
+from support import EchoDevice, ProxyFixture, connect, free_port, read_until, wait_listening
+
+
+class IdleMenuTest(unittest.TestCase):
+    """reactor引擎只有一个握手线程时，停在菜单中的客户端不影响其他用户登录"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.device = EchoDevice()
+        self.port = free_port()
+        self.proxy = ProxyFixture(self.tmp, {
+            'engine': {'mode': 'reactor', 'handshake_workers': 1},
+            'mappings': {},
+            'routing': {'enabled': True, 'port': self.port, 'menu_timeout': 30},
+            'devices': {'dev1': {'host': '127.0.0.1', 'port': self.device.port}},
+        })
+        wait_listening(self.port)
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.proxy.stop()
+        self.device.stop()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_idle_menu_does_not_block_login(self):
+        idle, menu = connect(self.port, 'u')
+        self.clients.append(idle)
+        self.assertIn("请输入编号或设备名".encode(), read_until(menu, "请输入编号或设备名".encode()))
+
+        started = time.monotonic()
+        client, channel = connect(self.port, 'u+dev1', timeout=5)
+        self.clients.append(client)
+        channel.send(b'ping')
+        self.assertIn(b'ping', read_until(channel, b'ping'))
+        self.assertLess(time.monotonic() - started, 5)
+
+        # 停在菜单中的客户端仍可继续选择设备
+        menu.send(b'dev1\r')
+        menu.send(b'pong')
+        self.assertIn(b'pong', read_until(menu, b'pong'))
+
+
+class FakeChannel:
+    """每隔interval秒输入一个字符、始终不回车的客户端"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.timeout = None
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def recv(self, size):
+        if self.timeout is not None and self.timeout < self.interval:
+            time.sleep(self.timeout)
+            raise TimeoutError
+        time.sleep(self.interval)
+        return b'x'
+
+    def sendall(self, data):
+        pass
+
+
+class MenuDeadlineTest(unittest.TestCase):
+
+    def test_menu_timeout_is_total(self):
+        index = DeviceIndex()
+        index.add(Device('dev1', {'host': '127.0.0.1', 'port': 23}))
+        started = time.monotonic()
+        self.assertIsNone(choose_device(FakeChannel(0.05), index, None, lambda device: True, timeout=0.5))
+        self.assertLess(time.monotonic() - started, 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""共享会话：只读查看者不能改变设备终端的窗口大小"""
+
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+import unittest
+
+from support import ProxyFixture, connect, free_port, read_until, wait_listening
+
+IAC, SB, SE, WILL, WONT, DO, DONT, NAWS = 255, 250, 240, 251, 252, 253, 254, 31
+
+
+class NawsDevice:
+    """请求NAWS的Telnet设备，记录收到的窗口大小并回显其余数据"""
+
+    def __init__(self):
+        self.sock = socket.create_server(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.sizes = []
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        conn, _ = self.sock.accept()
+        conn.sendall(bytes((IAC, DO, NAWS)))
+        buffer = b''
+        while True:
+            try:
+                chunk = conn.recv(4096)
+            except OSError:
+                break
+            if not chunk:
+                break
+            buffer += chunk
+            plain, buffer = self._parse(buffer)
+            if plain:
+                conn.sendall(plain)
+        conn.close()
+
+    def _parse(self, buffer: bytes):
+        """去掉Telnet命令并记录NAWS子协商，返回 (数据, 未处理完的部分)"""
+        plain = bytearray()
+        i = 0
+        while i < len(buffer):
+            if buffer[i] != IAC:
+                plain.append(buffer[i])
+                i += 1
+                continue
+            if i + 2 >= len(buffer):
+                break
+            command = buffer[i + 1]
+            if command == SB:
+                end = buffer.find(bytes((IAC, SE)), i)
+                if end < 0:
+                    break
+                if buffer[i + 2] == NAWS:
+                    self.sizes.append(struct.unpack('>HH', buffer[i + 3:i + 7]))
+                i = end + 2
+            elif command == IAC:
+                plain.append(IAC)
+                i += 2
+            elif command in (WILL, WONT, DO, DONT):
+                i += 3
+            else:
+                i += 2
+        return bytes(plain), buffer[i:]
+
+    def wait_size(self, size, timeout: float = 5.0) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if size in self.sizes:
+                return True
+            time.sleep(0.05)
+        return False
+
+    def close(self):
+        self.sock.close()
+
+
+class ReadOnlyResizeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.device = NawsDevice()
+        self.port = free_port()
+        self.proxy = ProxyFixture(self.tmp, {'mappings': {self.port: {
+            'host': '127.0.0.1', 'port': self.device.port, 'enabled': True,
+            'shared': True, 'shared_access': 'read-only',
+        }}})
+        wait_listening(self.port)
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.proxy.stop()
+        self.device.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_read_only_viewer_resize_is_not_forwarded(self):
+        writer, writer_channel = connect(self.port)
+        self.clients.append(writer)
+        writer_channel.send(b'hello')
+        self.assertIn(b'hello', read_until(writer_channel, b'hello'))
+
+        viewer, viewer_channel = connect(self.port)
+        self.clients.append(viewer)
+        self.assertIn("只读".encode(), read_until(viewer_channel, "只读".encode()))
+        viewer_channel.resize_pty(200, 60)
+        # 读写用户的窗口变化照常转发，作为对照，也保证只读查看者的请求已被处理
+        time.sleep(0.5)
+        writer_channel.resize_pty(100, 30)
+        self.assertTrue(self.device.wait_size((100, 30)))
+        self.assertNotIn((200, 60), self.device.sizes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Telnet协议解析：超长子协商跨数据块丢弃，之后的普通输出照常交给用户"""
+
+import unittest
+
+from telnet_protocol import IAC, IAC_SE, MAX_PENDING, SB, TTYPE, TTYPE_SEND, TelnetProtocol
+
+
+class OversizedSubnegotiationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.protocol = TelnetProtocol()
+
+    def feed_all(self, chunks):
+        out = b''
+        replies = b''
+        for chunk in chunks:
+            data, reply = self.protocol.feed(chunk)
+            out += bytes(data)
+            replies += reply
+        return out, replies
+
+    def test_split_across_chunks(self):
+        payload = b'x' * (MAX_PENDING * 3)
+        chunks = [
+            b'before' + bytes([IAC, SB, 99]) + payload[:MAX_PENDING * 2],
+            payload[MAX_PENDING * 2:],
+            IAC_SE + b'after',
+            b' more',
+        ]
+        out, _ = self.feed_all(chunks)
+        self.assertEqual(out, b'before' + b'after more')
+
+    def test_terminator_split_between_chunks(self):
+        chunks = [
+            bytes([IAC, SB, 99]) + b'x' * (MAX_PENDING + 1) + bytes([IAC]),
+            bytes([IAC_SE[1]]) + b'after',
+        ]
+        out, _ = self.feed_all(chunks)
+        self.assertEqual(out, b'after')
+
+    def test_pending_grows_past_limit(self):
+        # 第一块未超限被缓存，第二块超限后才开始丢弃
+        chunks = [
+            b'a' + bytes([IAC, SB, 99]) + b'x' * 100,
+            b'x' * MAX_PENDING,
+            b'x' * 10 + IAC_SE + b'b',
+        ]
+        out, _ = self.feed_all(chunks)
+        self.assertEqual(out, b'ab')
+
+    def test_negotiation_resumes_after_discard(self):
+        chunks = [
+            bytes([IAC, SB, 99]) + b'x' * (MAX_PENDING + 1),
+            IAC_SE + bytes([IAC, SB, TTYPE, TTYPE_SEND]) + IAC_SE + b'ok',
+        ]
+        out, replies = self.feed_all(chunks)
+        self.assertEqual(out, b'ok')
+        self.assertIn(b'VT100', replies)
+
+
+if __name__ == '__main__':
+    unittest.main()